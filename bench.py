@@ -0,0 +1,254 @@
+# bench.py
+# =====================================================
+# Micro-benchmark ETL absensi (offline, data sintetis)
+# =====================================================
+#
+#   python bench.py classify
+#   python bench.py classify --employees 2000 --taps 5,40,120
+#   python bench.py decode --from 2026-10-05 --drivers pymysql,mysqlclient
+#   python bench.py drivers          # cek driver terpasang (tanpa DB)
+
+import argparse
+import random
+import time
+from datetime import timedelta
+
+from utils import log, log_warn, log_error, parse_date
+from transform import classify_taps, classify_taps_sorted
+import cache
+import db
+
+# =====================================================
+# CLASSIFY TAPS
+# =====================================================
+
+def _synthetic_days(employees, taps_per_day, seed=42):
+    """
+    List (rows, mins) per pegawai, tap acak 05:00–21:00
+    (mesin yang mencatat puluhan tap per hari)
+    """
+    rnd = random.Random(seed)
+    days = []
+    for _ in range(employees):
+        times = sorted(
+            timedelta(seconds=rnd.randint(5 * 3600, 21 * 3600))
+            for _ in range(taps_per_day)
+        )
+        rows = [{"time": t, "device_id": rnd.randint(0, 50)} for t in times]
+        mins = [cache.tap_minute(r) for r in rows]
+        days.append((rows, mins))
+    return days
+
+def _best_of(repeat, fn):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_classify(employees, taps_list, repeat):
+    jam_masuk = timedelta(hours=7, minutes=30)
+    jam_pulang = timedelta(hours=16)
+
+    for taps in taps_list:
+        days = _synthetic_days(employees, taps)
+
+        # hasil harus identik sebelum waktu dibandingkan
+        for rows, mins in days:
+            if classify_taps(rows, jam_masuk, jam_pulang) != \
+                    classify_taps_sorted(rows, mins, jam_masuk, jam_pulang):
+                log_error(f"[BENCH] classify mismatch (taps={taps})")
+                return False
+
+        t_ref = _best_of(repeat, lambda: [
+            classify_taps(rows, jam_masuk, jam_pulang) for rows, _ in days
+        ])
+        t_fast = _best_of(repeat, lambda: [
+            classify_taps_sorted(rows, mins, jam_masuk, jam_pulang) for rows, mins in days
+        ])
+        # biaya index menit saat extract (dibayar sekali per tap)
+        t_index = _best_of(repeat, lambda: [
+            [cache.tap_minute(r) for r in rows] for rows, _ in days
+        ])
+
+        log(
+            f"[BENCH] classify taps/day={taps:<4} employees={employees} | "
+            f"classify_taps={t_ref * 1000:.2f}ms "
+            f"classify_taps_sorted={t_fast * 1000:.2f}ms "
+            f"(x{t_ref / t_fast:.1f}) "
+            f"minute_index={t_index * 1000:.2f}ms"
+        )
+
+    return True
+
+# =====================================================
+# DRIVER SMOKE CHECK
+# =====================================================
+# Driver yang tidak terpasang dilewati. Offline: cursor penghitung,
+# error class gabungan db.py, API koneksi. Dengan koneksi (decode):
+# error server tertangkap db.ProgrammingError, executemany terhitung.
+
+ER_NO_SUCH_TABLE = 1146
+
+def check_driver(name):
+    """Cek offline satu driver di db.DRIVERS. Return False jika gagal"""
+    _, dict_cursor, tuple_cursor, module = db.DRIVERS[name]
+    if module is None:
+        log_warn(f"[BENCH] driver {name} not installed, skipped")
+        return True
+
+    problems = []
+    for counting, base in ((dict_cursor, module.cursors.DictCursor), (tuple_cursor, module.cursors.Cursor)):
+        if not issubclass(counting, base):
+            problems.append(f"{counting.__name__} is not a {base.__name__}")
+        if not hasattr(base, "_query"):
+            problems.append(f"{base.__name__} has no _query (query count hook)")
+
+    for attr, unified in (
+        ("MySQLError", db.MySQLError),
+        ("OperationalError", db.OperationalError),
+        ("ProgrammingError", db.ProgrammingError),
+    ):
+        try:
+            raise getattr(module, attr)(ER_NO_SUCH_TABLE, "smoke")
+        except unified as e:
+            if e.args[0] != ER_NO_SUCH_TABLE:
+                problems.append(f"{attr} args={e.args}")
+        except Exception:
+            problems.append(f"{name} {attr} not caught by db.{attr}")
+
+    if name == "mysqlclient":
+        for method in ("begin", "ping", "commit", "rollback", "cursor"):
+            if not hasattr(db.MysqlclientConnection, method):
+                problems.append(f"MysqlclientConnection.{method} missing")
+
+    for p in problems:
+        log_error(f"[BENCH] driver {name}: {p}")
+    if not problems:
+        log(f"[BENCH] driver {name} ok ({getattr(module, '__version__', '?')})")
+    return not problems
+
+def smoke_driver(conn, name):
+    """Cek driver dengan koneksi nyata (tanpa menulis tabel permanen)"""
+    with conn.cursor() as cur:
+        try:
+            cur.execute("SELECT 1 FROM absensi_bench_no_such_table")
+            raise AssertionError(f"{name}: query on missing table did not fail")
+        except db.ProgrammingError as e:
+            if e.args[0] != ER_NO_SUCH_TABLE:
+                raise
+
+        cur.execute("CREATE TEMPORARY TABLE absensi_bench_smoke (id INT)")
+        before = db.query_count()
+        cur.executemany("INSERT INTO absensi_bench_smoke (id) VALUES (%s)", [(i,) for i in range(100)])
+        counted = db.query_count() - before
+        cur.execute("DROP TEMPORARY TABLE absensi_bench_smoke")
+    conn.rollback()
+
+    if counted < 1:
+        raise AssertionError(f"{name}: executemany not counted by db.query_count")
+    log(f"[BENCH] driver {name} smoke ok (executemany counted {counted} statement(s))")
+
+# =====================================================
+# DECODE (DRIVER / CURSOR, BUTUH ATT DB)
+# =====================================================
+# Query extract attendance satu hari, dibandingkan per driver dan
+# mode cursor: fetch (network + decode driver) dan fetch + ingest
+# (row dict, encode id, masuk cache) seperti extract_attendance.
+
+def bench_decode(date, drivers, cursors, repeat, limit=None):
+    # konfigurasi DB dari .env yang sama dengan main.py (replica jika ada)
+    from main import ATT_DB, ATT_REPLICA_DB
+    from extract import _attendance_query, _ingest_attendance
+
+    sql, params = _attendance_query(date)
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+
+    for driver in drivers:
+        if driver not in db.DRIVERS or db.DRIVERS[driver][3] is None:
+            log_warn(f"[BENCH] driver {driver} not available, skipped")
+            continue
+
+        if not check_driver(driver):
+            return False
+
+        conn = db.connect(ATT_REPLICA_DB or ATT_DB, driver=driver)
+        try:
+            smoke_driver(conn, driver)
+            for mode in cursors:
+                def fetch():
+                    with db.row_cursor(conn, mode) as cur:
+                        cur.execute(sql, params)
+                        return cur.fetchall()
+
+                def fetch_ingest():
+                    etl = cache.EtlContext()
+                    _ingest_attendance(etl, fetch(), etl.add_attendance, None)
+
+                # pemanasan: buffer pool / koneksi
+                n = len(fetch())
+                t_fetch = _best_of(repeat, fetch)
+                t_total = _best_of(repeat, fetch_ingest)
+
+                log(
+                    f"[BENCH] decode driver={driver:<11} cursor={mode:<5} rows={n} | "
+                    f"fetch={t_fetch * 1000:.0f}ms ({n / t_fetch:.0f} rows/s) "
+                    f"fetch+ingest={t_total * 1000:.0f}ms ({n / t_total:.0f} rows/s)"
+                )
+        finally:
+            conn.close()
+
+    return True
+
+# =====================================================
+# CLI
+# =====================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Micro-benchmark ETL absensi")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("classify", help="classify_taps vs classify_taps_sorted")
+    p.add_argument("--employees", type=int, default=5000)
+    p.add_argument("--taps", default="2,5,20,60,200",
+                   help="daftar jumlah tap per pegawai per hari (csv)")
+    p.add_argument("--repeat", type=int, default=5)
+
+    sub.add_parser("drivers", help="cek driver DB terpasang (tanpa DB)")
+
+    p = sub.add_parser("decode", help="decode attendance per driver / cursor (butuh DB)")
+    p.add_argument("--from", dest="date_from", required=True)
+    p.add_argument("--drivers", default=",".join(db.DRIVERS))
+    p.add_argument("--cursors", default=",".join(db.CURSOR_MODES))
+    p.add_argument("--limit", type=int, help="batasi jumlah row query")
+    p.add_argument("--repeat", type=int, default=3)
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    if args.bench == "classify":
+        ok = bench_classify(
+            args.employees,
+            [int(x) for x in args.taps.split(",") if x.strip()],
+            args.repeat,
+        )
+        raise SystemExit(0 if ok else 1)
+
+    if args.bench == "drivers":
+        ok = all([check_driver(name) for name in db.DRIVERS])
+        raise SystemExit(0 if ok else 1)
+
+    if args.bench == "decode":
+        ok = bench_decode(
+            parse_date(args.date_from),
+            [x.strip() for x in args.drivers.split(",") if x.strip()],
+            [x.strip() for x in args.cursors.split(",") if x.strip()],
+            args.repeat,
+            args.limit,
+        )
+        raise SystemExit(0 if ok else 1)
@@ -2,287 +2,553 @@
 # =====================================================
 # In-memory cache for ETL absensi
 # =====================================================
-
+#
+# Semua index dimiliki satu EtlContext (bukan global modul):
+#
+#   etl = EtlContext()
+#   extract_all(etl, main_db, aux_db, att_db, date, ...)
+#   rows = transform_all(etl, date, ...)
+#
+# Context bisa dipakai ulang antar tanggal (etl.reset()), disimpan
+# (daemon, cache hangat) atau dibuang. Dua context tidak berbagi
+# state apa pun → aman dipakai paralel di thread berbeda
+# (satu context tetap hanya untuk satu thread).
+
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
 from utils import (
-    normalize_nik,
-    normalize_csv,
+    log,
+    clock_minutes,
+    clock_seconds,
     hari_int,
     hari_str,
 )
-from utils import (
-    normalize_id,
-)
+from spill import AttendanceSpill, SizeSampler
 
 # =====================================================
-# ATTENDANCE CACHE
+# HELPERS (TANPA STATE)
 # =====================================================
-# Key: (nik, date)
-# Value: [row,row,row]   # list semua tap
-
-ATT_MAP = {}
-
-def add_attendance(nik, date, row):
-    nik = normalize_nik(nik)
-    key = (nik, date)
 
-    if key not in ATT_MAP:
-        ATT_MAP[key] = [row]
-    else:
-        ATT_MAP[key].append(row)
-
-def get_attendance(nik, date):
-    return ATT_MAP.get((normalize_nik(nik), date), [])
-
-# =====================================================
-# PEGAWAI / HISTORY CACHE
-# =====================================================
-# Key: nik
-# Value: dict history aktif
+def tap_minute(row):
+    """Menit tap untuk index ATT_MIN (-1 jika tanpa jam)"""
+    m = clock_minutes(row["time"])
+    return -1 if m is None else m
 
-PEGAWAI_CTX = {}
+def _id_key(val):
+    return val.strip() if isinstance(val, str) else str(val).strip()
 
-def add_pegawai_ctx(row):
-    nik = normalize_nik(row["nik"])
-
-    raw_unit = row.get("id_unit")
-    raw_sub = row.get("id_sub_unit")
-
-    unit_id = str(raw_unit).strip() if raw_unit is not None else None
-    sub_unit_id = str(raw_sub).strip() if raw_sub is not None else None
-
-    if nik not in PEGAWAI_CTX:
-        PEGAWAI_CTX[nik] = {
-            "unit_id": unit_id,
-            "sub_unit_id": sub_unit_id,
-            "lokasi_kerja": normalize_csv(row.get("lokasi_kerja")),
-    }
+def is_device_valid(device_id, allowed):
+    """device_id: code, allowed: frozenset code dari build_lokasi_kerja"""
+    if device_id is None or not allowed:
+        return False
 
-def get_pegawai_ctx(nik):
-    return PEGAWAI_CTX.get(normalize_nik(nik))
+    return device_id in allowed
 
 # =====================================================
-# DEVICE CACHE
+# ETL CONTEXT
 # =====================================================
-# DEVICE_BY_UNIT[unit_id][device_id] = desc
-
-DEVICE_BY_UNIT = defaultdict(dict)
 
-def _norm_device_id(val):
+class EtlContext:
     """
-    Normalize device_id as pure string.
-    Never cast to int.
+    Cache satu run ETL.
+
+    id_code / id_name       : ID dictionary (interning)
+    att_map / att_min       : tap attendance + index menit
+    pegawai_ctx             : history pegawai aktif
+    device_by_unit          : device per unit (+ lokasi_memo)
+    absent_map / tap_map    : daily note & override jam
+    jadwal_pegawai / jadwal_sub_unit / jadwal_unit / jadwal_dinas
     """
-    if val is None:
-        return None
-    return str(val).strip()
-
-# Hapus satu fungsi add_device, perbaiki yang tersisa
-def add_device(row):
-    """Load device into DEVICE_BY_UNIT[unit_id][device_id]"""
-
-    raw_unit = row.get("unit_id")
-    if raw_unit is None:
-        return
 
-    device_id = _norm_device_id(row.get("device_id"))
-    desc = row.get("desc")
-
-    if not device_id:
-        return
-
-    # split multi-unit
-    unit_ids = [
-        u.strip()
-        for u in str(raw_unit).split(",")
-        if u.strip()
-    ]
-
-    for unit_id in unit_ids:
-        DEVICE_BY_UNIT[unit_id][device_id] = {
-            "id": row["id"],
-            "desc": desc
-        }
-
-
-def get_device_desc(unit_id, device_id):
-    device_id = _norm_device_id(device_id)
-    if not unit_id or not device_id:
-        return None
-    d = DEVICE_BY_UNIT.get(unit_id, {}).get(device_id)
-    return d["desc"] if d else None
-
-
-def build_lokasi_kerja(unit_id, hist_lokasi):
-    lokasi = set()
-
-    if unit_id:
-        for uid in str(unit_id).split(","):
-            uid = uid.strip()
-            if uid in DEVICE_BY_UNIT:
-                lokasi.update(
-                    DEVICE_BY_UNIT[uid].keys()
-                )
-
-    if hist_lokasi:
-        lokasi.update(
-            _norm_device_id(x)
-            for x in hist_lokasi.split(",")
-            if x.strip()
-        )
-
-    return ",".join(sorted(lokasi)) if lokasi else None
-
-def is_device_valid(device_id, lokasi_kerja):
-    device_id = _norm_device_id(device_id)
-
-    if not device_id or not lokasi_kerja:
+    # map per tanggal (dikosongkan oleh reset, di-snapshot golden)
+    MAPS = (
+        "att_map",
+        "pegawai_ctx",
+        "device_by_unit",
+        "absent_map",
+        "tap_map",
+        "jadwal_pegawai",
+        "jadwal_sub_unit",
+        "jadwal_unit",
+        "jadwal_dinas",
+    )
+
+    def __init__(self, tap_dedupe_seconds=None, budget=None):
+        # =================================================
+        # ID DICTIONARY (INTERNING)
+        # =================================================
+        # NIK, unit_id, sub_unit_id dan device_id disimpan sebagai kode int.
+        # id_code[id_str] = code
+        # id_name[code]   = id_str
+        #
+        # Kode hanya di-decode kembali saat membangun row output.
+        # Dictionary tidak di-reset per tanggal (id stabil antar hari).
+        self.id_code = {}
+        self.id_name = []
+
+        # =================================================
+        # ATTENDANCE
+        # =================================================
+        # Key: (nik_code, date)
+        # att_map[key] = [row,row,row]   # list semua tap, urut jam
+        # att_min[key] = [m, m, m]       # menit tap (sejajar att_map, untuk bisect)
+        #
+        # Tap tanpa jam disimpan dengan menit -1 (tidak pernah masuk window pulang).
+        #
+        # tap_dedupe_seconds (None = nonaktif, default): tap NIK + device sama
+        # dibuang saat masuk cache jika
+        # - identik (jam + filename sama: file device di-upload ulang), atau
+        # - selisih jam <= tap_dedupe_seconds (burst), boleh lintas menit.
+        # Tap pertama (paling awal) yang dipertahankan → filename / detik
+        # time_out dan, jika burst melewati batas menit, late/early & window
+        # pulang bisa berbeda dari run tanpa dedupe (opt-in).
+        self.att_map = {}
+        self.att_min = {}
+        self.tap_dedupe_seconds = tap_dedupe_seconds
+
+        # budget memori (spill.MemoryBudget, None = tanpa batas):
+        # att_bytes = perkiraan byte tap di att_map; melewati budget →
+        # key lengkap dipindah ke att_spill (file partisi per NIK)
+        self.budget = budget
+        self.att_bytes = 0
+        self.att_spill = None
+        self._att_size = SizeSampler()
+        self._att_replay = False
+
+        # pegawai_ctx[nik_code] = dict history aktif (semua id dalam bentuk code)
+        self.pegawai_ctx = {}
+
+        # device_by_unit[unit_code][device_code] = {"id", "desc"}
+        self.device_by_unit = defaultdict(dict)
+        # lokasi_memo[(unit_codes, hist_codes)] = (frozenset(device_code), csv)
+        self.lokasi_memo = {}
+
+        # absent_map[(nik_code, date)] = row
+        self.absent_map = {}
+        # tap_map[(nik_code, date, "in"|"out")] = row
+        self.tap_map = {}
+
+        # jadwal_pegawai[(nik_code, date)]
+        # jadwal_sub_unit[(sub_unit_code, hari_int|hari_str)]
+        # jadwal_unit[(unit_code, hari_int|hari_str)]
+        # jadwal_dinas[hari_int|hari_str]
+        self.jadwal_pegawai = {}
+        self.jadwal_sub_unit = {}
+        self.jadwal_unit = {}
+        self.jadwal_dinas = {}
+
+    # =====================================================
+    # ID DICTIONARY
+    # =====================================================
+
+    def encode_id(self, val):
+        """
+        Normalize + intern id → int code.
+        None / kosong → None.
+        """
+        if val is None:
+            return None
+        key = _id_key(val)
+        if not key:
+            return None
+        code = self.id_code.get(key)
+        if code is None:
+            code = len(self.id_name)
+            self.id_code[key] = code
+            self.id_name.append(key)
+        return code
+
+    def find_id(self, val):
+        """Lookup code tanpa menambah dictionary (None jika belum dikenal)"""
+        if val is None:
+            return None
+        return self.id_code.get(_id_key(val))
+
+    def decode_id(self, code):
+        """int code → id string (untuk output)"""
+        if code is None:
+            return None
+        return self.id_name[code]
+
+    # =====================================================
+    # ATTENDANCE
+    # =====================================================
+
+    def _is_duplicate_tap(self, rows, mins, row, m):
+        """
+        Cari tap device sama: identik (jam + filename) atau dalam
+        toleransi detik. Rentang menit [sec - tol, sec + tol] lewat bisect
+        """
+        tol = self.tap_dedupe_seconds
+        sec = clock_seconds(row["time"])
+
+        if sec is None:
+            lo = bisect_left(mins, m)
+            hi = bisect_right(mins, m)
+        else:
+            lo = bisect_left(mins, (sec - tol) // 60)
+            hi = bisect_right(mins, (sec + tol) // 60)
+        device_id = row["device_id"]
+
+        for i in range(lo, hi):
+            r = rows[i]
+            if r["device_id"] != device_id:
+                continue
+            if r["time"] == row["time"] and r.get("filename") == row.get("filename"):
+                return True
+            if sec is None:
+                continue
+            s = clock_seconds(r["time"])
+            if s is not None and abs(s - sec) <= tol:
+                return True
         return False
 
-    allowed = {
-        _norm_device_id(x)
-        for x in lokasi_kerja.split(",")
-        if x.strip()
-    }
-
-    return device_id in allowed
-
-# =====================================================
-# ABSENT / DAILY NOTE CACHE
-# =====================================================
-# ABSENT_MAP[(nik, date)] = row
-
-ABSENT_MAP = {}
-
-def add_absent(row):
-    key = (normalize_nik(row["nik"]), row["date"])
-    ABSENT_MAP[key] = row
-
-def get_absent(nik, date):
-    return ABSENT_MAP.get((normalize_nik(nik), date))
-
-# =====================================================
-# TAPPING NOTE CACHE
-# =====================================================
-# TAP_MAP[(nik, date, "in"|"out")] = row
-
-TAP_MAP = {}
-
-def add_tap(row):
-    key = (normalize_nik(row["nik"]), row["date"], row["hour"])
-    TAP_MAP[key] = row
-
-def get_tap(nik, date, hour):
-    return TAP_MAP.get((normalize_nik(nik), date, hour))
-
-# =====================================================
-# JADWAL CACHE
-# =====================================================
-
-# Jadwal pegawai: (nik, date)
-JADWAL_PEGAWAI = {}
-
-# Jadwal sub unit: (sub_unit_id, hari_int|hari_str)
-JADWAL_SUB_UNIT = {}
-
-# Jadwal unit: (unit_id, hari_int|hari_str)
-JADWAL_UNIT = {}
-
-# Jadwal dinas: hari_int|hari_str
-JADWAL_DINAS = {}
-
-def add_jadwal_pegawai(row):
-    JADWAL_PEGAWAI[(normalize_nik(row["nik"]), row["date"])] = row
-
-# Perbaiki add_jadwal_sub_unit dan add_jadwal_unit
-def add_jadwal_sub_unit(row):
-    sub_unit_id = normalize_id(row["sub_unit_id"])
-    if sub_unit_id is None:
-        return
-    key = (sub_unit_id, row["hari"])
-    JADWAL_SUB_UNIT[key] = row
-
-def add_jadwal_unit(row):
-    unit_id = normalize_id(row["unit_id"])
-    if unit_id is None:
-        return
-    key = (unit_id, row["hari"])
-    JADWAL_UNIT[key] = row
-
-def add_jadwal_dinas(row):
-    """Add dinas schedule to cache"""
-    JADWAL_DINAS[row["hari"]] = row
-    
-def resolve_jadwal_from_cache(nik, date, unit_id, sub_unit_id):
-    """
-    Final jadwal resolver (NO DB)
-    Priority:
-    1. Pegawai
-    2. Sub Unit
-    3. Unit
-    4. Dinas
-    """
-    # 1️⃣ Pegawai
-    row = JADWAL_PEGAWAI.get((normalize_nik(nik), date))
-    if row:
-        # return row["jam_masuk"], row["jam_pulang"], "pegawai"  
-        return (
-            row["jam_masuk"],
-            row["jam_pulang"],
-            row.get("penalti_tidak_tap_in"),
-            row.get("penalti_tidak_tap_out"),
-            "pegawai"
+    def add_attendance(self, nik, date, row):
+        """
+        nik: int code (lihat encode_id)
+        Return False jika tap dibuang sebagai duplikat
+        """
+        key = (nik, date)
+        m = tap_minute(row)
+
+        if self.budget is not None:
+            self._account_attendance(key, row)
+
+        rows = self.att_map.get(key)
+        if rows is None:
+            self.att_map[key] = [row]
+            self.att_min[key] = [m]
+            return True
+
+        mins = self.att_min[key]
+
+        if self.tap_dedupe_seconds is not None and self._is_duplicate_tap(rows, mins, row, m):
+            return False
+
+        if m >= mins[-1]:
+            # jalur normal: query sudah ORDER BY nik, time
+            rows.append(row)
+            mins.append(m)
+        else:
+            i = bisect_right(mins, m)
+            rows.insert(i, row)
+            mins.insert(i, m)
+        return True
+
+    def merge_attendance(self, nik, date, row):
+        """
+        Incremental add (daemon): skip tap yang sudah ada,
+        sisipkan sesuai urutan jam.
+        Return True jika row baru.
+        """
+        rows = self.att_map.get((nik, date))
+
+        if rows is not None:
+            t = row["time"]
+            for r in rows:
+                if (
+                    r["time"] == t and
+                    r["device_id"] == row["device_id"] and
+                    r.get("filename") == row.get("filename")
+                ):
+                    return False
+
+        return self.add_attendance(nik, date, row)
+
+    def get_attendance(self, nik, date):
+        return self.att_map.get((nik, date), [])
+
+    def get_attendance_minutes(self, nik, date):
+        return self.att_min.get((nik, date), [])
+
+    def clear_attendance(self):
+        self.att_map.clear()
+        self.att_min.clear()
+        if self.budget is not None:
+            self.budget.release(self.att_bytes)
+        self.att_bytes = 0
+
+    # =====================================================
+    # ATTENDANCE SPILL (BUDGET MEMORI)
+    # =====================================================
+
+    def _account_attendance(self, key, row):
+        """
+        Hitung byte tap baru; spill hanya saat key baru muncul
+        (input urut nik, time → key lain sudah lengkap).
+        Tap duplikat ikut dihitung (perkiraan, dibulatkan ke atas).
+        """
+        if (
+            key not in self.att_map and self.att_map and
+            not self._att_replay and self.budget.over()
+        ):
+            self.spill_attendance()
+
+        n = self._att_size(row)
+        self.att_bytes += n
+        self.budget.add(n)
+
+    def spill_attendance(self):
+        """Pindahkan semua tap di att_map ke file partisi"""
+        if not self.att_map:
+            return
+        if self.att_spill is None:
+            self.att_spill = AttendanceSpill(self.budget)
+
+        self.att_spill.write(self.att_map)
+        self.budget.release(self.att_bytes, spilled=True)
+        self.att_bytes = 0
+        self.att_map.clear()
+        self.att_min.clear()
+
+    def iter_attendance_partitions(self):
+        """
+        Setelah spill: sisa att_map ikut di-spill, lalu setiap partisi
+        dimuat ke att_map (lewat add_attendance, urutan asli) satu per
+        satu. Yield nomor partisi; NIK partisi lain tidak punya tap di cache.
+        """
+        self.spill_attendance()
+        spill = self.att_spill
+
+        log(
+            f"[SPILL] attendance: {spill.rows} taps in {spill.partitions} partitions "
+            f"({spill.spills} spill(s))"
         )
 
+        self._att_replay = True
+        try:
+            for part in range(spill.partitions):
+                self.clear_attendance()
+                for (nik, date), row in spill.read(part):
+                    self.add_attendance(nik, date, row)
+                yield part
+        finally:
+            self._att_replay = False
+            self.clear_attendance()
+
+    def drop_attendance_spill(self):
+        if self.att_spill is not None:
+            self.att_spill.close()
+            self.att_spill = None
+
+    def rebuild_attendance_index(self):
+        """Bangun ulang att_min dari att_map (mis. setelah restore snapshot)"""
+        self.att_min.clear()
+        for key, rows in self.att_map.items():
+            rows.sort(key=tap_minute)
+            self.att_min[key] = [tap_minute(r) for r in rows]
+
+    # =====================================================
+    # PEGAWAI / HISTORY
+    # =====================================================
+
+    def add_pegawai_ctx(self, row):
+        nik = self.encode_id(row["nik"])
+
+        raw_unit = row.get("id_unit")
+
+        if nik not in self.pegawai_ctx:
+            self.pegawai_ctx[nik] = {
+                "unit_id": self.encode_id(raw_unit),
+                "sub_unit_id": self.encode_id(row.get("id_sub_unit")),
+                # unit multi (csv) → code per unit untuk lookup device
+                "unit_codes": tuple(
+                    self.encode_id(u)
+                    for u in str(raw_unit).split(",")
+                    if u.strip()
+                ) if raw_unit is not None else (),
+                "lokasi_kerja": tuple(
+                    self.encode_id(x)
+                    for x in (row.get("lokasi_kerja") or "").split(",")
+                    if x.strip()
+                ),
+            }
+
+    def get_pegawai_ctx(self, nik):
+        return self.pegawai_ctx.get(nik)
+
+    # =====================================================
+    # DEVICE
+    # =====================================================
+
+    def add_device(self, row):
+        """Load device into device_by_unit[unit_code][device_code]"""
+
+        raw_unit = row.get("unit_id")
+        if raw_unit is None:
+            return
+
+        device_id = self.encode_id(row.get("device_id"))
+        desc = row.get("desc")
+
+        if device_id is None:
+            return
+
+        # split multi-unit
+        unit_ids = [
+            self.encode_id(u)
+            for u in str(raw_unit).split(",")
+            if u.strip()
+        ]
+
+        for unit_id in unit_ids:
+            self.device_by_unit[unit_id][device_id] = {
+                "id": row["id"],
+                "desc": desc
+            }
+
+    def get_device_desc(self, unit_id, device_id):
+        """unit_id, device_id: code"""
+        if unit_id is None or device_id is None:
+            return None
+        d = self.device_by_unit.get(unit_id, {}).get(device_id)
+        return d["desc"] if d else None
+
+    def build_lokasi_kerja(self, unit_codes, hist_lokasi):
+        """
+        Return (allowed, csv)
+        allowed : frozenset device code (untuk is_device_valid)
+        csv     : device_id string terurut (untuk output)
+        """
+        key = (unit_codes, hist_lokasi)
+        hit = self.lokasi_memo.get(key)
+        if hit is not None:
+            return hit
+
+        lokasi = set()
+
+        for uid in unit_codes:
+            if uid in self.device_by_unit:
+                lokasi.update(
+                    self.device_by_unit[uid].keys()
+                )
 
-    hi = hari_int(date)
-    hs = hari_str(date)
-
-    # 2️⃣ Sub Unit
-    if sub_unit_id:
-        # Normalize to string for lookup
-        sub_unit_id_str = str(sub_unit_id)  # 👈 Pastikan string
-        row = (
-            JADWAL_SUB_UNIT.get((sub_unit_id_str, hi)) or
-            JADWAL_SUB_UNIT.get((sub_unit_id_str, hs))
-        )
+        if hist_lokasi:
+            lokasi.update(hist_lokasi)
+
+        allowed = frozenset(lokasi)
+        csv = ",".join(sorted(self.id_name[c] for c in allowed)) if allowed else None
+
+        self.lokasi_memo[key] = (allowed, csv)
+        return allowed, csv
+
+    # =====================================================
+    # ABSENT / DAILY NOTE & TAPPING NOTE
+    # =====================================================
+
+    def add_absent(self, row):
+        key = (self.encode_id(row["nik"]), row["date"])
+        self.absent_map[key] = row
+
+    def get_absent(self, nik, date):
+        return self.absent_map.get((nik, date))
+
+    def add_tap(self, row):
+        key = (self.encode_id(row["nik"]), row["date"], row["hour"])
+        self.tap_map[key] = row
+
+    def get_tap(self, nik, date, hour):
+        return self.tap_map.get((nik, date, hour))
+
+    # =====================================================
+    # JADWAL
+    # =====================================================
+
+    def add_jadwal_pegawai(self, row):
+        self.jadwal_pegawai[(self.encode_id(row["nik"]), row["date"])] = row
+
+    def add_jadwal_sub_unit(self, row):
+        sub_unit_id = self.encode_id(row["sub_unit_id"])
+        if sub_unit_id is None:
+            return
+        key = (sub_unit_id, row["hari"])
+        self.jadwal_sub_unit[key] = row
+
+    def add_jadwal_unit(self, row):
+        unit_id = self.encode_id(row["unit_id"])
+        if unit_id is None:
+            return
+        key = (unit_id, row["hari"])
+        self.jadwal_unit[key] = row
+
+    def add_jadwal_dinas(self, row):
+        """Add dinas schedule to cache"""
+        self.jadwal_dinas[row["hari"]] = row
+
+    def resolve_jadwal_from_cache(self, nik, date, unit_id, sub_unit_id):
+        """
+        Final jadwal resolver (NO DB)
+        nik, unit_id, sub_unit_id: code
+        Priority:
+        1. Pegawai
+        2. Sub Unit
+        3. Unit
+        4. Dinas
+        """
+        # 1️⃣ Pegawai
+        row = self.jadwal_pegawai.get((nik, date))
         if row:
-            # return row["jam_masuk"], row["jam_pulang"], "sub_unit"
             return (
                 row["jam_masuk"],
                 row["jam_pulang"],
                 row.get("penalti_tidak_tap_in"),
                 row.get("penalti_tidak_tap_out"),
-                "sub_unit"
+                "pegawai"
             )
-            
-    # 3️⃣ Unit
-    if unit_id:
-        # Normalize to string for lookup
-        unit_id_str = str(unit_id)  # 👈 Pastikan string
-        row = (
-            JADWAL_UNIT.get((unit_id_str, hi)) or
-            JADWAL_UNIT.get((unit_id_str, hs))
-        )
+
+        hi = hari_int(date)
+        hs = hari_str(date)
+
+        # 2️⃣ Sub Unit
+        if sub_unit_id is not None:
+            row = (
+                self.jadwal_sub_unit.get((sub_unit_id, hi)) or
+                self.jadwal_sub_unit.get((sub_unit_id, hs))
+            )
+            if row:
+                return (
+                    row["jam_masuk"],
+                    row["jam_pulang"],
+                    row.get("penalti_tidak_tap_in"),
+                    row.get("penalti_tidak_tap_out"),
+                    "sub_unit"
+                )
+
+        # 3️⃣ Unit
+        if unit_id is not None:
+            row = (
+                self.jadwal_unit.get((unit_id, hi)) or
+                self.jadwal_unit.get((unit_id, hs))
+            )
+            if row:
+                return (
+                    row["jam_masuk"],
+                    row["jam_pulang"],
+                    row.get("penalti_tidak_tap_in"),
+                    row.get("penalti_tidak_tap_out"),
+                    "unit"
+                )
+
+        # 4️⃣ Dinas
+        row = self.jadwal_dinas.get(hi) or self.jadwal_dinas.get(hs)
         if row:
-            # return row["jam_masuk"], row["jam_pulang"], "unit"
             return (
                 row["jam_masuk"],
                 row["jam_pulang"],
                 row.get("penalti_tidak_tap_in"),
                 row.get("penalti_tidak_tap_out"),
-                "unit"
+                "dinas"
             )
-
-    # 4️⃣ Dinas
-    row = JADWAL_DINAS.get(hi) or JADWAL_DINAS.get(hs)
-    if row:
-        # return row["jam_masuk"], row["jam_pulang"], "dinas"
-        return (
-            row["jam_masuk"],
-            row["jam_pulang"],
-            row.get("penalti_tidak_tap_in"),
-            row.get("penalti_tidak_tap_out"),
-            "dinas"
-        )
-    return None, None, None, None, None
+        return None, None, None, None, None
+
+    # =====================================================
+    # RESET
+    # =====================================================
+
+    def reset(self):
+        """Kosongkan semua cache per tanggal (ID dictionary tetap)"""
+        self.clear_attendance()
+        self.drop_attendance_spill()
+        self.lokasi_memo.clear()
+        for name in self.MAPS:
+            getattr(self, name).clear()
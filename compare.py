@@ -0,0 +1,113 @@
+# compare.py
+# =====================================================
+# Shadow / compare mode: dua engine transform, satu extract
+# =====================================================
+
+import time
+
+from utils import log, log_warn
+from transform import get_engine, iter_target_niks
+
+# =====================================================
+# RUN ENGINE
+# =====================================================
+
+def _run_engine(etl, process, niks, date):
+    """Return (rows per nik_code, elapsed ms)"""
+    start = time.perf_counter()
+    out = {code: process(etl, code, date) for code in niks}
+    return out, (time.perf_counter() - start) * 1000
+
+# =====================================================
+# COMPARE
+# =====================================================
+
+def diff_row(a, b):
+    """Kolom yang nilainya berbeda antara dua row output"""
+    return [
+        col for col in a.keys() | b.keys()
+        if a.get(col) != b.get(col)
+    ]
+
+def compare_engines(etl, date, engine_a, engine_b, unit_id=None, nik=None, max_samples=20, stats=None):
+    """
+    Jalankan engine_a dan engine_b atas cache yang sama (TANPA load),
+    diff setiap kolom output per NIK.
+    Return report dict.
+    """
+    process_a = get_engine(engine_a)
+    process_b = get_engine(engine_b)
+
+    niks = list(iter_target_niks(etl, unit_id, nik))
+
+    rows_a, ms_a = _run_engine(etl, process_a, niks, date)
+    rows_b, ms_b = _run_engine(etl, process_b, niks, date)
+
+    column_mismatch = {}
+    mismatched_niks = 0
+    samples = []
+
+    for code in niks:
+        a = rows_a[code]
+        b = rows_b[code]
+
+        diff_cols = diff_row(a, b)
+        if not diff_cols:
+            continue
+
+        mismatched_niks += 1
+        for col in diff_cols:
+            column_mismatch[col] = column_mismatch.get(col, 0) + 1
+
+        if len(samples) < max_samples:
+            samples.append({
+                "nik": etl.decode_id(code),
+                "diff": {col: (a.get(col), b.get(col)) for col in sorted(diff_cols)},
+            })
+
+    report = {
+        "date": date,
+        "engines": (engine_a, engine_b),
+        "rows": len(niks),
+        "ms": (round(ms_a, 2), round(ms_b, 2)),
+        "rows_per_sec": tuple(
+            round(len(niks) / (ms / 1000), 1) if ms else None
+            for ms in (ms_a, ms_b)
+        ),
+        "mismatched_niks": mismatched_niks,
+        "column_mismatch": dict(sorted(column_mismatch.items(), key=lambda x: -x[1])),
+        "samples": samples,
+    }
+
+    if stats is not None:
+        stats[f"compare_{engine_a}_ms"] = report["ms"][0]
+        stats[f"compare_{engine_b}_ms"] = report["ms"][1]
+        stats["compare_mismatched_niks"] = mismatched_niks
+
+    log_report(report)
+    return report
+
+def log_report(report):
+    engine_a, engine_b = report["engines"]
+    ms_a, ms_b = report["ms"]
+    rps_a, rps_b = report["rows_per_sec"]
+
+    log(
+        f"[COMPARE] {report['date']} rows={report['rows']} | "
+        f"{engine_a}={ms_a}ms ({rps_a} rows/s) "
+        f"{engine_b}={ms_b}ms ({rps_b} rows/s)"
+    )
+
+    if not report["mismatched_niks"]:
+        log("[COMPARE] OK, all columns identical")
+        return
+
+    log_warn(
+        f"[COMPARE] {report['mismatched_niks']} NIK mismatched | "
+        + " ".join(f"{col}={n}" for col, n in report["column_mismatch"].items())
+    )
+    for s in report["samples"]:
+        log_warn(
+            f"[COMPARE] nik={s['nik']} "
+            + " ".join(f"{col}: {a!r} != {b!r}" for col, (a, b) in s["diff"].items())
+        )
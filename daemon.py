@@ -0,0 +1,260 @@
+# daemon.py
+# =====================================================
+# Daemon mode: ETL "hari ini" berulang dengan cache hangat
+# =====================================================
+
+import json
+import os
+import signal
+import time
+from datetime import date as date_cls, datetime, timedelta
+
+from utils import log, log_warn, log_error, time_block
+from extract import (
+    extract_all,
+    extract_attendance,
+    extract_pegawai_ctx,
+    extract_absent,
+    extract_tapping,
+    extract_jadwal,
+)
+from transform import transform_all, get_engine
+from load import load_rows
+
+# =====================================================
+# STATUS FILE
+# =====================================================
+
+def write_status(path, status):
+    """Tulis status JSON secara atomik (tmp + rename)"""
+    if not path:
+        return
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(status, f, default=str, indent=2)
+    os.replace(tmp, path)
+
+# =====================================================
+# REFRESH
+# =====================================================
+
+def refresh_cold(etl, main_db, aux_db, att_db, date, args, stats):
+    """
+    Hari baru: reset cache, extract penuh
+    (device & jadwal referensi dimuat sekali per hari)
+    Return watermark attendance
+    """
+    etl.reset()
+    return extract_all(
+        etl,
+        main_db,
+        aux_db,
+        att_db,
+        date,
+        unit_id=args.unit_id,
+        sub_unit_id=args.sub_unit_id,
+        nik=args.nik,
+        stats=stats,
+    )
+
+def refresh_warm(etl, main_db, aux_db, att_db, date, args, watermark, stats):
+    """
+    Hari yang sama: data kecil dimuat ulang,
+    attendance hanya tap baru sejak watermark (dengan overlap)
+    Return watermark baru
+    """
+    etl.pegawai_ctx.clear()
+    etl.absent_map.clear()
+    etl.tap_map.clear()
+    etl.jadwal_pegawai.clear()
+
+    extract_pegawai_ctx(etl, main_db, date, args.unit_id, args.sub_unit_id, args.nik, stats)
+    extract_absent(etl, aux_db, date, stats)
+    extract_tapping(etl, aux_db, date, stats)
+    extract_jadwal(etl, main_db, date, stats, reference=False)
+
+    since = None
+    if watermark is not None:
+        # tap dari file mesin bisa masuk terlambat → baca ulang sebagian
+        since = max(watermark - timedelta(minutes=args.tap_overlap), timedelta(0))
+
+    new_watermark = extract_attendance(etl, att_db, date, nik=args.nik, stats=stats, since=since)
+
+    if watermark is None or (new_watermark is not None and new_watermark > watermark):
+        return new_watermark
+    return watermark
+
+def transform_load(router, etl, date, args, stats):
+    """Transform cache etl untuk date lalu load ke primary. Return rows"""
+    rows = transform_all(
+        etl,
+        date,
+        unit_id=args.unit_id,
+        nik=args.nik,
+        stats=stats,
+        engine=get_engine(args.engine),
+    )
+
+    if args.dry_run:
+        log("Dry-run enabled, skipping load")
+    else:
+        load_rows(
+            router.writer(),
+            rows,
+            batch_size=args.batch_size,
+            stats=stats,
+            auto_tune=args.auto_batch,
+            mode=args.load_mode,
+            workers=args.load_workers,
+            connect=router.writer_factory(),
+            with_recap=args.recap,
+        )
+    return rows
+
+def finish_day(router, etl, date, args, watermark, warm, metrics=None):
+    """
+    Hari berganti: satu refresh + load terakhir untuk tanggal lama.
+    Tap yang masuk setelah siklus terakhir sebelum tengah malam
+    (termasuk upload mesin terlambat) ikut ter-load.
+    warm False (siklus terakhir gagal) → extract penuh tanggal lama
+    """
+    stats = {}
+    main_db, aux_db, att_db = router.readers(date)
+
+    with time_block("extract_total", stats):
+        if warm:
+            refresh_warm(etl, main_db, aux_db, att_db, date, args, watermark, stats)
+        else:
+            refresh_cold(etl, main_db, aux_db, att_db, date, args, stats)
+
+    rows = transform_load(router, etl, date, args, stats)
+    log(f"Daemon: final refresh for {date}, {len(rows)} row(s)")
+
+    if metrics is not None:
+        stats["rows"] = len(rows)
+        metrics.record(date, stats)
+
+# =====================================================
+# MAIN LOOP
+# =====================================================
+
+def run_daemon(router, etl, args, metrics=None):
+    """
+    Loop ETL untuk tanggal hari ini setiap args.interval detik.
+    etl (EtlContext) dipertahankan antar siklus (cache hangat).
+    Koneksi dipakai ulang (ping + reconnect), error satu siklus
+    tidak menghentikan daemon. Extract lewat router.readers()
+    (replica jika lag cukup kecil), load selalu ke primary.
+    metrics: RunMetrics opsional, record per siklus sukses
+    """
+    stop = {"flag": False}
+
+    def _stop(signum, frame):
+        log(f"Signal {signum} received, stopping daemon")
+        stop["flag"] = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    status = {
+        "pid": os.getpid(),
+        "state": "starting",
+        "started_at": datetime.now(),
+        "interval_s": args.interval,
+        "cycle": 0,
+        "errors": 0,
+    }
+    write_status(args.status_file, status)
+
+    current_date = None
+    watermark = None
+    # cache current_date utuh (siklus terakhir sukses) → refresh warm
+    warm_ok = False
+
+    log(f"Daemon started (interval={args.interval}s)")
+
+    while not stop["flag"]:
+        cycle_start = time.monotonic()
+        today = date_cls.today()
+        stats = {}
+
+        status.update({
+            "state": "running",
+            "date": today,
+            "cycle": status["cycle"] + 1,
+            "last_started": datetime.now(),
+        })
+        write_status(args.status_file, status)
+
+        try:
+            # akhiri snapshot REPEATABLE READ siklus sebelumnya,
+            # lag replica dicek ulang
+            router.refresh()
+            main_db, aux_db, att_db = router.readers(today)
+
+            if current_date is not None and today != current_date:
+                # gagal → tidak menahan hari baru, tanggal lama via batch
+                try:
+                    finish_day(router, etl, current_date, args, watermark, warm_ok, metrics)
+                except Exception as e:
+                    status["errors"] += 1
+                    log_warn(f"Daemon: final refresh for {current_date} failed: {e}")
+                current_date = None
+
+            with time_block("extract_total", stats):
+                if today != current_date or not warm_ok:
+                    log(f"Daemon: cold refresh for {today}")
+                    warm_ok = False
+                    current_date = today
+                    watermark = refresh_cold(etl, main_db, aux_db, att_db, today, args, stats)
+                else:
+                    watermark = refresh_warm(
+                        etl, main_db, aux_db, att_db, today, args, watermark, stats
+                    )
+
+            rows = transform_load(router, etl, today, args, stats)
+            warm_ok = True
+
+            status.update({
+                "state": "idle",
+                "last_ok": datetime.now(),
+                "last_rows": len(rows),
+                "last_error": None,
+                "att_watermark": watermark,
+                "att_keys": len(etl.att_map),
+                "ids_interned": len(etl.id_name),
+                "stats": stats,
+            })
+
+            if metrics is not None:
+                stats["rows"] = len(rows)
+                metrics.record(today, stats)
+
+        except Exception as e:
+            # paksa cold refresh berikutnya, cache bisa setengah terisi
+            warm_ok = False
+            status.update({
+                "state": "error",
+                "errors": status["errors"] + 1,
+                "last_error": f"{type(e).__name__}: {e}",
+                "last_error_at": datetime.now(),
+            })
+            log_error(f"Daemon cycle failed: {e}")
+
+        elapsed = time.monotonic() - cycle_start
+        status["last_duration_ms"] = round(elapsed * 1000, 2)
+        write_status(args.status_file, status)
+
+        log(
+            f"[DAEMON] cycle={status['cycle']} state={status['state']} "
+            f"duration={status['last_duration_ms']}ms"
+        )
+
+        # tidur sampai siklus berikutnya (tetap responsif terhadap signal)
+        deadline = cycle_start + args.interval
+        while not stop["flag"] and time.monotonic() < deadline:
+            time.sleep(max(0.0, min(1.0, deadline - time.monotonic())))
+
+    status["state"] = "stopped"
+    write_status(args.status_file, status)
+    log("Daemon stopped")
@@ -0,0 +1,308 @@
+# db.py
+# =====================================================
+# Koneksi DB + read/write routing (primary / replica)
+# =====================================================
+
+import threading
+import time
+from datetime import date as date_cls
+
+import pymysql
+
+try:
+    import MySQLdb
+    import MySQLdb.connections
+    import MySQLdb.cursors
+except ImportError:  # mysqlclient opsional
+    MySQLdb = None
+
+from utils import log, log_warn
+
+# =====================================================
+# DRIVER
+# =====================================================
+# DB_DRIVER=pymysql (default, pure Python) | mysqlclient (C, MySQLdb)
+# DB_CURSOR=dict (default) | tuple
+#
+# Semua kode memakai row dict (koneksi default DictCursor). Mode tuple
+# hanya untuk jalur panas extract attendance (row_cursor): row dibangun
+# sekali di _ingest_attendance dari tuple, tanpa dict perantara driver.
+# Bandingkan dengan `python bench.py decode --from YYYY-MM-DD`.
+
+# exception dari driver mana pun (kode error MySQL sama di e.args[0])
+MySQLError = (pymysql.err.MySQLError,) + ((MySQLdb.MySQLError,) if MySQLdb else ())
+OperationalError = (pymysql.err.OperationalError,) + ((MySQLdb.OperationalError,) if MySQLdb else ())
+ProgrammingError = (pymysql.err.ProgrammingError,) + ((MySQLdb.ProgrammingError,) if MySQLdb else ())
+
+CURSOR_MODES = ("dict", "tuple")
+
+# jumlah statement yang dikirim (semua koneksi / thread), untuk metrics
+_query_count = 0
+_query_lock = threading.Lock()
+
+def query_count():
+    return _query_count
+
+def _count_query():
+    global _query_count
+    with _query_lock:
+        _query_count += 1
+
+def _counting(cursor_cls):
+    """
+    Subclass cursor yang menghitung statement. Dihitung di _query (satu
+    round trip), jalur bersama execute / executemany (multi-row INSERT,
+    loop, multi statement) / callproc di pymysql maupun mysqlclient
+    """
+
+    class Cursor(cursor_cls):
+        def _query(self, q):
+            _count_query()
+            return super()._query(q)
+
+    Cursor.__name__ = f"Counting{cursor_cls.__name__}"
+    return Cursor
+
+def _connect_pymysql(cfg, cursorclass):
+    return pymysql.connect(
+        host=cfg["host"],
+        port=cfg["port"],
+        user=cfg["user"],
+        password=cfg["password"],
+        database=cfg["database"],
+        cursorclass=cursorclass,
+        autocommit=False,
+    )
+
+if MySQLdb is not None:
+    class MysqlclientConnection(MySQLdb.connections.Connection):
+        """API koneksi yang dipakai ETL (sama dengan pymysql)"""
+
+        def begin(self):
+            self.query(b"BEGIN")
+
+        def ping(self, reconnect=True):
+            # reconnect ditangani DbRouter.refresh (buka koneksi baru)
+            super().ping()
+
+def _connect_mysqlclient(cfg, cursorclass):
+    return MysqlclientConnection(
+        host=cfg["host"],
+        port=cfg["port"],
+        user=cfg["user"],
+        passwd=cfg["password"] or "",
+        db=cfg["database"],
+        charset="utf8mb4",
+        cursorclass=cursorclass,
+        autocommit=False,
+    )
+
+# nama → (connect, DictCursor, tuple cursor, modul yang dibutuhkan)
+DRIVERS = {
+    "pymysql": (
+        _connect_pymysql,
+        _counting(pymysql.cursors.DictCursor),
+        _counting(pymysql.cursors.Cursor),
+        pymysql,
+    ),
+    "mysqlclient": (
+        _connect_mysqlclient,
+        _counting(MySQLdb.cursors.DictCursor) if MySQLdb else None,
+        _counting(MySQLdb.cursors.Cursor) if MySQLdb else None,
+        MySQLdb,
+    ),
+}
+
+_driver = "pymysql"
+_cursor_mode = "dict"
+
+def set_driver(name="pymysql", cursor="dict"):
+    """Pilih driver + mode cursor untuk semua koneksi berikutnya"""
+    global _driver, _cursor_mode
+    if name not in DRIVERS:
+        raise ValueError(f"Unknown DB driver: {name} (known: {', '.join(DRIVERS)})")
+    if DRIVERS[name][3] is None:
+        raise ValueError(f"DB driver {name} is not installed (pip install {name})")
+    if cursor not in CURSOR_MODES:
+        raise ValueError(f"Unknown DB cursor mode: {cursor} (known: {', '.join(CURSOR_MODES)})")
+    _driver, _cursor_mode = name, cursor
+
+def driver_name():
+    return _driver
+
+def connect(cfg, driver=None):
+    name = driver or _driver
+    connect_fn, dict_cursor, _, _ = DRIVERS[name]
+    return connect_fn(cfg, dict_cursor)
+
+def row_cursor(conn, mode=None):
+    """
+    Cursor untuk extract bervolume besar: tuple jika DB_CURSOR=tuple
+    (urutan kolom = SELECT), selain itu cursor default (dict)
+    """
+    if (mode or _cursor_mode) != "tuple":
+        return conn.cursor()
+    if MySQLdb is not None and isinstance(conn, MySQLdb.connections.Connection):
+        return conn.cursor(DRIVERS["mysqlclient"][2])
+    return conn.cursor(DRIVERS["pymysql"][2])
+
+# =====================================================
+# REPLICA LAG
+# =====================================================
+
+# hasil cek lag dipakai ulang selama ini (detik)
+LAG_CHECK_TTL = 60
+
+def replica_lag(conn):
+    """
+    Seconds_Behind_Source/Master dari replica.
+    None jika tidak bisa ditentukan (bukan replica, replikasi berhenti,
+    atau tidak punya privilege REPLICATION CLIENT).
+    """
+    for sql in ("SHOW REPLICA STATUS", "SHOW SLAVE STATUS"):
+        try:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                row = cur.fetchone()
+        except MySQLError:
+            continue
+        if not row:
+            return None
+        lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+        return int(lag) if lag is not None else None
+    return None
+
+# =====================================================
+# ROUTER
+# =====================================================
+
+class DbRouter:
+    """
+    Koneksi per DB logis ("att", "main", "aux"):
+    - reader(name, date): replica jika dikonfigurasi, kecuali untuk
+      hari ini saat lag replica > max_lag (atau tidak diketahui)
+    - writer(): primary MAIN (satu-satunya target load_rows)
+    Koneksi dibuka saat pertama dipakai dan dipakai ulang.
+    """
+
+    NAMES = ("att", "main", "aux")
+
+    def __init__(self, primary, replica=None, max_lag=30):
+        """
+        primary: {"att": cfg, "main": cfg, "aux": cfg}
+        replica: {"att": cfg|None, ...}
+        """
+        self.primary_cfg = primary
+        self.replica_cfg = {k: v for k, v in (replica or {}).items() if v}
+        self.max_lag = max_lag
+        self.conns = {}
+        self.lag_checked = {}
+        self.routes = {}
+
+    # -------------------------------------------------
+    # CONNECTIONS
+    # -------------------------------------------------
+    def _conn(self, name, role):
+        key = (name, role)
+        if key not in self.conns:
+            cfg = self.primary_cfg[name] if role == "primary" else self.replica_cfg[name]
+            self.conns[key] = connect(cfg)
+        return self.conns[key]
+
+    def primary(self, name):
+        return self._conn(name, "primary")
+
+    def writer(self):
+        return self.primary("main")
+
+    def writer_factory(self):
+        """Fungsi pembuka koneksi baru ke primary MAIN (parallel load)"""
+        cfg = self.primary_cfg["main"]
+        return lambda: connect(cfg)
+
+    def _replica_usable(self, name, date):
+        if name not in self.replica_cfg:
+            return False, "no replica"
+
+        try:
+            conn = self._conn(name, "replica")
+        except MySQLError as e:
+            return False, f"replica unreachable ({e})"
+
+        if date < date_cls.today():
+            return True, "historical date"
+
+        checked = self.lag_checked.get(name)
+        if checked is None or time.monotonic() - checked[0] > LAG_CHECK_TTL:
+            checked = (time.monotonic(), replica_lag(conn))
+            self.lag_checked[name] = checked
+
+        lag = checked[1]
+        if lag is None:
+            return False, "replica lag unknown"
+        if lag > self.max_lag:
+            return False, f"replica lag {lag}s > {self.max_lag}s"
+        return True, f"replica lag {lag}s"
+
+    def role_for(self, name, date):
+        """"replica" atau "primary" untuk extract DB name pada date"""
+        ok, reason = self._replica_usable(name, date)
+        role = "replica" if ok else "primary"
+
+        if self.routes.get((name, date)) != role:
+            self.routes[(name, date)] = role
+            if name in self.replica_cfg:
+                log(f"[ROUTE] {name} {date} -> {role} ({reason})")
+        return role
+
+    def reader(self, name, date):
+        return self._conn(name, self.role_for(name, date))
+
+    def readers(self, date):
+        """(main_db, aux_db, att_db) untuk extract"""
+        return (
+            self.reader("main", date),
+            self.reader("aux", date),
+            self.reader("att", date),
+        )
+
+    def reader_factory(self, name, date):
+        """Fungsi pembuka koneksi baru ke target baca (mis. slice paralel)"""
+        role = self.role_for(name, date)
+        cfg = self.primary_cfg[name] if role == "primary" else self.replica_cfg[name]
+        return lambda: connect(cfg)
+
+    # -------------------------------------------------
+    # LIFECYCLE
+    # -------------------------------------------------
+    def open_connections(self):
+        return list(self.conns.values())
+
+    def refresh(self):
+        """
+        Ping (reconnect) semua koneksi terbuka dan akhiri snapshot
+        REPEATABLE READ sebelumnya (daemon)
+        """
+        for key, conn in list(self.conns.items()):
+            try:
+                conn.ping(reconnect=True)
+                conn.rollback()
+            except MySQLError as e:
+                # driver tanpa auto-reconnect (mysqlclient) → koneksi baru
+                name, role = key
+                log_warn(f"[DB] {name}/{role} reconnect ({e})")
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                cfg = self.primary_cfg[name] if role == "primary" else self.replica_cfg[name]
+                self.conns[key] = connect(cfg)
+        self.lag_checked.clear()
+
+    def close(self):
+        for (name, role), conn in self.conns.items():
+            try:
+                conn.close()
+            except Exception as e:
+                log_warn(f"close {name}/{role} failed: {e}")
+        self.conns.clear()
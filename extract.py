@@ -1,64 +1,488 @@
 # extract.py
 # =====================================================
 # Extract layer: load data from DB into cache (once)
+# (semua fungsi menerima EtlContext `etl` sebagai argumen pertama)
 # =====================================================
 
-from utils import log, time_block, normalize_nik
-import cache
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from utils import log, log_warn, time_block, clock_minutes
+from db import row_cursor
+from transform import OUT_WINDOW, classify_taps_sorted
 from utils import (
     normalize_id,
 )
+# =====================================================
+# COLUMN PROJECTION
+# =====================================================
+# Kolom yang benar-benar dipakai cache / process_pegawai_fast.
+# alias → ekspresi SQL. Query extract dibangun dari sini (bukan SELECT *),
+# tambahkan kolom di sini jika transform mulai membacanya.
+
+EXTRACT_COLUMNS = {
+    "DB_ATT_tbl_attendance": {
+        "nik": "TRIM(nik)",
+        "tanggal": "DATE(`date`)",
+        "time": "`time`",
+        "device_id": "device_id",
+        "filename": "filename",
+    },
+    # daily note: status hari + notes
+    "tbl_absent": {
+        "nik": "nik",
+        "date": "`date`",
+        "status": "status",
+        "notes": "notes",
+    },
+    # override jam: key (nik, date, hour), jam tm + notes
+    "tbl_absent_hourly": {
+        "nik": "nik",
+        "date": "`date`",
+        "hour": "`hour`",
+        "tm": "tm",
+        "notes": "notes",
+    },
+}
+
+# urutan kolom row tuple (DB_CURSOR=tuple, lihat db.row_cursor)
+ATT_FIELDS = tuple(EXTRACT_COLUMNS["DB_ATT_tbl_attendance"])
+
+def _in_list(values):
+    return ", ".join(["%s"] * len(values))
+
+def select_columns(table):
+    """Daftar SELECT dari EXTRACT_COLUMNS[table]"""
+    return ",\n                    ".join(
+        expr if expr.strip("`") == alias else f"{expr} AS `{alias}`"
+        for alias, expr in EXTRACT_COLUMNS[table].items()
+    )
+
 # =====================================================
 # ATTENDANCE (ATT_DB)
 # =====================================================
 
-def extract_attendance(att_db, date, nik=None, stats=None):
+def _ingest_attendance(etl, rows, add, stats):
+    """
+    Encode id + masukkan row tap ke cache.
+    Return watermark (`time` terbesar)
+    """
+    watermark = None
+    fetched = 0
+    duplicates = 0
+
+    for row in rows:
+        if type(row) is tuple:
+            row = dict(zip(ATT_FIELDS, row))
+
+        # id → int code (decode hanya saat build row output)
+        row["device_id"] = etl.encode_id(row["device_id"]) if row["device_id"] else None
+
+        row_nik = etl.encode_id(row["nik"])
+        row["nik"] = row_nik
+        if not add(row_nik, row["tanggal"], row):
+            duplicates += 1
+
+        fetched += 1
+        if watermark is None or row["time"] > watermark:
+            watermark = row["time"]
+
+    if stats is not None:
+        stats["att_rows_fetched"] = stats.get("att_rows_fetched", 0) + fetched
+        stats["att_duplicates"] = stats.get("att_duplicates", 0) + duplicates
+
+    log(
+        f"Attendance loaded: {len(etl.att_map)} keys "
+        f"(+{fetched} rows, {duplicates} duplicate taps collapsed)"
+    )
+    return watermark
+
+def _attendance_query(date, nik=None, since=None, start=None, end=None, niks=None):
+    """
+    SQL + params tap attendance untuk rentang [start, end) pada hari date
+    niks: filter daftar NIK (antrian recompute)
+    """
+    sql = f"""
+        SELECT
+            {select_columns("DB_ATT_tbl_attendance")}
+        FROM DB_ATT_tbl_attendance
+        WHERE `date` >= %s
+        AND `date` < %s
+    """
+
+    params = [
+        start or f"{date} 00:00:00",
+        end or f"{date} 23:59:59"
+    ]
+
+    if nik:
+        sql += " AND TRIM(nik) = %s"
+        params.append(nik)
+
+    if niks:
+        sql += f" AND TRIM(nik) IN ({_in_list(niks)})"
+        params.extend(niks)
+
+    if since is not None:
+        sql += " AND `time` >= %s"
+        params.append(since)
+
+    sql += " ORDER BY nik, `time`"
+    return sql, params
+
+def extract_attendance(etl, att_db, date, nik=None, stats=None, since=None, slices=1, connect=None, niks=None):
+    """
+    Load tap attendance into etl.att_map.
+    since: TIME (timedelta) → incremental, hanya tap `time` >= since,
+           di-merge ke cache (duplikat di-skip)
+    slices, connect: > 1 → hari dipecah per rentang jam, diambil paralel
+           dengan koneksi baru dari connect() (lihat extract_attendance_sliced)
+    niks: hanya daftar NIK ini (tidak dipakai bersama slices)
+    Return `time` terbesar yang terbaca (watermark), None jika kosong
+    """
+    if slices > 1 and connect is not None and not niks:
+        return extract_attendance_sliced(
+            etl,
+            connect, date, slices, nik=nik, stats=stats, since=since
+        )
 
     with time_block("extract_attendance", stats):
-        with att_db.cursor() as cur:
+        with row_cursor(att_db) as cur:
+            sql, params = _attendance_query(date, nik, since, niks=niks)
+            cur.execute(sql, params)
 
-            sql = """
-                SELECT
-                    TRIM(nik) AS nik,
-                    DATE(`date`) AS tanggal,
-                    `time`,
-                    device_id,
-                    filename,
-                    lat,
-                    `long`
-                FROM DB_ATT_tbl_attendance
-                WHERE `date` >= %s
-                AND `date` < %s
-            """
+            add = etl.add_attendance if since is None else etl.merge_attendance
+            watermark = _ingest_attendance(etl, cur.fetchall(), add, stats)
+
+    return watermark
+
+# =====================================================
+# ATTENDANCE — PARALLEL SLICES (ATT_DB)
+# =====================================================
+# Satu hari dipecah menjadi N rentang jam pada kolom `date`,
+# tiap slice diambil di koneksi sendiri secara paralel, lalu
+# di-merge ke cache berurutan (slice jam lebih awal dulu →
+# urutan tap per NIK tetap terjaga).
+
+def _slice_bounds(date, slices):
+    """N rentang [start, end) datetime string dalam satu hari"""
+    day = datetime.combine(date, datetime.min.time())
+    step = timedelta(days=1) / slices
+
+    bounds = []
+    for i in range(slices):
+        start = day + step * i
+        end = day + step * (i + 1)
+        bounds.append((
+            f"{start:%Y-%m-%d %H:%M:%S}",
+            # sama dengan query satu koneksi: batas akhir hari 23:59:59
+            f"{end:%Y-%m-%d %H:%M:%S}" if i < slices - 1 else f"{date} 23:59:59",
+        ))
+    return bounds
+
+def _fetch_slice(connect, sql, params):
+    """Jalankan satu slice di koneksi baru. Return (rows, ms)"""
+    start = time.perf_counter()
+    db = connect()
+    try:
+        with row_cursor(db) as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+    finally:
+        db.close()
+    return rows, round((time.perf_counter() - start) * 1000, 2)
 
-            params = [
-                f"{date} 00:00:00",
-                f"{date} 23:59:59"
+def extract_attendance_sliced(etl, connect, date, slices, nik=None, stats=None, since=None):
+    """
+    Ambil attendance satu hari dalam N slice paralel.
+    Return watermark (lihat extract_attendance)
+    """
+    bounds = _slice_bounds(date, slices)
+
+    with time_block("extract_attendance", stats):
+        with ThreadPoolExecutor(max_workers=slices) as pool:
+            futures = [
+                pool.submit(
+                    _fetch_slice,
+                    connect,
+                    *_attendance_query(date, nik, since, start, end),
+                )
+                for start, end in bounds
             ]
+            results = [f.result() for f in futures]
 
-            if nik:
-                sql += " AND TRIM(nik) = %s"
-                params.append(nik)
+        add = etl.add_attendance if since is None else etl.merge_attendance
+        watermark = None
+
+        for i, ((start, end), (rows, ms)) in enumerate(zip(bounds, results)):
+            log(f"[SLICE] {i + 1}/{slices} {start} → {end} rows={len(rows)} {ms}ms")
+            if stats is not None:
+                stats[f"extract_att_slice{i + 1}_ms"] = ms
+                stats[f"extract_att_slice{i + 1}_rows"] = len(rows)
 
-            sql += " ORDER BY nik, `time`"
+            w = _ingest_attendance(etl, rows, add, stats)
+            if w is not None and (watermark is None or w > watermark):
+                watermark = w
 
+    return watermark
+
+# =====================================================
+# ATTENDANCE — SERVER-SIDE REDUCTION (ATT_DB)
+# =====================================================
+# Summary hanya butuh tap paling awal (IN) dan tap terakhir dalam
+# window jam pulang (OUT, lihat classify_taps_sorted). Mode ini
+# menghitung keduanya di MySQL (window function, MySQL 8 / MariaDB 10.2+)
+# sehingga paling banyak 2 row per NIK yang dikirim.
+#
+# Window per NIK tergantung jadwal → etl.pegawai_ctx & etl.jadwal_* harus
+# sudah dimuat sebelum extract_attendance_reduced.
+
+def _out_window_seconds(jam_pulang):
+    """
+    Batas [lo, hi) detik untuk tap OUT, setara menit classify:
+    -OUT_WINDOW <= menit(tap) - menit(jam_pulang) <= OUT_WINDOW
+    None jika tanpa jam pulang (OUT = tap terakhir)
+    """
+    if not jam_pulang:
+        return None
+    batas = clock_minutes(jam_pulang)
+    return (
+        (batas - OUT_WINDOW) * 60,
+        (batas + OUT_WINDOW + 1) * 60,
+    )
+
+def _out_windows_by_nik(etl, date):
+    """
+    Return (windows, default)
+    windows: {nik_str: (lo, hi)|None} untuk NIK dengan konteks / jadwal pegawai
+    default: window untuk NIK lain (jadwal dinas)
+    """
+    windows = {}
+    codes = etl.pegawai_ctx.keys() | {
+        k[0] for k in etl.jadwal_pegawai.keys() if k[1] == date
+    }
+    for code in codes:
+        ctx = etl.get_pegawai_ctx(code)
+        _, jam_pulang, _, _, _ = etl.resolve_jadwal_from_cache(
+            code,
+            date,
+            ctx["unit_id"] if ctx else None,
+            ctx["sub_unit_id"] if ctx else None,
+        )
+        windows[etl.decode_id(code)] = _out_window_seconds(jam_pulang)
+
+    _, jam_pulang, _, _, _ = etl.resolve_jadwal_from_cache(None, date, None, None)
+    return windows, _out_window_seconds(jam_pulang)
+
+def reduced_attendance_query(date, windows, default, nik=None):
+    """
+    Return (sql, params, groups) query kandidat tap IN / OUT.
+    windows / default: lihat _out_windows_by_nik
+    """
+    # kelompokkan NIK per window → satu cabang CASE per window
+    groups = {}
+    for nik_str, window in windows.items():
+        if window != default:
+            groups.setdefault(window, []).append(nik_str)
+
+    params = []
+    branches = []
+
+    def window_expr(window):
+        if window is None:
+            return "0"
+        params.extend(window)
+        return "(TIME_TO_SEC(`time`) >= %s AND TIME_TO_SEC(`time`) < %s)"
+
+    for window, niks in groups.items():
+        placeholders = ", ".join(["%s"] * len(niks))
+        params.extend(niks)
+        branches.append(f"WHEN TRIM(nik) IN ({placeholders}) THEN {window_expr(window)}")
+
+    if branches:
+        out_order = f"CASE {' '.join(branches)} ELSE {window_expr(default)} END DESC, `time` DESC"
+    elif default is not None:
+        out_order = f"{window_expr(default)} DESC, `time` DESC"
+    else:
+        # tanpa jam pulang sama sekali: OUT = tap terakhir
+        out_order = "`time` DESC"
+
+    sql = f"""
+        SELECT nik, tanggal, `time`, device_id, filename
+        FROM (
+            SELECT
+                {select_columns("DB_ATT_tbl_attendance")},
+                ROW_NUMBER() OVER (
+                    PARTITION BY TRIM(nik) ORDER BY `time`
+                ) AS rn_in,
+                ROW_NUMBER() OVER (
+                    PARTITION BY TRIM(nik) ORDER BY {out_order}
+                ) AS rn_out
+            FROM DB_ATT_tbl_attendance
+            WHERE `date` >= %s
+            AND `date` < %s
+    """
+    params += [
+        f"{date} 00:00:00",
+        f"{date} 23:59:59"
+    ]
+
+    if nik:
+        sql += " AND TRIM(nik) = %s"
+        params.append(nik)
+
+    sql += """
+        ) t
+        WHERE rn_in = 1 OR rn_out = 1
+        ORDER BY nik, `time`
+    """
+    return sql, params, groups
+
+def extract_attendance_reduced(etl, att_db, date, nik=None, stats=None):
+    """
+    Load hanya kandidat tap IN / OUT per NIK ke etl.att_map.
+    Return watermark (lihat extract_attendance)
+    """
+    with time_block("extract_attendance_reduced", stats):
+        windows, default = _out_windows_by_nik(etl, date)
+        sql, params, groups = reduced_attendance_query(date, windows, default, nik=nik)
+
+        with row_cursor(att_db) as cur:
             cur.execute(sql, params)
+            watermark = _ingest_attendance(etl, cur.fetchall(), etl.add_attendance, stats)
 
-            for row in cur.fetchall():
-                row["device_id"] = str(row["device_id"]).strip() if row["device_id"] else None
+        log(f"Attendance reduced: {len(groups) + 1} out-window group(s)")
 
-                row_nik = normalize_nik(row["nik"])
-                cache.add_attendance(row_nik, row["tanggal"], row)
+    return watermark
 
-        log(f"Attendance loaded: {len(cache.ATT_MAP)} keys")
+def reduce_taps(rows, mins, window):
+    """
+    Padanan Python seleksi reduced_attendance_query untuk satu NIK
+    (rows urut jam, mins sejajar): rn_in = tap pertama, rn_out = tap
+    terakhir di window (fallback tap terakhir). Untuk cek offline.
+    """
+    if not rows:
+        return [], []
+
+    out = len(rows) - 1
+    if window is not None:
+        # window detik [lo, hi) → menit [lo // 60, hi // 60)
+        lo, hi = window[0] // 60, window[1] // 60
+        for i in range(len(rows) - 1, -1, -1):
+            if lo <= mins[i] < hi:
+                out = i
+                break
+
+    picked = [0] if out == 0 else [0, out]
+    return [rows[i] for i in picked], [mins[i] for i in picked]
+
+def _jam_pulang(etl, code, date):
+    ctx = etl.get_pegawai_ctx(code)
+    _, jam_pulang, _, _, _ = etl.resolve_jadwal_from_cache(
+        code,
+        date,
+        ctx["unit_id"] if ctx else None,
+        ctx["sub_unit_id"] if ctx else None,
+    )
+    return jam_pulang
+
+def _classify_times(rows, mins, jam_pulang):
+    """(time IN, time OUT) hasil classify"""
+    raw_in, raw_out = classify_taps_sorted(rows, mins, None, jam_pulang)
+    return tuple(r["time"] if r else None for r in (raw_in, raw_out))
+
+def _classified_taps(etl, date):
+    """
+    {nik_code: (time IN, time OUT)} dari cache.
+    Device tidak dibandingkan: tap dengan jam sama persis di device
+    berbeda urutannya tidak deterministik di kedua jalur.
+    """
+    out = {}
+    for (code, d), rows in etl.att_map.items():
+        if d != date:
+            continue
+        out[code] = _classify_times(
+            rows, etl.get_attendance_minutes(code, d), _jam_pulang(etl, code, date)
+        )
+    return out
+
+def check_tap_reduction_offline(etl, date, without_jadwal=False, max_samples=10):
+    """
+    Parity seleksi reduced (reduce_taps, padanan SQL) vs classify semua
+    tap, dari cache yang sudah berisi tap lengkap (mis. snapshot golden).
+    without_jadwal=True: konfigurasi tanpa jam pulang sama sekali
+    (tanpa cabang CASE, default window None).
+    Return jumlah NIK yang berbeda.
+    """
+    if without_jadwal:
+        windows, default = {}, None
+    else:
+        windows, default = _out_windows_by_nik(etl, date)
+
+    mismatched = 0
+    for (code, d), rows in etl.att_map.items():
+        if d != date:
+            continue
+        mins = etl.get_attendance_minutes(code, d)
+        jam_pulang = None if without_jadwal else _jam_pulang(etl, code, date)
+        window = windows.get(etl.decode_id(code), default)
+
+        full = _classify_times(rows, mins, jam_pulang)
+        reduced = _classify_times(*reduce_taps(rows, mins, window), jam_pulang)
+        if reduced != full:
+            mismatched += 1
+            if mismatched <= max_samples:
+                log_warn(
+                    f"[TAP-REDUCE] nik={etl.decode_id(code)} "
+                    f"reduced={reduced} full={full}"
+                    + (" (without jadwal)" if without_jadwal else "")
+                )
+    return mismatched
+
+def check_tap_reduction(etl, att_db, date, nik=None, stats=None, max_samples=10):
+    """
+    Parity check: hasil classify dari jalur reduced vs jalur full-tap.
+    etl.att_map berisi hasil full-tap setelah check.
+    Return jumlah NIK yang berbeda.
+    """
+    etl.clear_attendance()
+    extract_attendance_reduced(etl, att_db, date, nik=nik, stats=stats)
+    reduced = _classified_taps(etl, date)
+
+    etl.clear_attendance()
+    watermark = extract_attendance(etl, att_db, date, nik=nik, stats=stats)
+    full = _classified_taps(etl, date)
+
+    mismatched = [
+        code for code in reduced.keys() | full.keys()
+        if reduced.get(code) != full.get(code)
+    ]
+
+    for code in mismatched[:max_samples]:
+        log_warn(
+            f"[TAP-REDUCE] nik={etl.decode_id(code)} "
+            f"reduced={reduced.get(code)} full={full.get(code)}"
+        )
+
+    if stats is not None:
+        stats["tap_reduce_mismatch"] = len(mismatched)
+
+    if mismatched:
+        log_warn(f"[TAP-REDUCE] parity FAILED: {len(mismatched)} of {len(full)} NIK differ")
+    else:
+        log(f"[TAP-REDUCE] parity OK ({len(full)} NIK)")
+
+    return watermark
 
 # =====================================================
 # PEGAWAI / HISTORY (MAIN_DB)
 # =====================================================
 
-def extract_pegawai_ctx(main_db, date, unit_id=None, sub_unit_id=None, nik=None, stats=None):
+def extract_pegawai_ctx(etl, main_db, date, unit_id=None, sub_unit_id=None, nik=None, stats=None, niks=None):
     """
     Load active pegawai histories for date
+    niks: filter daftar NIK (antrian recompute)
     """
     with time_block("extract_pegawai", stats):
         with main_db.cursor() as cur:
@@ -87,145 +511,241 @@ def extract_pegawai_ctx(main_db, date, unit_id=None, sub_unit_id=None, nik=None,
                 sql += " AND mp.nik = %s"
                 params.append(nik)
 
+            if niks:
+                sql += f" AND mp.nik IN ({_in_list(niks)})"
+                params.extend(niks)
+
             cur.execute(sql, params)
 
             for row in cur.fetchall():
-                cache.add_pegawai_ctx(row)
+                etl.add_pegawai_ctx(row)
 
-        log(f"Pegawai ctx loaded: {len(cache.PEGAWAI_CTX)}")
+        log(f"Pegawai ctx loaded: {len(etl.pegawai_ctx)}")
 
 # =====================================================
 # DEVICE (AUX_DB)
 # =====================================================
 
-def extract_devices(aux_db, stats=None):
+def extract_devices(etl, aux_db, stats=None, units=None):
     """
-    Load all devices into DEVICE_BY_UNIT
+    Load all devices into etl.device_by_unit
+    units: hanya device unit ini (unit tunggal, mode shard);
+           unit_id device bisa csv → FIND_IN_SET
     """
     with time_block("extract_devices", stats):
         with aux_db.cursor() as cur:
-            cur.execute("""
+            sql = """
                 SELECT id, unit_id, device_id, `desc`
                 FROM tbl_device
-            """)
+            """
+            params = []
+
+            if units:
+                sql += f"""
+                WHERE unit_id IN ({_in_list(units)})
+                   OR {" OR ".join(["FIND_IN_SET(%s, REPLACE(unit_id, ' ', ''))"] * len(units))}
+                """
+                params = [*units, *units]
+
+            cur.execute(sql, params)
             for row in cur.fetchall():
-                cache.add_device(row)
+                etl.add_device(row)
 
-        log(f"Devices loaded: {sum(len(v) for v in cache.DEVICE_BY_UNIT.values())}")
+        log(f"Devices loaded: {sum(len(v) for v in etl.device_by_unit.values())}")
 
 # =====================================================
 # ABSENT / DAILY NOTE (AUX_DB)
 # =====================================================
 
-def extract_absent(aux_db, date, stats=None):
+def extract_absent(etl, aux_db, date, stats=None, niks=None):
     with time_block("extract_absent", stats):
         with aux_db.cursor() as cur:
-            cur.execute("""
-                SELECT *
+            sql = f"""
+                SELECT
+                    {select_columns("tbl_absent")}
                 FROM tbl_absent
                 WHERE `date` = %s
-            """, [date])
+            """
+            params = [date]
+
+            if niks:
+                sql += f" AND nik IN ({_in_list(niks)})"
+                params.extend(niks)
+
+            cur.execute(sql, params)
 
             for row in cur.fetchall():
-                cache.add_absent(row)
+                etl.add_absent(row)
 
-        log(f"Absent loaded: {len(cache.ABSENT_MAP)}")
+        log(f"Absent loaded: {len(etl.absent_map)}")
 
 # =====================================================
 # TAPPING NOTE (AUX_DB)
 # =====================================================
 
-def extract_tapping(aux_db, date, stats=None):
+def extract_tapping(etl, aux_db, date, stats=None, niks=None):
     with time_block("extract_tapping", stats):
         with aux_db.cursor() as cur:
-            cur.execute("""
-                SELECT *
+            sql = f"""
+                SELECT
+                    {select_columns("tbl_absent_hourly")}
                 FROM tbl_absent_hourly
                 WHERE `date` = %s
-            """, [date])
+            """
+            params = [date]
+
+            if niks:
+                sql += f" AND nik IN ({_in_list(niks)})"
+                params.extend(niks)
+
+            cur.execute(sql, params)
 
             for row in cur.fetchall():
-                cache.add_tap(row)
+                etl.add_tap(row)
 
-        log(f"Tapping loaded: {len(cache.TAP_MAP)}")
+        log(f"Tapping loaded: {len(etl.tap_map)}")
 
 # =====================================================
 # JADWAL (MAIN_DB)
 # =====================================================
 
-def extract_jadwal(main_db, date, stats=None):
+def extract_jadwal(etl, main_db, date, stats=None, reference=True, niks=None, units=None, sub_units=None):
     """
     Load all relevant jadwal into cache (NO filtering per pegawai)
+    reference=False → hanya jadwal pegawai (sub unit / unit / dinas
+    dianggap sudah ada di cache, dipakai daemon)
+    niks / units / sub_units: filter mode shard (None = semua)
     """
     with time_block("extract_jadwal", stats):
         with main_db.cursor() as cur:
 
             # Jadwal Pegawai
-            cur.execute("""
+            sql = """
                 SELECT nik, date, jam_masuk, jam_pulang,
                     penalti_tidak_tap_in,
                     penalti_tidak_tap_out
                 FROM jadwal_pegawais
                 WHERE date = %s
-            """, [date])
-            for row in cur.fetchall():
-                cache.add_jadwal_pegawai(row)
+            """
+            params = [date]
 
-            # Jadwal Sub Unit
-            cur.execute("""
-                SELECT sub_unit_id, hari, jam_masuk, jam_pulang,
-                    penalti_tidak_tap_in,
-                    penalti_tidak_tap_out
-                FROM jadwal_sub_units
-                WHERE (start_date IS NULL OR start_date <= %s)
-                  AND (end_date IS NULL OR end_date >= %s)
-            """, [date, date])
-            for row in cur.fetchall():
-                cache.add_jadwal_sub_unit(row)
+            if niks:
+                sql += f" AND nik IN ({_in_list(niks)})"
+                params.extend(niks)
 
-            # Jadwal Unit
-            cur.execute("""
-                SELECT unit_id, hari, jam_masuk, jam_pulang,
-                    penalti_tidak_tap_in,
-                    penalti_tidak_tap_out                                
-                FROM jadwal_units
-                WHERE (start_date IS NULL OR start_date <= %s)
-                  AND (end_date IS NULL OR end_date >= %s)
-            """, [date, date])
+            cur.execute(sql, params)
             for row in cur.fetchall():
-                cache.add_jadwal_unit(row)
+                etl.add_jadwal_pegawai(row)
 
-            # Jadwal Dinas
-            cur.execute("""
-                SELECT hari, jam_masuk, jam_pulang,
-                    penalti_tidak_tap_in,
-                    penalti_tidak_tap_out
-                FROM jadwal_dinas
-                WHERE (start_date IS NULL OR start_date <= %s)
-                  AND (end_date IS NULL OR end_date >= %s)
-            """, [date, date])
-            for row in cur.fetchall():
-                cache.add_jadwal_dinas(row)
+            if reference:
+                _load_jadwal_reference(etl, cur, date, units, sub_units)
 
         log(
             f"Jadwal loaded: "
-            f"pegawai={len(cache.JADWAL_PEGAWAI)} "
-            f"sub_unit={len(cache.JADWAL_SUB_UNIT)} "
-            f"unit={len(cache.JADWAL_UNIT)} "
-            f"dinas={len(cache.JADWAL_DINAS)}"
+            f"pegawai={len(etl.jadwal_pegawai)} "
+            f"sub_unit={len(etl.jadwal_sub_unit)} "
+            f"unit={len(etl.jadwal_unit)} "
+            f"dinas={len(etl.jadwal_dinas)}"
         )
 
+def _load_jadwal_reference(etl, cur, date, units=None, sub_units=None):
+    """
+    Jadwal sub unit / unit / dinas (berlaku sepanjang hari)
+    units / sub_units: list id (mode shard); list kosong → tidak ada
+    """
+
+    # Jadwal Sub Unit
+    sql = """
+        SELECT sub_unit_id, hari, jam_masuk, jam_pulang,
+            penalti_tidak_tap_in,
+            penalti_tidak_tap_out
+        FROM jadwal_sub_units
+        WHERE (start_date IS NULL OR start_date <= %s)
+          AND (end_date IS NULL OR end_date >= %s)
+    """
+    params = [date, date]
+    if sub_units is not None:
+        sql += f" AND sub_unit_id IN ({_in_list(sub_units)})"
+        params.extend(sub_units)
+
+    if sub_units is None or sub_units:
+        cur.execute(sql, params)
+        for row in cur.fetchall():
+            etl.add_jadwal_sub_unit(row)
+
+    # Jadwal Unit
+    sql = """
+        SELECT unit_id, hari, jam_masuk, jam_pulang,
+            penalti_tidak_tap_in,
+            penalti_tidak_tap_out                                
+        FROM jadwal_units
+        WHERE (start_date IS NULL OR start_date <= %s)
+          AND (end_date IS NULL OR end_date >= %s)
+    """
+    params = [date, date]
+    if units is not None:
+        sql += f" AND unit_id IN ({_in_list(units)})"
+        params.extend(units)
+
+    if units is None or units:
+        cur.execute(sql, params)
+        for row in cur.fetchall():
+            etl.add_jadwal_unit(row)
+
+    # Jadwal Dinas
+    cur.execute("""
+        SELECT hari, jam_masuk, jam_pulang,
+            penalti_tidak_tap_in,
+            penalti_tidak_tap_out
+        FROM jadwal_dinas
+        WHERE (start_date IS NULL OR start_date <= %s)
+          AND (end_date IS NULL OR end_date >= %s)
+    """, [date, date])
+    for row in cur.fetchall():
+        etl.add_jadwal_dinas(row)
+
 # =====================================================
 # MASTER EXTRACTOR
 # =====================================================
 
-def extract_all(main_db, aux_db, att_db, date, unit_id=None, sub_unit_id=None, nik=None, stats=None):
+def extract_all(
+    etl,
+    main_db,
+    aux_db,
+    att_db,
+    date,
+    unit_id=None,
+    sub_unit_id=None,
+    nik=None,
+    stats=None,
+    tap_reduce=None,
+    att_slices=1,
+    connect_att=None,
+):
     """
     Run all extract steps for a date
+    tap_reduce: None (semua tap) | "server" (kandidat IN/OUT saja)
+                | "check" (server + parity check terhadap semua tap)
+    att_slices, connect_att: attendance paralel per slice jam
+    Return watermark attendance (lihat extract_attendance)
     """
-    extract_attendance(att_db, date, stats)
-    extract_pegawai_ctx(main_db, date, unit_id, sub_unit_id, nik, stats)
-    extract_devices(aux_db, stats)
-    extract_absent(aux_db, date, stats)
-    extract_tapping(aux_db, date, stats)
-    extract_jadwal(main_db, date, stats)
+    extract_pegawai_ctx(etl, main_db, date, unit_id, sub_unit_id, nik, stats)
+    extract_devices(etl, aux_db, stats)
+    extract_absent(etl, aux_db, date, stats)
+    extract_tapping(etl, aux_db, date, stats)
+    extract_jadwal(etl, main_db, date, stats)
+
+    # attendance terakhir: mode reduced butuh jadwal & konteks pegawai
+    if tap_reduce == "server":
+        return extract_attendance_reduced(etl, att_db, date, nik=nik, stats=stats)
+    if tap_reduce == "check":
+        return check_tap_reduction(etl, att_db, date, nik=nik, stats=stats)
+    return extract_attendance(
+        etl,
+        att_db,
+        date,
+        nik=nik,
+        stats=stats,
+        slices=att_slices,
+        connect=connect_att,
+    )
@@ -0,0 +1,164 @@
+# fingerprint.py
+# =====================================================
+# Fingerprint sumber per tanggal: skip tanggal yang tidak berubah
+# =====================================================
+#
+# Fingerprint = agregat murah per tabel sumber untuk satu tanggal
+# (COUNT + BIT_XOR(CRC32(kolom yang dibaca extract))) ditambah versi
+# transform (TRANSFORM_VERSION, RULE_TABLE, engine, toleransi dedupe).
+# Insert, update dan delete sama-sama mengubah fingerprint; tidak
+# bergantung pada kolom updated_at.
+#
+# Disimpan di MAIN DB setelah load sukses (run penuh satu tanggal,
+# tanpa filter unit / nik). Run berikutnya melewati tanggal dengan
+# fingerprint sama kecuali --force.
+
+import hashlib
+import json
+
+from utils import log
+from transform import TRANSFORM_VERSION, RULE_TABLE, OUT_WINDOW
+
+FINGERPRINT_TABLE = "absensi_etl_fingerprints"
+
+CREATE_FINGERPRINT_SQL = f"""
+CREATE TABLE IF NOT EXISTS {FINGERPRINT_TABLE} (
+    date        DATE NOT NULL PRIMARY KEY,
+    fingerprint CHAR(64) NOT NULL,
+    details     TEXT NULL,
+    loaded_at   DATETIME NOT NULL
+)
+"""
+
+# =====================================================
+# SOURCE AGGREGATES
+# =====================================================
+# source → (logical db, SQL, params(date)). Setiap SQL mengembalikan
+# satu row: n (COUNT) dan h (BIT_XOR CRC32).
+
+def _agg(cols):
+    # IFNULL: CONCAT_WS melewati NULL → (a, NULL, b) == (a, b, NULL) tanpa ini
+    values = ", ".join(f"IFNULL({c.strip()}, '<null>')" for c in cols.split(","))
+    return f"COUNT(*) AS n, BIT_XOR(CRC32(CONCAT_WS('|', {values}))) AS h"
+
+def _day(date):
+    return [f"{date} 00:00:00", f"{date} 23:59:59"]
+
+FINGERPRINT_SOURCES = {
+    "attendance": ("att", f"""
+        SELECT {_agg("nik, `time`, device_id, filename")}
+        FROM DB_ATT_tbl_attendance
+        WHERE `date` >= %s AND `date` < %s
+    """, _day),
+    "absent": ("aux", f"""
+        SELECT {_agg("nik, status, notes")}
+        FROM tbl_absent
+        WHERE `date` = %s
+    """, lambda d: [d]),
+    "tapping": ("aux", f"""
+        SELECT {_agg("nik, `hour`, tm, notes")}
+        FROM tbl_absent_hourly
+        WHERE `date` = %s
+    """, lambda d: [d]),
+    "jadwal_pegawai": ("main", f"""
+        SELECT {_agg("nik, jam_masuk, jam_pulang, penalti_tidak_tap_in, penalti_tidak_tap_out")}
+        FROM jadwal_pegawais
+        WHERE date = %s
+    """, lambda d: [d]),
+    "pegawai": ("main", f"""
+        SELECT {_agg("mp.nik, ph.id_unit, ph.id_sub_unit, ph.lokasi_kerja")}
+        FROM pegawai_histories ph
+        JOIN master_pegawais mp ON mp.id = ph.master_pegawai_id
+        WHERE ph.begin_date <= %s
+          AND (ph.end_date IS NULL OR ph.end_date >= %s)
+    """, lambda d: [d, d]),
+    "jadwal_sub_unit": ("main", f"""
+        SELECT {_agg("sub_unit_id, hari, jam_masuk, jam_pulang, penalti_tidak_tap_in, penalti_tidak_tap_out")}
+        FROM jadwal_sub_units
+        WHERE (start_date IS NULL OR start_date <= %s)
+          AND (end_date IS NULL OR end_date >= %s)
+    """, lambda d: [d, d]),
+    "jadwal_unit": ("main", f"""
+        SELECT {_agg("unit_id, hari, jam_masuk, jam_pulang, penalti_tidak_tap_in, penalti_tidak_tap_out")}
+        FROM jadwal_units
+        WHERE (start_date IS NULL OR start_date <= %s)
+          AND (end_date IS NULL OR end_date >= %s)
+    """, lambda d: [d, d]),
+    "jadwal_dinas": ("main", f"""
+        SELECT {_agg("hari, jam_masuk, jam_pulang, penalti_tidak_tap_in, penalti_tidak_tap_out")}
+        FROM jadwal_dinas
+        WHERE (start_date IS NULL OR start_date <= %s)
+          AND (end_date IS NULL OR end_date >= %s)
+    """, lambda d: [d, d]),
+    # device tidak berperiode: perubahan berlaku untuk semua tanggal
+    "devices": ("aux", f"""
+        SELECT {_agg("id, unit_id, device_id, `desc`")}
+        FROM tbl_device
+    """, lambda d: []),
+}
+
+# =====================================================
+# FINGERPRINT
+# =====================================================
+
+def transform_version(engine, tap_dedupe_seconds):
+    """Hash konfigurasi transform yang mempengaruhi output"""
+    h = hashlib.sha256()
+    h.update(repr((TRANSFORM_VERSION, engine, OUT_WINDOW, tap_dedupe_seconds)).encode())
+    h.update(repr(RULE_TABLE).encode())
+    return h.hexdigest()[:16]
+
+def compute_fingerprint(dbs, date, engine, tap_dedupe_seconds):
+    """
+    dbs: {"att": conn, "main": conn, "aux": conn}
+    Return (fingerprint hex, details dict)
+    """
+    details = {"transform": transform_version(engine, tap_dedupe_seconds)}
+
+    for source, (db_name, sql, params) in FINGERPRINT_SOURCES.items():
+        with dbs[db_name].cursor() as cur:
+            cur.execute(sql, params(date))
+            row = cur.fetchone()
+        details[source] = [int(row["n"] or 0), int(row["h"] or 0)]
+
+    payload = json.dumps(details, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest(), details
+
+def ensure_table(main_db):
+    with main_db.cursor() as cur:
+        cur.execute(CREATE_FINGERPRINT_SQL)
+    main_db.commit()
+
+def load_fingerprint(main_db, date):
+    """Return (fingerprint, details) load sukses terakhir, atau (None, None)"""
+    with main_db.cursor() as cur:
+        cur.execute(
+            f"SELECT fingerprint, details FROM {FINGERPRINT_TABLE} WHERE date = %s",
+            [date],
+        )
+        row = cur.fetchone()
+    main_db.commit()
+    if not row:
+        return None, None
+    return row["fingerprint"], json.loads(row["details"]) if row["details"] else None
+
+def save_fingerprint(main_db, date, fingerprint, details):
+    with main_db.cursor() as cur:
+        cur.execute(f"""
+            INSERT INTO {FINGERPRINT_TABLE} (date, fingerprint, details, loaded_at)
+            VALUES (%s, %s, %s, NOW())
+            ON DUPLICATE KEY UPDATE
+                fingerprint = VALUES(fingerprint),
+                details = VALUES(details),
+                loaded_at = VALUES(loaded_at)
+        """, [date, fingerprint, json.dumps(details, sort_keys=True)])
+    main_db.commit()
+
+def changed_sources(old, new):
+    """Nama bagian fingerprint yang berbeda (untuk log)"""
+    if not old:
+        return ["(no previous load)"]
+    return sorted(k for k in old.keys() | new.keys() if old.get(k) != new.get(k))
+
+def log_fingerprint_change(date, old, new):
+    log(f"[FINGERPRINT] {date} changed: {', '.join(changed_sources(old, new))}")
@@ -0,0 +1,251 @@
+# golden.py
+# =====================================================
+# Golden-file regression: snapshot cache hasil extract,
+# replay offline lewat engine transform (TANPA DB)
+# =====================================================
+#
+# Capture (butuh DB):
+#   python main.py --from 2026-10-05 --dry-run \
+#       --capture-golden golden/{date}.golden.xz
+#
+# Replay (offline):
+#   python golden.py golden/2026-10-05.golden.xz --repeat 5
+#   python golden.py golden/*.golden.xz --engine fast --update
+#
+# Setiap run juga mengecek RULE_TABLE vs fungsi rule (exhaustive):
+#   python golden.py
+#
+# Replay juga mengecek seleksi --tap-reduce server (padanan Python)
+# terhadap classify semua tap snapshot: dengan jadwal snapshot dan
+# tanpa jam pulang sama sekali (default window None).
+
+import argparse
+import json
+import lzma
+import pickle
+import sys
+import time
+from datetime import datetime
+
+from utils import log, log_warn, log_error
+from transform import get_engine, iter_target_niks, check_rule_tables
+from compare import diff_row
+from extract import check_tap_reduction_offline
+from cache import EtlContext
+
+SNAPSHOT_VERSION = 1
+
+# Map EtlContext yang di-snapshot (selain ID dictionary)
+# key snapshot → atribut context (key lama dipertahankan, format v1)
+CACHE_MAPS = {
+    "ATT_MAP": "att_map",
+    "PEGAWAI_CTX": "pegawai_ctx",
+    "DEVICE_BY_UNIT": "device_by_unit",
+    "ABSENT_MAP": "absent_map",
+    "TAP_MAP": "tap_map",
+    "JADWAL_PEGAWAI": "jadwal_pegawai",
+    "JADWAL_SUB_UNIT": "jadwal_sub_unit",
+    "JADWAL_UNIT": "jadwal_unit",
+    "JADWAL_DINAS": "jadwal_dinas",
+}
+
+# =====================================================
+# CAPTURE
+# =====================================================
+
+def capture(etl, path, date, engine="fast"):
+    """
+    Simpan state context etl + golden rows (output engine)
+    ke file pickle terkompresi xz.
+    """
+    process = get_engine(engine)
+    rows = [process(etl, code, date) for code in iter_target_niks(etl)]
+
+    snapshot = {
+        "version": SNAPSHOT_VERSION,
+        "date": date,
+        "captured_at": datetime.now(),
+        "engine": engine,
+        "id_name": list(etl.id_name),
+        "maps": {key: dict(getattr(etl, attr)) for key, attr in CACHE_MAPS.items()},
+        "golden": sorted(rows, key=lambda r: r["nik"]),
+    }
+
+    with lzma.open(path, "wb", preset=6) as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    log(f"Golden captured: {path} ({len(rows)} rows)")
+
+def load_snapshot(path):
+    """
+    Baca snapshot dan pulihkan ke EtlContext baru.
+    Return (snapshot dict, etl)
+    """
+    with lzma.open(path, "rb") as f:
+        snapshot = pickle.load(f)
+
+    if snapshot.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(
+            f"Unsupported golden snapshot version: {snapshot.get('version')} ({path})"
+        )
+
+    etl = EtlContext()
+    etl.id_name[:] = snapshot["id_name"]
+    etl.id_code.update({name: code for code, name in enumerate(etl.id_name)})
+
+    for key, attr in CACHE_MAPS.items():
+        getattr(etl, attr).update(snapshot["maps"][key])
+
+    # att_min turunan dari att_map, tidak disimpan di snapshot
+    etl.rebuild_attendance_index()
+
+    return snapshot, etl
+
+def save_golden(path, snapshot, rows):
+    """Tulis ulang golden rows (--update)"""
+    snapshot["golden"] = sorted(rows, key=lambda r: r["nik"])
+    snapshot["captured_at"] = datetime.now()
+    with lzma.open(path, "wb", preset=6) as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+# =====================================================
+# REPLAY
+# =====================================================
+
+def replay(path, engine="fast", repeat=1, max_samples=10):
+    """
+    Replay snapshot lewat engine, bandingkan dengan golden rows.
+    Return report dict (mismatch + throughput terbaik dari N repeat).
+    """
+    snapshot, etl = load_snapshot(path)
+    date = snapshot["date"]
+    process = get_engine(engine)
+    niks = list(iter_target_niks(etl))
+
+    best_ms = None
+    rows = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        rows = [process(etl, code, date) for code in niks]
+        elapsed = (time.perf_counter() - start) * 1000
+        best_ms = elapsed if best_ms is None else min(best_ms, elapsed)
+
+    golden = {r["nik"]: r for r in snapshot["golden"]}
+    actual = {r["nik"]: r for r in rows}
+
+    missing = sorted(golden.keys() - actual.keys())
+    extra = sorted(actual.keys() - golden.keys())
+
+    mismatched = 0
+    samples = []
+    for nik in sorted(golden.keys() & actual.keys()):
+        cols = diff_row(golden[nik], actual[nik])
+        if not cols:
+            continue
+        mismatched += 1
+        if len(samples) < max_samples:
+            samples.append({
+                "nik": nik,
+                "diff": {c: (golden[nik].get(c), actual[nik].get(c)) for c in sorted(cols)},
+            })
+
+    # seleksi tap reduced harus memberi IN / OUT sama dengan tap lengkap
+    tap_reduce_mismatch = (
+        check_tap_reduction_offline(etl, date, max_samples=max_samples) +
+        check_tap_reduction_offline(etl, date, without_jadwal=True, max_samples=max_samples)
+    )
+
+    return {
+        "file": path,
+        "date": date,
+        "engine": engine,
+        "rows": len(rows),
+        "best_ms": round(best_ms, 2),
+        "rows_per_sec": round(len(rows) / (best_ms / 1000), 1) if best_ms else None,
+        "mismatched": mismatched,
+        "missing": missing,
+        "extra": extra,
+        "samples": samples,
+        "tap_reduce_mismatch": tap_reduce_mismatch,
+        "ok": not (mismatched or missing or extra or tap_reduce_mismatch),
+    }, snapshot, rows
+
+def append_history(path, report):
+    """Catat throughput replay (JSON lines) untuk trend antar rilis"""
+    entry = {
+        "at": datetime.now(),
+        "file": report["file"],
+        "date": report["date"],
+        "engine": report["engine"],
+        "rows": report["rows"],
+        "best_ms": report["best_ms"],
+        "rows_per_sec": report["rows_per_sec"],
+        "ok": report["ok"],
+    }
+    with open(path, "a") as f:
+        f.write(json.dumps(entry, default=str) + "\n")
+
+# =====================================================
+# CLI
+# =====================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Replay golden snapshot absensi (offline)"
+    )
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--engine", default="fast")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--history", default="golden_history.jsonl",
+                        help="file JSON lines untuk trend rows/sec")
+    parser.add_argument("--update", action="store_true",
+                        help="tulis ulang golden rows dengan output engine")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    failed = 0
+
+    mismatches = check_rule_tables()
+    if mismatches:
+        for inputs, expected, actual in mismatches[:10]:
+            log_warn(f"[RULES] {inputs} expected={expected} table={actual}")
+        log_error(f"RULE_TABLE mismatch: {len(mismatches)} state(s)")
+        sys.exit(1)
+    log("[RULES] RULE_TABLE matches rule functions for all states")
+
+    for path in args.files:
+        report, snapshot, rows = replay(path, args.engine, args.repeat)
+
+        log(
+            f"[GOLDEN] {path} date={report['date']} engine={report['engine']} "
+            f"rows={report['rows']} best={report['best_ms']}ms "
+            f"({report['rows_per_sec']} rows/s) "
+            f"{'OK' if report['ok'] else 'MISMATCH'}"
+        )
+
+        if not report["ok"]:
+            log_warn(
+                f"[GOLDEN] mismatched={report['mismatched']} "
+                f"missing={len(report['missing'])} extra={len(report['extra'])} "
+                f"tap_reduce_mismatch={report['tap_reduce_mismatch']}"
+            )
+            for s in report["samples"]:
+                log_warn(
+                    f"[GOLDEN] nik={s['nik']} "
+                    + " ".join(f"{c}: {g!r} -> {a!r}" for c, (g, a) in s["diff"].items())
+                )
+
+        if args.update:
+            save_golden(path, snapshot, rows)
+            log(f"[GOLDEN] updated {path}")
+        elif not report["ok"]:
+            failed += 1
+
+        if args.history:
+            append_history(args.history, report)
+
+    if failed:
+        log_error(f"{failed} golden file(s) mismatched")
+        sys.exit(1)
+    sys.exit(0)
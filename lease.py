@@ -0,0 +1,346 @@
+# lease.py
+# =====================================================
+# Distributed mode: work item (date, unit) dengan lease di MySQL
+# =====================================================
+#
+# Tanpa coordinator: setiap node menjalankan
+#
+#   python main.py --from 2026-01-01 --to 2026-12-31 --distributed backfill-2026
+#
+# Node pertama (dan berikutnya, idempotent) mengisi tabel work item
+# untuk run_id tersebut. Setiap node lalu claim satu item
+# (SELECT ... FOR UPDATE SKIP LOCKED; fallback UPDATE ... LIMIT 1 untuk
+# MySQL < 8 / MariaDB < 10.6), memperpanjang lease lewat thread heartbeat,
+# dan menandai item done setelah load. Item dengan lease kedaluwarsa
+# (node mati) di-claim ulang node lain. Tambah node = tambah throughput.
+#
+# Uji lokal: jalankan 2-3 proses dengan .env yang menunjuk ke satu
+# MySQL/MariaDB yang sama, matikan salah satu (kill -9) di tengah run,
+# item-nya selesai oleh node lain setelah --lease-seconds.
+
+import os
+import socket
+import threading
+import time
+import uuid
+
+from utils import log, log_warn, log_error
+from db import ProgrammingError
+from shard import ORPHAN
+
+WORK_TABLE = "absensi_etl_work"
+
+CREATE_WORK_SQL = f"""
+CREATE TABLE IF NOT EXISTS {WORK_TABLE} (
+    run_id       VARCHAR(64) NOT NULL,
+    date         DATE NOT NULL,
+    unit_id      VARCHAR(64) NOT NULL,
+    status       VARCHAR(16) NOT NULL DEFAULT 'pending',
+    owner        VARCHAR(128) NULL,
+    token        CHAR(32) NULL,
+    lease_until  DATETIME NULL,
+    attempts     INT NOT NULL DEFAULT 0,
+    error        TEXT NULL,
+    updated_at   DATETIME NOT NULL,
+    PRIMARY KEY (run_id, date, unit_id),
+    KEY idx_claim (run_id, status, lease_until),
+    KEY idx_token (token)
+)
+"""
+
+# item gagal sebanyak ini → status failed (tidak di-claim lagi)
+MAX_ATTEMPTS = 3
+
+ER_PARSE_ERROR = 1064
+
+# item claimable: pending, atau running dengan lease kedaluwarsa yang
+# masih punya sisa attempt (node mati → attempt tetap dihitung)
+CLAIMABLE = (
+    "(status = 'pending' OR "
+    f"(status = 'running' AND lease_until < NOW() AND attempts < {MAX_ATTEMPTS}))"
+)
+
+def node_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+# =====================================================
+# SEED
+# =====================================================
+
+def ensure_table(conn):
+    with conn.cursor() as cur:
+        cur.execute(CREATE_WORK_SQL)
+    conn.commit()
+
+def discover_units(main_db, date_from, date_to):
+    """id_unit berbeda dari history yang aktif di rentang tanggal"""
+    with main_db.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT TRIM(id_unit) AS unit_id
+            FROM pegawai_histories
+            WHERE id_unit IS NOT NULL
+              AND begin_date <= %s
+              AND (end_date IS NULL OR end_date >= %s)
+            ORDER BY unit_id
+        """, [date_to, date_from])
+        units = [str(r["unit_id"]) for r in cur.fetchall() if str(r["unit_id"]).strip()]
+    main_db.commit()
+    return units
+
+def seed(conn, run_id, dates, units):
+    """Isi work item (date, unit); INSERT IGNORE → aman dijalankan semua node"""
+    rows = [(run_id, d, u) for d in dates for u in units]
+    with conn.cursor() as cur:
+        for i in range(0, len(rows), 1000):
+            cur.executemany(f"""
+                INSERT IGNORE INTO {WORK_TABLE} (run_id, date, unit_id, status, updated_at)
+                VALUES (%s, %s, %s, 'pending', NOW())
+            """, rows[i:i + 1000])
+    conn.commit()
+    return len(rows)
+
+def progress(conn, run_id):
+    """Return {status: count} untuk run_id"""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT status, COUNT(*) AS n
+            FROM {WORK_TABLE}
+            WHERE run_id = %s
+            GROUP BY status
+        """, [run_id])
+        out = {r["status"]: r["n"] for r in cur.fetchall()}
+    conn.commit()
+    return out
+
+# =====================================================
+# CLAIM / HEARTBEAT / COMPLETE
+# =====================================================
+
+class LeaseClient:
+    """Operasi lease di satu koneksi khusus (terpisah dari koneksi load)"""
+
+    def __init__(self, conn, run_id, lease_seconds=300, owner=None):
+        self.conn = conn
+        self.run_id = run_id
+        self.lease_seconds = lease_seconds
+        self.owner = owner or node_name()
+        self.skip_locked = True
+
+    def claim(self):
+        """Return item dict (date, unit_id, token, attempts) atau None"""
+        token = uuid.uuid4().hex
+        try:
+            self.expire_exhausted()
+            if self.skip_locked:
+                try:
+                    return self._claim_skip_locked(token)
+                except ProgrammingError as e:
+                    if not e.args or e.args[0] != ER_PARSE_ERROR:
+                        raise
+                    self.conn.rollback()
+                    self.skip_locked = False
+                    log_warn("[LEASE] SKIP LOCKED not supported, using UPDATE ... LIMIT 1 claim")
+            return self._claim_update(token)
+        except Exception:
+            self.conn.rollback()
+            raise
+
+    def expire_exhausted(self):
+        """
+        Item running dengan lease kedaluwarsa dan attempt habis (mis. item
+        yang membuat worker crash / OOM) → failed, terlihat di progress()
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {WORK_TABLE}
+                SET status = 'failed', lease_until = NULL,
+                    error = CONCAT('lease expired after ', attempts, ' attempt(s), last owner ', COALESCE(owner, '?')),
+                    updated_at = NOW()
+                WHERE run_id = %s AND status = 'running'
+                  AND lease_until < NOW() AND attempts >= %s
+            """, [self.run_id, MAX_ATTEMPTS])
+            n = cur.rowcount
+        self.conn.commit()
+        if n:
+            log_warn(f"[LEASE] run={self.run_id} {n} item(s) failed: lease expired after {MAX_ATTEMPTS} attempt(s)")
+        return n
+
+    def _claim_skip_locked(self, token):
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT date, unit_id, attempts
+                FROM {WORK_TABLE}
+                WHERE run_id = %s AND {CLAIMABLE}
+                ORDER BY date, unit_id
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            """, [self.run_id])
+            row = cur.fetchone()
+            if not row:
+                self.conn.commit()
+                return None
+
+            cur.execute(f"""
+                UPDATE {WORK_TABLE}
+                SET status = 'running', owner = %s, token = %s,
+                    lease_until = NOW() + INTERVAL %s SECOND,
+                    attempts = attempts + 1, updated_at = NOW()
+                WHERE run_id = %s AND date = %s AND unit_id = %s
+            """, [self.owner, token, self.lease_seconds, self.run_id, row["date"], row["unit_id"]])
+        self.conn.commit()
+        return {**row, "token": token, "attempts": row["attempts"] + 1}
+
+    def _claim_update(self, token):
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {WORK_TABLE}
+                SET status = 'running', owner = %s, token = %s,
+                    lease_until = NOW() + INTERVAL %s SECOND,
+                    attempts = attempts + 1, updated_at = NOW()
+                WHERE run_id = %s AND {CLAIMABLE}
+                ORDER BY date, unit_id
+                LIMIT 1
+            """, [self.owner, token, self.lease_seconds, self.run_id])
+            claimed = cur.rowcount
+            row = None
+            if claimed:
+                cur.execute(f"""
+                    SELECT date, unit_id, attempts
+                    FROM {WORK_TABLE}
+                    WHERE token = %s
+                """, [token])
+                row = cur.fetchone()
+        self.conn.commit()
+        return {**row, "token": token} if row else None
+
+    def heartbeat(self, token):
+        """Perpanjang lease. Return False jika lease sudah diambil node lain"""
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {WORK_TABLE}
+                SET lease_until = NOW() + INTERVAL %s SECOND, updated_at = NOW()
+                WHERE token = %s AND status = 'running'
+            """, [self.lease_seconds, token])
+            ok = cur.rowcount == 1
+            if not ok:
+                # affected rows 0 juga terjadi jika nilai tidak berubah (detik sama)
+                cur.execute(
+                    f"SELECT 1 AS ok FROM {WORK_TABLE} WHERE token = %s AND status = 'running'",
+                    [token],
+                )
+                ok = cur.fetchone() is not None
+        self.conn.commit()
+        return ok
+
+    def complete(self, token):
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {WORK_TABLE}
+                SET status = 'done', lease_until = NULL, error = NULL, updated_at = NOW()
+                WHERE token = %s AND status = 'running'
+            """, [token])
+            ok = cur.rowcount == 1
+        self.conn.commit()
+        return ok
+
+    def fail(self, token, error):
+        with self.conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {WORK_TABLE}
+                SET status = IF(attempts >= %s, 'failed', 'pending'),
+                    lease_until = NULL, error = %s, updated_at = NOW()
+                WHERE token = %s AND status = 'running'
+            """, [MAX_ATTEMPTS, str(error)[:2000], token])
+        self.conn.commit()
+
+class Heartbeat:
+    """Thread yang memperpanjang lease setiap lease_seconds / 3"""
+
+    def __init__(self, client, token):
+        self.client = client
+        self.token = token
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        interval = max(1.0, self.client.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            try:
+                if not self.client.heartbeat(self.token):
+                    self.lost = True
+                    log_warn(f"[LEASE] lease lost ({self.token})")
+                    return
+            except Exception as e:
+                log_warn(f"[LEASE] heartbeat failed: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+# =====================================================
+# WORKER LOOP
+# =====================================================
+
+def run_distributed(router, etl, dates, args, run_item):
+    """
+    Seed + claim loop untuk args.distributed (run_id).
+    run_item(etl, date, unit_id, still_owned) menjalankan ETL satu item
+    (lihat main.py, shard.run_unit); still_owned() False → load dilewati.
+    unit_id ORPHAN = NIK yang tidak dimiliki unit mana pun.
+    Berhenti saat tidak ada item pending / running tersisa.
+    """
+    connect = router.writer_factory()
+    lease_conn = connect()
+    heartbeat_conn = connect()
+
+    try:
+        ensure_table(lease_conn)
+
+        if args.units:
+            units = [u.strip() for u in args.units.split(",") if u.strip()]
+        else:
+            # + item orphan per tanggal: NIK bertap tanpa history / tanpa unit
+            units = discover_units(router.primary("main"), min(dates), max(dates)) + [ORPHAN]
+        n = seed(lease_conn, args.distributed, dates, units)
+        log(f"[LEASE] run={args.distributed} seeded {n} item(s) ({len(dates)} date x {len(units)} unit)")
+
+        client = LeaseClient(lease_conn, args.distributed, args.lease_seconds)
+        hb_client = LeaseClient(heartbeat_conn, args.distributed, args.lease_seconds, client.owner)
+
+        done = 0
+        while True:
+            item = client.claim()
+
+            if item is None:
+                state = progress(lease_conn, args.distributed)
+                if not state.get("running"):
+                    log(f"[LEASE] run={args.distributed} finished on {client.owner}: {state}")
+                    break
+                # item lain masih berjalan, bisa kedaluwarsa → tunggu
+                time.sleep(min(30, max(1, args.lease_seconds // 4)))
+                continue
+
+            date, unit_id, token = item["date"], item["unit_id"], item["token"]
+            log(f"[LEASE] claimed {date} unit={unit_id} attempt={item['attempts']}")
+
+            try:
+                with Heartbeat(hb_client, token) as hb:
+                    etl.reset()
+                    run_item(etl, date, unit_id, lambda: not hb.lost)
+                if hb.lost or not client.complete(token):
+                    log_warn(f"[LEASE] {date} unit={unit_id} lease lost, left to new owner")
+                else:
+                    done += 1
+            except Exception as e:
+                log_error(f"[LEASE] {date} unit={unit_id} failed: {e}")
+                client.fail(token, e)
+
+        log(f"[LEASE] {client.owner} completed {done} item(s)")
+    finally:
+        lease_conn.close()
+        heartbeat_conn.close()
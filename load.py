@@ -3,7 +3,14 @@
 # Load layer: bulk upsert into absensi_summaries
 # =====================================================
 
-from utils import log, time_block, chunked
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import log, log_warn, time_block
+from db import OperationalError
+from spill import RowSpool
+import progress
+import recap
 
 # =====================================================
 # SQL TEMPLATE
@@ -122,39 +129,498 @@ ON DUPLICATE KEY UPDATE
 
 """
 
+# =====================================================
+# ADAPTIVE BATCH SIZING
+# =====================================================
+
+MIN_BATCH_SIZE = 50
+MAX_BATCH_SIZE = 10000
+
+# batch lebih lama dari ini dianggap menahan lock terlalu lama → shrink
+MAX_BATCH_SECONDS = 5.0
+
+# throughput harus naik >= 10% agar batch terus diperbesar
+GROW_MIN_GAIN = 1.10
+
+# sisakan ruang untuk template SQL / escaping
+PACKET_SAFETY = 0.8
+
+ER_LOCK_WAIT_TIMEOUT = 1205
+ER_LOCK_DEADLOCK = 1213
+
+BATCH_SAVEPOINT = "absensi_batch"
+
+def get_max_allowed_packet(main_db):
+    with main_db.cursor() as cur:
+        cur.execute("SELECT @@max_allowed_packet AS max_allowed_packet")
+        row = cur.fetchone()
+    return int(row["max_allowed_packet"]) if row else None
+
+def get_rollback_on_timeout(main_db):
+    """
+    innodb_rollback_on_timeout=ON → lock wait timeout membatalkan
+    seluruh transaksi, bukan hanya statement terakhir
+    """
+    with main_db.cursor() as cur:
+        cur.execute("SELECT @@innodb_rollback_on_timeout AS rollback_on_timeout")
+        row = cur.fetchone()
+    # tidak diketahui → anggap ON (tanpa retry di dalam transaksi)
+    return bool(int(row["rollback_on_timeout"])) if row else True
+
+def estimate_row_bytes(rows, sample=100):
+    """Perkiraan ukuran literal SQL per row (sampel awal)"""
+    sample_rows = rows[:sample]
+    if not sample_rows:
+        return 0
+    total = sum(
+        sum(len(str(v)) + 4 for v in r.values())
+        for r in sample_rows
+    )
+    return total // len(sample_rows) + 8
+
+class BatchTuner:
+    """
+    Auto-tune ukuran batch per run:
+    - grow x2 selama rows/sec naik >= GROW_MIN_GAIN
+    - plateau → kunci di ukuran terbaik
+    - lock wait timeout / batch terlalu lama → shrink /2
+    - tidak pernah melebihi batas max_allowed_packet
+    """
+
+    def __init__(self, initial, max_size=MAX_BATCH_SIZE, fixed=False):
+        self.max_size = max(MIN_BATCH_SIZE, max_size)
+        self.size = max(MIN_BATCH_SIZE, min(initial, self.max_size))
+        self.fixed = fixed
+        self.growing = not fixed
+        self.best_rps = 0.0
+        self.best_size = self.size
+
+    def record(self, rows, seconds):
+        rps = rows / seconds if seconds > 0 else float("inf")
+
+        if self.fixed:
+            return rps
+
+        if seconds > MAX_BATCH_SECONDS:
+            self.shrink(f"batch took {seconds:.1f}s")
+            return rps
+
+        # batch terakhir (sisa) lebih kecil → tidak representatif
+        if not self.growing or rows < self.size:
+            return rps
+
+        if rps >= self.best_rps * GROW_MIN_GAIN:
+            self.best_rps = rps
+            self.best_size = self.size
+            if self.size < self.max_size:
+                self.size = min(self.size * 2, self.max_size)
+            else:
+                self.growing = False
+        else:
+            # plateau
+            self.size = self.best_size
+            self.growing = False
+            log(f"[BATCH] plateau, batch size settled at {self.size}")
+
+        return rps
+
+    def shrink(self, reason):
+        old = self.size
+        self.size = max(MIN_BATCH_SIZE, self.size // 2)
+        self.best_size = min(self.best_size, self.size)
+        self.growing = False
+        log_warn(f"[BATCH] {reason}, batch size {old} -> {self.size}")
+        return self.size < old
+
 # =====================================================
 # BULK UPSERT
 # =====================================================
 
-def bulk_upsert(main_db, rows, batch_size=500, stats=None):
+def bulk_upsert(main_db, rows, batch_size=500, stats=None, auto_tune=True, recap_delta=None):
     """
     rows: list[dict] from transform layer
+    batch_size: ukuran awal (auto_tune) atau tetap (auto_tune=False)
+    recap_delta: RecapDelta yang ditambah delta rekap bulanan per batch
+    (diterapkan pemanggil sebelum commit)
+
+    Lock wait timeout: batch dibatalkan lewat SAVEPOINT (executemany
+    bisa terdiri dari beberapa statement) lalu diulang lebih kecil.
+    Hanya jika innodb_rollback_on_timeout=OFF; jika ON transaksi sudah
+    di-rollback server → error diteruskan ke pemanggil.
     """
     if not rows:
         return
 
     with time_block("load_upsert", stats):
+        retry_in_trx = not get_rollback_on_timeout(main_db)
+        max_packet = get_max_allowed_packet(main_db)
+        row_bytes = estimate_row_bytes(rows)
+
+        max_size = MAX_BATCH_SIZE
+        if max_packet and row_bytes:
+            max_size = min(max_size, int(max_packet * PACKET_SAFETY) // row_bytes)
+
+        tuner = BatchTuner(batch_size, max_size=max_size, fixed=not auto_tune)
+
+        log(
+            f"[BATCH] start size={tuner.size} max={tuner.max_size} "
+            f"auto={auto_tune} max_allowed_packet={max_packet} row~{row_bytes}B"
+        )
+
+        batches = 0
         with main_db.cursor() as cur:
-            for batch in chunked(rows, batch_size):
-                cur.executemany(UPSERT_SQL, batch)
+            if max_packet:
+                # cegah driver memecah statement di bawah batas server
+                cur.max_stmt_length = int(max_packet * PACKET_SAFETY)
+
+            i = 0
+            while i < len(rows):
+                batch = rows[i:i + tuner.size]
+
+                start = time.perf_counter()
+                if retry_in_trx:
+                    cur.execute(f"SAVEPOINT {BATCH_SAVEPOINT}")
+                try:
+                    delta = recap.upsert_delta(cur, batch) if recap_delta is not None else None
+                    cur.executemany(UPSERT_SQL, batch)
+                except OperationalError as e:
+                    if not (e.args and e.args[0] == ER_LOCK_WAIT_TIMEOUT):
+                        raise
+                    if not retry_in_trx:
+                        log_warn("[BATCH] lock wait timeout with innodb_rollback_on_timeout=ON, not retrying")
+                        raise
+                    # batalkan sisa batch yang sempat tertulis → row lama / delta rekap bersih
+                    cur.execute(f"ROLLBACK TO SAVEPOINT {BATCH_SAVEPOINT}")
+                    if tuner.shrink("lock wait timeout"):
+                        continue
+                    raise
+                elapsed = time.perf_counter() - start
+                # delta hanya dari batch yang selesai utuh
+                if delta is not None:
+                    recap_delta.merge(delta)
+
+                size = tuner.size
+                rps = tuner.record(len(batch), elapsed)
+                batches += 1
+                i += len(batch)
+                progress.count("upserted", len(batch))
 
-        log(f"Upserted rows: {len(rows)}")
+                log(
+                    f"[BATCH] #{batches} rows={len(batch)} "
+                    f"{elapsed * 1000:.1f}ms {rps:.0f} rows/s"
+                    + (f" next={tuner.size}" if tuner.size != size else "")
+                )
+
+        if stats is not None:
+            stats["load_batches"] = batches
+            stats["load_batch_size"] = tuner.size
+
+        log(f"Upserted rows: {len(rows)} (batches={batches}, final batch size={tuner.size})")
+
+# =====================================================
+# PARALLEL UPSERT (MULTI CONNECTION)
+# =====================================================
+# Row diurutkan per primary key (nik, date) lalu dibagi menjadi shard
+# kontigu yang tidak saling overlap → setiap koneksi mengunci range
+# key sendiri, dengan urutan yang sama (menghindari gap-lock deadlock).
+# Commit per batch: retry deadlock / lock wait cukup mengulang batch itu.
+
+RETRY_ERRORS = (ER_LOCK_DEADLOCK, ER_LOCK_WAIT_TIMEOUT)
+MAX_BATCH_RETRIES = 5
+RETRY_BACKOFF = 0.2
+
+def row_key(row):
+    return (str(row["nik"]), str(row["date"]))
+
+def shard_rows(rows, shards):
+    """Bagi rows (urut key) menjadi <= shards range kontigu"""
+    ordered = sorted(rows, key=row_key)
+    size = -(-len(ordered) // shards)
+    return [ordered[i:i + size] for i in range(0, len(ordered), size)]
+
+def _upsert_shard(connect, shard_no, rows, batch_size, max_stmt_length, with_recap=False):
+    """
+    Tulis satu shard di koneksi sendiri. Return (batches, retries, ms)
+    with_recap: delta rekap bulanan di-commit bersama setiap batch
+    """
+    start = time.perf_counter()
+    batches = retries = 0
+
+    db = connect()
+    try:
+        with db.cursor() as cur:
+            if max_stmt_length:
+                cur.max_stmt_length = max_stmt_length
+
+            for i in range(0, len(rows), batch_size):
+                batch = rows[i:i + batch_size]
+                attempt = 0
+                while True:
+                    try:
+                        db.begin()
+                        delta = recap.upsert_delta(cur, batch) if with_recap else None
+                        cur.executemany(UPSERT_SQL, batch)
+                        if delta is not None:
+                            delta.apply(cur)
+                        db.commit()
+                        progress.count("upserted", len(batch))
+                        break
+                    except OperationalError as e:
+                        db.rollback()
+                        code = e.args[0] if e.args else None
+                        if code not in RETRY_ERRORS or attempt >= MAX_BATCH_RETRIES:
+                            raise
+                        attempt += 1
+                        retries += 1
+                        log_warn(
+                            f"[PARALLEL] shard {shard_no} batch {i // batch_size + 1} "
+                            f"error {code}, retry {attempt}/{MAX_BATCH_RETRIES}"
+                        )
+                        time.sleep(RETRY_BACKOFF * attempt)
+                batches += 1
+    finally:
+        db.close()
+
+    return batches, retries, round((time.perf_counter() - start) * 1000, 2)
+
+def parallel_upsert(main_db, connect, rows, workers, batch_size=500, stats=None, with_recap=False):
+    """
+    Upsert rows lewat `workers` koneksi baru (connect()) sekaligus.
+    main_db hanya dipakai membaca max_allowed_packet.
+    Tidak atomik per tanggal: setiap batch di-commit sendiri.
+    """
+    if not rows:
+        return
+
+    with time_block("load_upsert", stats):
+        max_packet = get_max_allowed_packet(main_db)
+        row_bytes = estimate_row_bytes(rows)
+        max_stmt_length = int(max_packet * PACKET_SAFETY) if max_packet else None
+        if max_stmt_length and row_bytes:
+            batch_size = min(batch_size, max(MIN_BATCH_SIZE, max_stmt_length // row_bytes))
+
+        shards = shard_rows(rows, workers)
+
+        with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+            futures = [
+                pool.submit(_upsert_shard, connect, n + 1, shard, batch_size, max_stmt_length, with_recap)
+                for n, shard in enumerate(shards)
+            ]
+            results = [f.result() for f in futures]
+
+        total_batches = total_retries = 0
+        for n, (shard, (batches, retries, ms)) in enumerate(zip(shards, results)):
+            log(
+                f"[PARALLEL] shard {n + 1}/{len(shards)} "
+                f"{row_key(shard[0])} → {row_key(shard[-1])} "
+                f"rows={len(shard)} batches={batches} retries={retries} {ms}ms"
+            )
+            total_batches += batches
+            total_retries += retries
+
+        if stats is not None:
+            stats["load_batches"] = total_batches
+            stats["load_batch_size"] = batch_size
+            stats["load_workers"] = len(shards)
+            stats["load_retries"] = total_retries
+
+    log(
+        f"Upserted rows: {len(rows)} (workers={len(shards)}, "
+        f"batches={total_batches}, retries={total_retries})"
+    )
+
+# =====================================================
+# SWAP LOAD (STAGING TABLE)
+# =====================================================
+
+STAGE_TABLE = "absensi_summaries_stage"
+
+# kolom yang ditulis (urutan sama dengan UPSERT_SQL)
+SUMMARY_COLUMNS = (
+    "nik", "date",
+    "time_in", "time_out",
+    "time_in_final", "time_out_final",
+    "time_in_source", "time_out_source",
+    "status_masuk_final", "status_pulang_final", "status_hari_final",
+    "jadwal_masuk", "jadwal_pulang", "sumber_jadwal",
+    "device_desc_in", "device_id_in",
+    "device_desc_out", "device_id_out",
+    "filename_in", "filename_out",
+    "valid_device_in", "valid_device_out",
+    "lokasi_kerja", "valid_devices",
+    "final_note", "is_final",
+    "late_minutes", "early_minutes",
+    "attribute_in", "attribute_out",
+    "notes_hari", "notes_in", "notes_out",
+    "anomaly_flags",
+)
+
+# kolom yang diperbarui saat key sudah ada (sama dengan ON DUPLICATE
+# KEY UPDATE di UPSERT_SQL: time_in/time_out mentah tidak ditimpa)
+SWAP_UPDATE_COLUMNS = tuple(
+    c for c in SUMMARY_COLUMNS
+    if c not in ("nik", "date", "time_in", "time_out", "is_final")
+)
+
+_COLS = ", ".join(SUMMARY_COLUMNS)
+
+# CTAS tanpa index: insert ke stage tanpa maintenance index sekunder
+STAGE_CREATE_SQL = f"""
+CREATE TEMPORARY TABLE {STAGE_TABLE} ENGINE=InnoDB
+AS SELECT {_COLS} FROM absensi_summaries WHERE 1 = 0
+"""
+
+STAGE_INSERT_SQL = (
+    f"INSERT INTO {STAGE_TABLE} ({_COLS}) VALUES ("
+    + ", ".join(f"%({c})s" for c in SUMMARY_COLUMNS)
+    + ")"
+)
+
+# satu statement set-based, key berurutan (nik, date)
+SWAP_SQL = f"""
+INSERT INTO absensi_summaries ({_COLS})
+SELECT {_COLS} FROM {STAGE_TABLE}
+ORDER BY nik, date
+ON DUPLICATE KEY UPDATE
+""" + ",\n".join(
+    f"    {c} = VALUES({c})" for c in SWAP_UPDATE_COLUMNS
+) + ",\n    is_final = 1\n"
+
+def stage_rows(main_db, rows, batch_size=5000, stats=None, create=True):
+    """
+    Bulk insert rows ke temporary stage table (per koneksi/session).
+    Tidak menyentuh absensi_summaries → tidak ada lock ke dashboard.
+    create=False → append ke stage table yang sudah ada (segmen spill)
+    """
+    with time_block("load_stage", stats):
+        max_packet = get_max_allowed_packet(main_db)
+        row_bytes = estimate_row_bytes(rows)
+        if max_packet and row_bytes:
+            batch_size = min(batch_size, max(MIN_BATCH_SIZE, int(max_packet * PACKET_SAFETY) // row_bytes))
+
+        with main_db.cursor() as cur:
+            if max_packet:
+                cur.max_stmt_length = int(max_packet * PACKET_SAFETY)
+
+            if create:
+                cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {STAGE_TABLE}")
+                cur.execute(STAGE_CREATE_SQL)
+
+            for i in range(0, len(rows), batch_size):
+                cur.executemany(STAGE_INSERT_SQL, rows[i:i + batch_size])
+
+        # temporary table: commit tidak mempublikasikan apa pun
+        main_db.commit()
+
+    log(f"[SWAP] staged rows: {len(rows)} (batch size={batch_size})")
+
+def swap_load(main_db, rows, batch_size=5000, stats=None, with_recap=False):
+    """
+    Load mode "swap":
+    1. stage_rows → temporary table tanpa index
+    2. satu INSERT ... SELECT ... ON DUPLICATE KEY UPDATE (transaksi pendek)
+    Hasil akhir sama dengan bulk_upsert, lock di absensi_summaries
+    hanya selama statement ke-2 (+ rekap bulanan jika with_recap).
+
+    Semantik tetap upsert set-based, bukan penggantian isi tanggal:
+    key (nik, date) yang sudah ada di absensi_summaries tetapi tidak
+    ada di rows TIDAK dihapus (sama dengan mode upsert).
+    """
+    if not rows:
+        log("No rows to load")
+        return
+
+    delta = recap.RecapDelta() if with_recap else None
+
+    try:
+        for i, chunk in enumerate(_chunks(rows)):
+            stage_rows(main_db, chunk, batch_size, stats, create=i == 0)
+            if delta is not None:
+                delta.add_rows(chunk)
+
+        main_db.begin()
+        try:
+            with time_block("load_swap", stats):
+                with main_db.cursor() as cur:
+                    if delta is not None:
+                        delta.add_rows(recap.fetch_old_staged(cur, STAGE_TABLE), sign=-1)
+                    cur.execute(SWAP_SQL)
+                    if delta is not None:
+                        _apply_recap(cur, delta, stats)
+            main_db.commit()
+            progress.count("upserted", len(rows))
+        except Exception:
+            main_db.rollback()
+            raise
+    finally:
+        # gagal drop tidak boleh menutupi error load aslinya
+        try:
+            with main_db.cursor() as cur:
+                cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {STAGE_TABLE}")
+        except Exception as e:
+            log_warn(f"[SWAP] drop stage table failed: {e}")
+
+    log(f"[SWAP] swapped rows: {len(rows)}")
 
 # =====================================================
 # TRANSACTION WRAPPER
 # =====================================================
 
-def load_rows(main_db, rows, batch_size=500, stats=None):
+LOAD_MODES = ("upsert", "swap")
+
+def _apply_recap(cur, delta, stats=None):
+    with time_block("load_recap", stats):
+        n = delta.apply(cur)
+    if stats is not None:
+        stats["recap_keys"] = n
+
+def _chunks(rows):
+    """List row, atau segmen RowSpool (dibaca dari disk satu per satu)"""
+    return rows.chunks() if isinstance(rows, RowSpool) else [rows]
+
+def load_rows(
+    main_db,
+    rows,
+    batch_size=500,
+    stats=None,
+    auto_tune=True,
+    mode="upsert",
+    workers=1,
+    connect=None,
+    with_recap=True,
+):
     """
     Safe transactional loader
+    mode: "upsert" (batch ON DUPLICATE KEY UPDATE) atau "swap" (stage table)
+    workers > 1 (mode upsert): parallel_upsert lewat connect(),
+    commit per batch (bukan satu transaksi)
+    with_recap: rekap bulanan (recap.py) diperbarui di transaksi yang sama
     """
     if not rows:
         log("No rows to load")
         return
 
+    if with_recap:
+        recap.ensure_table(main_db)
+
+    if mode == "swap":
+        swap_load(main_db, rows, stats=stats, with_recap=with_recap)
+        return
+
+    if workers > 1 and connect is not None:
+        for chunk in _chunks(rows):
+            parallel_upsert(main_db, connect, chunk, workers, batch_size, stats, with_recap)
+        return
+
+    delta = recap.RecapDelta() if with_recap else None
+
     main_db.begin()
     try:
-        bulk_upsert(main_db, rows, batch_size, stats)
+        for chunk in _chunks(rows):
+            bulk_upsert(main_db, chunk, batch_size, stats, auto_tune=auto_tune, recap_delta=delta)
+        if delta is not None:
+            with main_db.cursor() as cur:
+                _apply_recap(cur, delta, stats)
         main_db.commit()
     except Exception:
         main_db.rollback()
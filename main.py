@@ -10,18 +10,26 @@ import sys
 import os
 from datetime import datetime
 from dotenv import load_dotenv
-import pymysql
 
 from utils import (
     log,
+    log_warn,
     parse_date,
     date_range,
     time_block,
 )
 from extract import extract_all
-from transform import process_pegawai_fast
-from load import load_rows
-import cache
+from transform import transform_all, get_engine
+from compare import compare_engines
+from golden import capture as capture_golden
+from load import load_rows, LOAD_MODES
+from db import DbRouter, set_driver
+from shard import run_shards, run_unit, SHARD_SIZE
+from cache import EtlContext
+from spill import MemoryBudget, RowSpool
+from progress import Progress
+from metrics import RunMetrics
+import fingerprint
 
 # =====================================================
 # ENV & DB CONFIG
@@ -55,15 +63,39 @@ AUX_DB = {
     "database": os.getenv("DB_TEMP_DATABASE"),
 }
 
-def connect(cfg):
-    return pymysql.connect(
-        host=cfg["host"],
-        port=cfg["port"],
-        user=cfg["user"],
-        password=cfg["password"],
-        database=cfg["database"],
-        cursorclass=pymysql.cursors.DictCursor,
-        autocommit=False,
+def replica_config(prefix, primary):
+    """
+    Replica opsional: {prefix}REPLICA_HOST wajib, sisanya
+    (port/user/password/database) default ke config primary
+    """
+    host = os.getenv(f"{prefix}REPLICA_HOST")
+    if not host:
+        return None
+    return {
+        "host": host,
+        "port": int(os.getenv(f"{prefix}REPLICA_PORT", primary["port"])),
+        "user": os.getenv(f"{prefix}REPLICA_USERNAME", primary["user"]),
+        "password": os.getenv(f"{prefix}REPLICA_PASSWORD", primary["password"]),
+        "database": os.getenv(f"{prefix}REPLICA_DATABASE", primary["database"]),
+    }
+
+ATT_REPLICA_DB = replica_config("DB_ATT_", ATT_DB)
+MAIN_REPLICA_DB = replica_config("DB_", MAIN_DB)
+AUX_REPLICA_DB = replica_config("DB_TEMP_", AUX_DB)
+
+# lag replica maksimum (detik) untuk extract tanggal hari ini
+REPLICA_MAX_LAG = int(os.getenv("DB_REPLICA_MAX_LAG", 30))
+
+# driver DB: pymysql | mysqlclient, cursor extract attendance: dict | tuple
+DB_DRIVER = os.getenv("DB_DRIVER", "pymysql")
+DB_CURSOR = os.getenv("DB_CURSOR", "dict")
+
+def make_router():
+    set_driver(DB_DRIVER, DB_CURSOR)
+    return DbRouter(
+        primary={"att": ATT_DB, "main": MAIN_DB, "aux": AUX_DB},
+        replica={"att": ATT_REPLICA_DB, "main": MAIN_REPLICA_DB, "aux": AUX_REPLICA_DB},
+        max_lag=REPLICA_MAX_LAG,
     )
 
 # =====================================================
@@ -74,63 +106,238 @@ def parse_args():
     parser = argparse.ArgumentParser(
         description="ETL absensi_summaries (production-grade)"
     )
-    parser.add_argument("--from", dest="date_from", required=True)
+    parser.add_argument("--from", dest="date_from")
     parser.add_argument("--to", dest="date_to")
     parser.add_argument("--unit-id", dest="unit_id", type=int)
     parser.add_argument("--sub-unit-id", dest="sub_unit_id", type=int)
     parser.add_argument("--nik", dest="nik")
     parser.add_argument("--dry-run", action="store_true")
-    parser.add_argument("--batch-size", type=int, default=500)
-    return parser.parse_args()
+    parser.add_argument("--progress-interval", type=int, default=60,
+                        help="detik antar laporan progress/ETA (0 = per tanggal saja)")
+    parser.add_argument("--metrics-textfile", metavar="PATH",
+                        help="tulis metrics Prometheus (node-exporter textfile) setiap tanggal")
+    parser.add_argument("--no-run-history", dest="run_history", action="store_false",
+                        help="jangan simpan metrics ke absensi_etl_run_history")
+    parser.add_argument("--no-recap", dest="recap", action="store_false",
+                        help="jangan perbarui rekap bulanan absensi_recap_monthly saat load")
+    parser.add_argument("--force", action="store_true",
+                        help="proses ulang walau fingerprint sumber tidak berubah")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="ukuran batch awal upsert (auto-tune)")
+    parser.add_argument("--no-auto-batch", dest="auto_batch", action="store_false",
+                        help="pakai --batch-size tetap tanpa auto-tune")
+    parser.add_argument("--load-workers", type=int, default=1,
+                        help="upsert paralel lewat N koneksi (commit per batch)")
+    parser.add_argument("--load-mode", choices=LOAD_MODES, default="upsert",
+                        help="upsert: batch ON DUPLICATE KEY UPDATE; "
+                             "swap: stage table + satu INSERT ... SELECT")
+    parser.add_argument("--tap-reduce", choices=("server", "check"),
+                        help="server: hanya kandidat tap IN/OUT dari MySQL; "
+                             "check: server + parity check vs semua tap")
+    parser.add_argument("--att-slices", type=int, default=1,
+                        help="ambil attendance paralel dalam N slice jam (N koneksi)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="extract + transform per unit di N worker paralel")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE,
+                        help="maks pegawai per shard (unit besar dipecah)")
+    parser.add_argument("--memory-limit", type=int, metavar="MB",
+                        help="budget memori tap + row output, lebih → spill ke disk")
+    parser.add_argument("--spill-dir",
+                        help="direktori file spill (default direktori temp sistem)")
+    parser.add_argument("--tap-dedupe-seconds", type=int, default=None,
+                        help="buang tap duplikat (device sama) dalam toleransi detik; "
+                             "0 = hanya jam identik (default nonaktif)")
+    parser.add_argument("--engine", default="fast",
+                        help="transform engine (nama atau module:function)")
+    parser.add_argument("--compare", metavar="ENGINE_A,ENGINE_B",
+                        help="jalankan dua engine, diff output, TANPA load")
+    parser.add_argument("--capture-golden", metavar="PATH",
+                        help="simpan snapshot cache + output (boleh pakai {date})")
+
+    # daemon: ETL hari ini berulang dengan cache hangat
+    parser.add_argument("--daemon", action="store_true")
+    parser.add_argument("--interval", type=int, default=300,
+                        help="detik antar siklus daemon")
+    parser.add_argument("--tap-overlap", type=int, default=30,
+                        help="menit overlap baca ulang attendance (daemon)")
+    parser.add_argument("--status-file",
+                        help="file JSON status/metrics daemon")
+
+    # distributed: banyak node claim work item (date, unit) dari tabel lease
+    parser.add_argument("--distributed", metavar="RUN_ID",
+                        help="claim item (date, unit) dari tabel lease bersama")
+    parser.add_argument("--lease-seconds", type=int, default=300,
+                        help="durasi lease item (diperpanjang heartbeat)")
+    parser.add_argument("--units",
+                        help="daftar unit (csv) untuk --distributed, default dari pegawai_histories "
+                             "+ item 'orphan' (NIK tanpa unit)")
+    # diisi per work item oleh --distributed (lihat run_item)
+    parser.set_defaults(work_unit=None)
+
+    args = parser.parse_args()
+    if not args.daemon and not args.date_from:
+        parser.error("--from is required (unless --daemon)")
+    if args.compare and (args.daemon or "," not in args.compare):
+        parser.error("--compare expects ENGINE_A,ENGINE_B and cannot run with --daemon")
+    if args.att_slices < 1:
+        parser.error("--att-slices must be >= 1")
+    if args.tap_dedupe_seconds is not None and args.tap_dedupe_seconds < 0:
+        parser.error("--tap-dedupe-seconds must be >= 0 (omit to disable)")
+    if args.load_workers < 1:
+        parser.error("--load-workers must be >= 1")
+    if args.load_workers > 1 and args.load_mode == "swap":
+        parser.error("--load-workers cannot be combined with --load-mode swap")
+    if args.shards < 1 or args.shard_size < 1:
+        parser.error("--shards and --shard-size must be >= 1")
+    if args.shards > 1 and (
+        args.daemon or args.compare or args.capture_golden or args.tap_reduce or args.distributed or
+        args.unit_id is not None or args.sub_unit_id is not None or args.nik
+    ):
+        parser.error(
+            "--shards cannot run with --daemon, --compare, --capture-golden, "
+            "--tap-reduce, --distributed or unit / nik filters"
+        )
+    if args.memory_limit is not None and args.memory_limit < 1:
+        parser.error("--memory-limit must be >= 1 (MB)")
+    if args.memory_limit and (
+        args.daemon or args.compare or args.capture_golden or
+        args.tap_reduce == "check" or args.att_slices > 1 or args.shards > 1
+    ):
+        parser.error(
+            "--memory-limit cannot run with --daemon, --compare, --capture-golden, "
+            "--tap-reduce check, --att-slices or --shards"
+        )
+    if args.tap_reduce and args.daemon:
+        parser.error("--tap-reduce cannot run with --daemon (incremental taps)")
+    if args.distributed and (
+        args.daemon or args.compare or args.capture_golden or args.tap_reduce or args.att_slices > 1 or
+        args.unit_id is not None or args.sub_unit_id is not None or args.nik
+    ):
+        parser.error(
+            "--distributed cannot run with --daemon, --compare, --capture-golden, "
+            "--tap-reduce, --att-slices or unit / nik filters"
+        )
+    return args
 
 # =====================================================
 # MAIN ETL
 # =====================================================
 
-def run_etl(main_db, aux_db, att_db, date, args):
-    stats = {}
+def writes_main(args):
+    """Run ini menulis ke MAIN (--dry-run / --compare tidak pernah menulis)"""
+    return not (args.dry_run or args.compare)
+
+def use_fingerprint(args):
+    """
+    Fingerprint hanya untuk run penuh satu tanggal yang benar-benar load.
+    --capture-golden / --tap-reduce check harus jalan walau data tidak berubah
+    """
+    return writes_main(args) and not (
+        args.daemon or args.work_unit is not None or
+        args.capture_golden or args.tap_reduce == "check" or
+        args.unit_id is not None or args.sub_unit_id is not None or args.nik
+    )
+
+def run_etl(router, etl, date, args, before_load=None, stats=None):
+    """
+    before_load: callable opsional, False → load dilewati
+    (mis. lease item distributed sudah diambil node lain)
+    stats: dict opsional, diisi timing / counter (lihat metrics.py)
+    Return False jika tanggal dilewati (fingerprint tidak berubah)
+    """
+    stats = {} if stats is None else stats
 
     log(f"ETL start for date {date}")
 
+    # extract dari replica (jika ada), load selalu ke primary
+    main_db, aux_db, att_db = router.readers(date)
+
     # -------------------------------------------------
-    # EXTRACT
+    # FINGERPRINT (SKIP TANGGAL TANPA PERUBAHAN)
     # -------------------------------------------------
-    with time_block("extract_total", stats):
-        extract_all(
-            main_db,
-            aux_db,
-            att_db,
+    fp = None
+    if use_fingerprint(args):
+        with time_block("fingerprint", stats):
+            fp, details = fingerprint.compute_fingerprint(
+                {"main": main_db, "aux": aux_db, "att": att_db},
+                date,
+                args.engine,
+                etl.tap_dedupe_seconds,
+            )
+            old_fp, old_details = fingerprint.load_fingerprint(router.writer(), date)
+
+        if fp == old_fp and not args.force:
+            log(f"[FINGERPRINT] {date} unchanged since last load, skipped (--force to rerun)")
+            return False
+        if fp != old_fp:
+            fingerprint.log_fingerprint_change(date, old_details, details)
+
+    if args.shards > 1:
+        # extract + transform per unit, paralel (lihat shard.py)
+        rows = run_shards(
+            router,
+            date,
+            args.shards,
+            args.shard_size,
+            engine=get_engine(args.engine),
+            tap_dedupe_seconds=etl.tap_dedupe_seconds,
+            stats=stats,
+        )
+    elif args.work_unit is not None:
+        # item distributed: extract + transform satu unit (lihat shard.run_unit)
+        rows = run_unit(router, etl, date, args.work_unit, engine=get_engine(args.engine), stats=stats)
+    else:
+        # -------------------------------------------------
+        # EXTRACT
+        # -------------------------------------------------
+        with time_block("extract_total", stats):
+            extract_all(
+                etl,
+                main_db,
+                aux_db,
+                att_db,
+                date,
+                unit_id=args.unit_id,
+                sub_unit_id=args.sub_unit_id,
+                nik=args.nik,
+                stats=stats,
+                tap_reduce=args.tap_reduce,
+                att_slices=args.att_slices,
+                connect_att=router.reader_factory("att", date),
+            )
+
+        if args.capture_golden:
+            capture_golden(etl, args.capture_golden.format(date=date), date, engine=args.engine)
+
+        # -------------------------------------------------
+        # COMPARE (SHADOW, NEVER WRITES)
+        # -------------------------------------------------
+        if args.compare:
+            engine_a, engine_b = args.compare.split(",", 1)
+            compare_engines(
+                etl,
+                date,
+                engine_a.strip(),
+                engine_b.strip(),
+                unit_id=args.unit_id,
+                nik=args.nik,
+                stats=stats,
+            )
+            return
+
+        # -------------------------------------------------
+        # TRANSFORM
+        # -------------------------------------------------
+        rows = transform_all(
+            etl,
             date,
             unit_id=args.unit_id,
-            sub_unit_id=args.sub_unit_id,
             nik=args.nik,
             stats=stats,
+            engine=get_engine(args.engine),
         )
 
-    # -------------------------------------------------
-    # TRANSFORM
-    # -------------------------------------------------
-    rows = []
-    with time_block("transform_total", stats):
-        for nik in cache.PEGAWAI_CTX.keys() | {
-            k[0] for k in cache.ATT_MAP.keys()
-        }:
-            ctx = cache.get_pegawai_ctx(nik)
-            if args.unit_id and (not ctx or str(ctx["unit_id"]) != str(args.unit_id)):
-                continue
-
-            # FILTER NIK ARGUMENT
-            if args.nik and nik != args.nik:
-                continue
-    
-            # if ctx:
-            #     print("UNIT:", ctx["unit_id"], "NIK:", nik)
-            # else:
-            #     print("UNIT: NONE", "NIK:", nik)
-            
-            row = process_pegawai_fast(nik, date)
-            rows.append(row)
-
+    stats["rows"] = len(rows)
     log(f"Rows transformed: {len(rows)}")
 
     # -------------------------------------------------
@@ -138,19 +345,33 @@ def run_etl(main_db, aux_db, att_db, date, args):
     # -------------------------------------------------
     if args.dry_run:
         log("Dry-run enabled, skipping load")
+    elif before_load is not None and not before_load():
+        log_warn(f"{date}: load skipped (before_load check failed)")
     else:
         load_rows(
-            main_db,
+            router.writer(),
             rows,
             batch_size=args.batch_size,
             stats=stats,
+            auto_tune=args.auto_batch,
+            mode=args.load_mode,
+            workers=args.load_workers,
+            connect=router.writer_factory(),
+            with_recap=args.recap,
         )
+        if fp:
+            # dihitung sebelum extract → perubahan selama run terdeteksi run berikutnya
+            fingerprint.save_fingerprint(router.writer(), date, fp, details)
+
+    if isinstance(rows, RowSpool):
+        rows.log_summary()
+        rows.close()
 
     log(
         f"[ETL DONE] {date} | "
         f"extract={stats.get('extract_total_ms', 0)}ms "
         f"transform={stats.get('transform_total_ms', 0)}ms "
-        f"load={stats.get('load_upsert_ms', 0)}ms "
+        f"load={stats.get('load_upsert_ms', stats.get('load_swap_ms', 0))}ms "
         f"rows={len(rows)}"
     )
 
@@ -161,36 +382,71 @@ def run_etl(main_db, aux_db, att_db, date, args):
 if __name__ == "__main__":
     args = parse_args()
 
-    date_from = parse_date(args.date_from)
-    date_to = parse_date(args.date_to) if args.date_to else date_from
+    etl = EtlContext(
+        tap_dedupe_seconds=args.tap_dedupe_seconds,
+        budget=MemoryBudget(args.memory_limit * 2**20, args.spill_dir) if args.memory_limit else None,
+    )
 
-    main_db = connect(MAIN_DB)
-    aux_db = connect(AUX_DB)
-    att_db = connect(ATT_DB)
+    router = make_router()
+
+    # run history hanya untuk run yang memang menulis ke MAIN
+    metrics = RunMetrics(
+        router.writer() if args.run_history and writes_main(args) else None,
+        args.metrics_textfile,
+        mode="daemon" if args.daemon else "batch",
+        budget=etl.budget,
+    )
+
+    if use_fingerprint(args):
+        fingerprint.ensure_table(router.writer())
 
     try:
-        for d in date_range(date_from, date_to):
-            # reset cache per date
-            cache.ATT_MAP.clear()
-            cache.PEGAWAI_CTX.clear()
-            cache.DEVICE_BY_UNIT.clear()
-            cache.ABSENT_MAP.clear()
-            cache.TAP_MAP.clear()
-            cache.JADWAL_PEGAWAI.clear()
-            cache.JADWAL_SUB_UNIT.clear()
-            cache.JADWAL_UNIT.clear()
-            cache.JADWAL_DINAS.clear()
-
-            run_etl(main_db, aux_db, att_db, d, args)
+        if args.daemon:
+            from daemon import run_daemon
+            run_daemon(router, etl, args, metrics)
+            metrics.finish(ok=True)
+            sys.exit(0)
+
+        date_from = parse_date(args.date_from)
+        date_to = parse_date(args.date_to) if args.date_to else date_from
+
+        dates = list(date_range(date_from, date_to))
+
+        # distributed: jumlah item node ini tidak diketahui → tanpa ETA
+        with Progress(None if args.distributed else len(dates), args.progress_interval) as prog:
+            if args.distributed:
+                from lease import run_distributed
+
+                def run_item(etl, date, unit_id, still_owned):
+                    item_args = argparse.Namespace(**{**vars(args), "work_unit": unit_id})
+                    stats = {}
+                    prog.start_date(date)
+                    skipped = run_etl(router, etl, date, item_args, before_load=still_owned, stats=stats) is False
+                    prog.end_date(date, skipped)
+                    metrics.record(date, stats, skipped)
+
+                run_distributed(router, etl, dates, args, run_item)
+
+            else:
+                for d in dates:
+                    # reset cache per date (ID dictionary tetap)
+                    etl.reset()
+
+                    stats = {}
+                    prog.start_date(d)
+                    skipped = run_etl(router, etl, d, args, stats=stats) is False
+                    prog.end_date(d, skipped)
+                    metrics.record(d, stats, skipped)
 
+        metrics.finish(ok=True)
         log("ETL completed successfully")
         sys.exit(0)
 
     except Exception as e:
         log(f"[FATAL] {e}")
+        metrics.finish(ok=False)
         sys.exit(1)
 
     finally:
-        main_db.close()
-        aux_db.close()
-        att_db.close()
+        etl.drop_attendance_spill()
+        router.close()
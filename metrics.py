@@ -0,0 +1,235 @@
+# metrics.py
+# =====================================================
+# Run history (MAIN DB) + Prometheus textfile
+# =====================================================
+#
+#   python main.py --from 2026-10-01 --to 2026-10-31 \
+#       --metrics-textfile /var/lib/node_exporter/textfile/absensi_etl.prom
+#
+# Setiap tanggal (atau siklus daemon): semua angka di dict stats
+# (time_block *_ms, jumlah row / batch / retry, ...), jumlah query,
+# peak RSS dan budget memori disimpan per metric ke absensi_etl_run_history
+# (run_id, node, release). Tren antar release:
+#
+#   SELECT release_tag, AVG(value) FROM absensi_etl_run_history
+#   WHERE metric = 'extract_total_ms' GROUP BY release_tag;
+#
+# Textfile (node-exporter textfile collector) ditulis atomik setelah
+# setiap tanggal: nilai tanggal terakhir + total run → alert regresi stage.
+# Gagal menulis metrics tidak pernah menggagalkan ETL.
+
+import os
+import subprocess
+import time
+import uuid
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # non-Unix
+    resource = None
+
+import db
+from lease import node_name
+from transform import TRANSFORM_VERSION
+from utils import log_warn
+
+HISTORY_TABLE = "absensi_etl_run_history"
+
+CREATE_HISTORY_SQL = f"""
+CREATE TABLE IF NOT EXISTS {HISTORY_TABLE} (
+    id           BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+    run_id       CHAR(32) NOT NULL,
+    mode         VARCHAR(16) NOT NULL,
+    node         VARCHAR(128) NOT NULL,
+    release_tag  VARCHAR(64) NOT NULL,
+    date         DATE NULL,
+    metric       VARCHAR(64) NOT NULL,
+    value        DOUBLE NOT NULL,
+    recorded_at  DATETIME NOT NULL,
+    KEY idx_run (run_id),
+    KEY idx_metric (metric, recorded_at)
+)
+"""
+
+PREFIX = "absensi_etl"
+
+def release_tag():
+    """ETL_RELEASE, atau git commit pendek, atau versi transform"""
+    tag = os.getenv("ETL_RELEASE")
+    if tag:
+        return tag
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=5,
+        )
+        if out.returncode == 0 and out.stdout.strip():
+            return out.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return f"transform-v{TRANSFORM_VERSION}"
+
+def peak_rss_bytes():
+    if resource is None:
+        return None
+    # Linux: KB, macOS: byte
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if os.uname().sysname == "Darwin" else rss * 1024
+
+def numeric_stats(stats):
+    """Hanya nilai angka dari dict stats (bool dibuang)"""
+    return {
+        k: float(v) for k, v in stats.items()
+        if isinstance(v, (int, float)) and not isinstance(v, bool)
+    }
+
+class RunMetrics:
+    """
+    Kumpulkan metrics satu proses ETL.
+    main_db: koneksi MAIN (None → tanpa run history)
+    textfile: path textfile Prometheus (None → tidak ditulis)
+    """
+
+    def __init__(self, main_db=None, textfile=None, mode="batch", budget=None):
+        self.main_db = main_db
+        self.textfile = textfile
+        self.mode = mode
+        self.budget = budget
+
+        self.run_id = uuid.uuid4().hex
+        self.node = node_name()
+        self.release = release_tag()
+        self.start = time.time()
+
+        self.dates = {"loaded": 0, "skipped": 0}
+        self.totals = {}
+        self.last = {}
+        self.last_date_at = None
+        self.last_success_at = None
+
+        self._queries = db.query_count()
+        self._table_ready = False
+
+    # =====================================================
+    # RECORD
+    # =====================================================
+
+    def record(self, date, stats, skipped=False):
+        """Simpan metrics satu tanggal (dipanggil setelah run_etl)"""
+        values = numeric_stats(stats)
+
+        queries = db.query_count()
+        values["queries"] = float(queries - self._queries)
+        self._queries = queries
+
+        rss = peak_rss_bytes()
+        if rss is not None:
+            values["peak_rss_bytes"] = float(rss)
+        if self.budget is not None:
+            values["budget_peak_bytes"] = float(self.budget.peak)
+            values["spilled_bytes"] = float(self.budget.spilled_bytes)
+        values["skipped"] = 1.0 if skipped else 0.0
+
+        self.dates["skipped" if skipped else "loaded"] += 1
+        for k, v in values.items():
+            if k.endswith("_ms") or k in ("rows", "queries"):
+                self.totals[k] = self.totals.get(k, 0.0) + v
+        # tanggal skip (fingerprint) tidak menimpa timing tanggal terakhir
+        if not skipped:
+            self.last = values
+        self.last_date_at = time.time()
+
+        self._insert(date, values)
+        self.write_textfile()
+
+    def finish(self, ok=True):
+        """Akhir run: durasi + timestamp sukses"""
+        duration = time.time() - self.start
+        if ok:
+            self.last_success_at = time.time()
+        self._insert(None, {"run_seconds": duration, "run_ok": 1.0 if ok else 0.0})
+        self.write_textfile()
+
+    def _insert(self, date, values):
+        if self.main_db is None or not values:
+            return
+        try:
+            with self.main_db.cursor() as cur:
+                if not self._table_ready:
+                    cur.execute(CREATE_HISTORY_SQL)
+                    self._table_ready = True
+                now = datetime.now()
+                cur.executemany(f"""
+                    INSERT INTO {HISTORY_TABLE}
+                        (run_id, mode, node, release_tag, date, metric, value, recorded_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, [
+                    (self.run_id, self.mode, self.node, self.release, date, k[:64], v, now)
+                    for k, v in sorted(values.items())
+                ])
+            self.main_db.commit()
+        except Exception as e:
+            try:
+                self.main_db.rollback()
+            except Exception:
+                pass
+            log_warn(f"[METRICS] run history write failed: {e}")
+
+    # =====================================================
+    # PROMETHEUS TEXTFILE
+    # =====================================================
+
+    def render(self):
+        labels = f'mode="{self.mode}"'
+        lines = []
+
+        def metric(name, help_text, samples, kind="gauge"):
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+            for extra, value in samples:
+                label = labels + (f",{extra}" if extra else "")
+                lines.append(f"{PREFIX}_{name}{{{label}}} {float(value)!r}")
+
+        stages = sorted(k for k in self.last if k.endswith("_ms"))
+        metric(
+            "last_stage_duration_seconds", "Durasi stage pada tanggal terakhir",
+            [(f'stage="{k[:-3]}"', self.last[k] / 1000) for k in stages],
+        )
+        metric(
+            "stage_duration_seconds_total", "Total durasi stage sejak proses mulai",
+            [(f'stage="{k[:-3]}"', v / 1000) for k, v in sorted(self.totals.items()) if k.endswith("_ms")],
+            kind="counter",
+        )
+        metric(
+            "stat", "Angka lain dari stats tanggal terakhir (rows, batch, retry, ...)",
+            [(f'name="{k}"', v) for k, v in sorted(self.last.items()) if not k.endswith("_ms")],
+        )
+        metric(
+            "dates_total", "Tanggal diproses sejak proses mulai",
+            [(f'result="{k}"', v) for k, v in sorted(self.dates.items())],
+            kind="counter",
+        )
+        metric("rows_total", "Row di-transform sejak proses mulai", [(None, self.totals.get("rows", 0.0))], kind="counter")
+        metric("queries_total", "Statement SQL sejak proses mulai", [(None, self.totals.get("queries", 0.0))], kind="counter")
+        metric("run_duration_seconds", "Durasi proses sejauh ini", [(None, time.time() - self.start)])
+
+        if self.last_date_at is not None:
+            metric("last_date_timestamp_seconds", "Waktu tanggal terakhir selesai", [(None, self.last_date_at)])
+        if self.last_success_at is not None:
+            metric("last_success_timestamp_seconds", "Waktu run terakhir selesai sukses", [(None, self.last_success_at)])
+
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self):
+        if not self.textfile:
+            return
+        tmp = f"{self.textfile}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                f.write(self.render())
+            # rename atomik: collector tidak pernah membaca file setengah jadi
+            os.replace(tmp, self.textfile)
+        except OSError as e:
+            log_warn(f"[METRICS] textfile write failed: {e}")
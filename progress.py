@@ -0,0 +1,249 @@
+# progress.py
+# =====================================================
+# Progress run panjang: tanggal selesai, throughput, ETA
+# =====================================================
+#
+#   python main.py --from 2026-01-01 --to 2026-06-30 --progress-interval 60
+#   kill -USR1 <pid>     → progress + stage aktif + stack semua thread
+#
+# Stage diambil dari time_block (utils.STAGE_HOOKS), per thread.
+# Counter (pegawai di-transform, row di-upsert) dinaikkan lewat count()
+# dari transform / load; no-op jika tidak ada Progress aktif.
+# Stage yang jauh lebih lambat dari rata-ratanya di-log sebagai
+# kandidat degradasi (bandingkan antar tanggal).
+#
+# Handler SIGUSR1 hanya memberi tanda; dump dikerjakan thread progress
+# (handler berjalan di main thread, bisa di tengah count() / log()).
+
+import signal
+import sys
+import threading
+import time
+import traceback
+
+import utils
+from utils import log, log_warn
+
+# Progress yang sedang berjalan (satu per proses)
+ACTIVE = None
+
+# stage dianggap melambat jika > SLOW_FACTOR x rata-rata sebelumnya
+SLOW_FACTOR = 2.0
+SLOW_MIN_MS = 1000
+
+def count(name, n=1):
+    """Naikkan counter Progress aktif (aman dari thread mana pun)"""
+    if ACTIVE is not None:
+        ACTIVE.count(name, n)
+
+def _fmt_seconds(sec):
+    sec = int(sec)
+    if sec >= 3600:
+        return f"{sec // 3600}h{sec % 3600 // 60:02d}m"
+    if sec >= 60:
+        return f"{sec // 60}m{sec % 60:02d}s"
+    return f"{sec}s"
+
+class Progress:
+    """
+    total_dates: jumlah tanggal run (None → tanpa ETA, mis. --distributed)
+    interval: detik antar laporan periodik (0 = hanya SIGUSR1 / per tanggal)
+    """
+
+    def __init__(self, total_dates=None, interval=60):
+        self.total_dates = total_dates
+        self.interval = interval
+        self.start = time.perf_counter()
+
+        self.dates_done = 0
+        self.dates_skipped = 0
+        self.current_date = None
+        self.counters = {}
+
+        # stages[thread_id] = [(label, start), ...] (nested time_block)
+        self.stages = {}
+        # stage_ms[label] = [total_ms, n]
+        self.stage_ms = {}
+
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._dump_requested = False
+        self._thread = None
+        self._prev_signal = None
+        self._signal_installed = False
+
+    # =====================================================
+    # EVENTS
+    # =====================================================
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def on_stage(self, label, elapsed_ms):
+        """Hook time_block: elapsed_ms None = mulai, angka = selesai"""
+        tid = threading.get_ident()
+        with self._lock:
+            stack = self.stages.setdefault(tid, [])
+            if elapsed_ms is None:
+                stack.append((label, time.perf_counter()))
+                return
+
+            if stack and stack[-1][0] == label:
+                stack.pop()
+            if not stack:
+                self.stages.pop(tid, None)
+
+            total, n = self.stage_ms.get(label, (0.0, 0))
+            self.stage_ms[label] = (total + elapsed_ms, n + 1)
+
+        if n and elapsed_ms >= SLOW_MIN_MS and elapsed_ms > SLOW_FACTOR * total / n:
+            log_warn(
+                f"[PROGRESS] slow stage {label}: {elapsed_ms:.0f}ms "
+                f"(avg {total / n:.0f}ms over {n} run(s))"
+            )
+
+    def start_date(self, date):
+        self.current_date = date
+
+    def end_date(self, date, skipped=False):
+        with self._lock:
+            self.dates_done += 1
+            if skipped:
+                self.dates_skipped += 1
+        self.report()
+
+    # =====================================================
+    # REPORT
+    # =====================================================
+
+    def snapshot(self):
+        """Dict progress saat ini (dipakai report / status)"""
+        elapsed = time.perf_counter() - self.start
+        with self._lock:
+            counters = dict(self.counters)
+            done = self.dates_done
+
+        out = {
+            "elapsed_s": round(elapsed, 1),
+            "dates_done": done,
+            "dates_total": self.total_dates,
+            "dates_skipped": self.dates_skipped,
+            "current_date": str(self.current_date) if self.current_date else None,
+            "transformed_per_s": round(counters.get("transformed", 0) / elapsed, 1) if elapsed else 0.0,
+            "upserted_per_s": round(counters.get("upserted", 0) / elapsed, 1) if elapsed else 0.0,
+            "eta_s": None,
+            **counters,
+        }
+        if self.total_dates and done:
+            out["eta_s"] = round(elapsed / done * (self.total_dates - done), 1)
+        return out
+
+    def current_stages(self):
+        """Stage aktif per thread: [(thread_id, "a > b", detik berjalan)]"""
+        now = time.perf_counter()
+        with self._lock:
+            return [
+                (tid, " > ".join(label for label, _ in stack), now - stack[-1][1])
+                for tid, stack in self.stages.items() if stack
+            ]
+
+    def report(self):
+        s = self.snapshot()
+
+        dates = f"{s['dates_done']}/{s['dates_total']}" if s["dates_total"] else str(s["dates_done"])
+        if s["dates_total"]:
+            dates += f" ({s['dates_done'] * 100 // s['dates_total']}%)"
+
+        stages = self.current_stages()
+        stage = (
+            f" | stage={stages[0][1]} ({_fmt_seconds(stages[0][2])})" if len(stages) == 1 else
+            f" | stages={len(stages)} thread(s)" if stages else ""
+        )
+
+        log(
+            f"[PROGRESS] dates {dates} skipped={s['dates_skipped']} "
+            f"current={s['current_date']} | "
+            f"pegawai {s['transformed_per_s']:.0f}/s | "
+            f"upsert {s['upserted_per_s']:.0f} rows/s | "
+            f"elapsed {_fmt_seconds(s['elapsed_s'])}"
+            + (f" ETA {_fmt_seconds(s['eta_s'])}" if s["eta_s"] is not None else "")
+            + stage
+        )
+
+    def dump(self):
+        """Laporan + stage aktif + stack semua thread (SIGUSR1)"""
+        self.report()
+
+        stages = {tid: (labels, sec) for tid, labels, sec in self.current_stages()}
+        frames = sys._current_frames()
+
+        for thread in threading.enumerate():
+            labels, sec = stages.get(thread.ident, ("-", 0))
+            log(f"[PROGRESS] thread {thread.name} stage={labels} ({_fmt_seconds(sec)})")
+            frame = frames.get(thread.ident)
+            if frame is not None:
+                print("".join(traceback.format_stack(frame)), end="")
+
+        with self._lock:
+            totals = sorted(self.stage_ms.items(), key=lambda kv: -kv[1][0])
+        for label, (total, n) in totals[:10]:
+            log(f"[PROGRESS] stage {label}: total={total:.0f}ms n={n} avg={total / n:.0f}ms")
+
+        sys.stdout.flush()
+
+    # =====================================================
+    # LIFECYCLE
+    # =====================================================
+
+    def request_dump(self):
+        """Dipanggil dari signal handler: tanpa lock, tanpa I/O"""
+        self._dump_requested = True
+        self._wake.set()
+
+    def _run(self):
+        next_report = time.monotonic() + self.interval if self.interval > 0 else None
+        while True:
+            timeout = None if next_report is None else max(0.0, next_report - time.monotonic())
+            self._wake.wait(timeout)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+
+            if self._dump_requested:
+                self._dump_requested = False
+                self.dump()
+
+            if next_report is not None and time.monotonic() >= next_report:
+                self.report()
+                next_report = time.monotonic() + self.interval
+
+    def __enter__(self):
+        global ACTIVE
+        ACTIVE = self
+        utils.STAGE_HOOKS.append(self.on_stage)
+
+        # signal hanya bisa dipasang dari main thread
+        if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+            self._prev_signal = signal.signal(signal.SIGUSR1, lambda signum, frame: self.request_dump())
+            self._signal_installed = True
+
+        # thread juga dibutuhkan tanpa laporan periodik (dump SIGUSR1)
+        if self.interval > 0 or self._signal_installed:
+            self._thread = threading.Thread(target=self._run, name="progress", daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        global ACTIVE
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+        if self._signal_installed:
+            signal.signal(signal.SIGUSR1, self._prev_signal or signal.SIG_DFL)
+        if self.on_stage in utils.STAGE_HOOKS:
+            utils.STAGE_HOOKS.remove(self.on_stage)
+        ACTIVE = None
@@ -0,0 +1,324 @@
+# recap.py
+# =====================================================
+# Rekap bulanan per (nik, bulan), di-maintain incremental oleh load
+# =====================================================
+#
+#   python recap.py rebuild --from 2026-01 --to 2026-10   # inisialisasi / perbaikan
+#   python recap.py check --month 2026-10                 # bandingkan dengan absensi_summaries
+#   python recap.py show 1971xxxxxxxx --month 2026-10
+#
+# Report bulanan cukup point lookup:
+#
+#   SELECT metric, value FROM absensi_recap_monthly
+#   WHERE nik = %s AND month = '2026-10-01';
+#
+# Metric: days, late_minutes, early_minutes, attr_T / attr_PC / attr_X
+# (attribute_in + attribute_out) dan status_<status_hari_final>.
+#
+# Setiap load (lihat load.py) membaca row lama (nik, date) yang akan
+# ditimpa di transaksi yang sama (FOR UPDATE), lalu menambahkan
+# delta = kontribusi row baru - kontribusi row lama ke tabel rekap.
+# Bulan yang sudah berisi data sebelum fitur ini aktif perlu `rebuild`
+# sekali; setelah itu rekap mengikuti setiap load / recompute.
+
+import argparse
+import sys
+from datetime import date as date_cls
+
+from utils import log, log_warn, log_error, parse_date
+
+RECAP_TABLE = "absensi_recap_monthly"
+
+CREATE_RECAP_SQL = f"""
+CREATE TABLE IF NOT EXISTS {RECAP_TABLE} (
+    nik         VARCHAR(32) NOT NULL,
+    month       DATE NOT NULL,
+    metric      VARCHAR(64) NOT NULL,
+    value       BIGINT NOT NULL DEFAULT 0,
+    updated_at  DATETIME NOT NULL,
+    PRIMARY KEY (nik, month, metric),
+    KEY idx_month (month, metric)
+)
+"""
+
+APPLY_SQL = f"""
+INSERT INTO {RECAP_TABLE} (nik, month, metric, value, updated_at)
+VALUES (%s, %s, %s, %s, NOW())
+ON DUPLICATE KEY UPDATE
+    value = value + VALUES(value),
+    updated_at = VALUES(updated_at)
+"""
+
+# kolom absensi_summaries yang dipakai rekap
+RECAP_COLUMNS = (
+    "nik", "date",
+    "status_hari_final",
+    "late_minutes", "early_minutes",
+    "attribute_in", "attribute_out",
+)
+
+# attribute yang dihitung → nama metric
+RECAP_ATTRIBUTES = {"/T": "attr_T", "/PC": "attr_PC", "/X": "attr_X"}
+
+# key per query baca row lama
+FETCH_CHUNK = 1000
+
+_table_ready = False
+
+def ensure_table(main_db):
+    """
+    CREATE TABLE sekali per proses. Dipanggil di luar transaksi load
+    (DDL MySQL melakukan implicit commit).
+    """
+    global _table_ready
+    if _table_ready:
+        return
+    with main_db.cursor() as cur:
+        cur.execute(CREATE_RECAP_SQL)
+    main_db.commit()
+    _table_ready = True
+
+def month_of(d):
+    """Tanggal (date / 'YYYY-MM-DD') → date hari pertama bulan"""
+    if isinstance(d, str):
+        d = parse_date(d[:10])
+    return date_cls(d.year, d.month, 1)
+
+def row_metrics(row):
+    """Kontribusi satu row harian ke rekap: {metric: nilai}"""
+    out = {
+        "days": 1,
+        "late_minutes": int(row.get("late_minutes") or 0),
+        "early_minutes": int(row.get("early_minutes") or 0),
+    }
+
+    status = row.get("status_hari_final")
+    if status:
+        key = f"status_{status}"[:64]
+        out[key] = out.get(key, 0) + 1
+
+    for col in ("attribute_in", "attribute_out"):
+        metric = RECAP_ATTRIBUTES.get(row.get(col))
+        if metric:
+            out[metric] = out.get(metric, 0) + 1
+
+    return out
+
+# =====================================================
+# DELTA
+# =====================================================
+
+class RecapDelta:
+    """Akumulator delta {(nik, month, metric): nilai}"""
+
+    def __init__(self):
+        self.values = {}
+
+    def add(self, row, sign=1):
+        nik = str(row["nik"])
+        month = month_of(row["date"])
+        for metric, v in row_metrics(row).items():
+            key = (nik, month, metric)
+            self.values[key] = self.values.get(key, 0) + sign * v
+
+    def add_rows(self, rows, sign=1):
+        for row in rows:
+            self.add(row, sign)
+
+    def merge(self, other):
+        for key, v in other.values.items():
+            self.values[key] = self.values.get(key, 0) + v
+
+    def apply(self, cur):
+        """
+        Tambahkan delta ke tabel rekap (di transaksi pemanggil).
+        Urut key → urutan lock sama antar koneksi. Return jumlah key
+        """
+        rows = [(*key, v) for key, v in sorted(self.values.items()) if v]
+        for i in range(0, len(rows), FETCH_CHUNK):
+            cur.executemany(APPLY_SQL, rows[i:i + FETCH_CHUNK])
+        self.values = {}
+        return len(rows)
+
+def fetch_old(cur, rows):
+    """
+    Row absensi_summaries yang akan ditimpa rows (current read,
+    FOR UPDATE → tidak berubah sampai transaksi load commit)
+    """
+    by_date = {}
+    for row in rows:
+        by_date.setdefault(row["date"], set()).add(str(row["nik"]))
+
+    cols = ", ".join(RECAP_COLUMNS)
+    out = []
+    for d, niks in by_date.items():
+        niks = sorted(niks)
+        for i in range(0, len(niks), FETCH_CHUNK):
+            chunk = niks[i:i + FETCH_CHUNK]
+            cur.execute(f"""
+                SELECT {cols}
+                FROM absensi_summaries
+                WHERE date = %s
+                  AND nik IN ({", ".join(["%s"] * len(chunk))})
+                FOR UPDATE
+            """, [d, *chunk])
+            out.extend(cur.fetchall())
+    return out
+
+def fetch_old_staged(cur, stage_table):
+    """Seperti fetch_old, untuk key di stage table (load mode swap)"""
+    cols = ", ".join(f"a.{c}" for c in RECAP_COLUMNS)
+    cur.execute(f"""
+        SELECT {cols}
+        FROM {stage_table} s
+        JOIN absensi_summaries a ON a.nik = s.nik AND a.date = s.date
+        FOR UPDATE
+    """)
+    return cur.fetchall()
+
+def upsert_delta(cur, rows):
+    """
+    Delta rekap untuk menulis rows: -row lama +row baru.
+    Panggil SEBELUM statement upsert (row lama masih terbaca)
+    """
+    delta = RecapDelta()
+    delta.add_rows(fetch_old(cur, rows), sign=-1)
+    delta.add_rows(rows)
+    return delta
+
+# =====================================================
+# REBUILD / CHECK (SCAN absensi_summaries)
+# =====================================================
+
+def _month_range(month):
+    end = date_cls(month.year + month.month // 12, month.month % 12 + 1, 1)
+    return month, end
+
+def _iter_months(month_from, month_to):
+    m = month_of(month_from)
+    while m <= month_of(month_to):
+        yield m
+        m = _month_range(m)[1]
+
+def aggregate_month(main_db, month, lock=False):
+    """
+    Rekap satu bulan dihitung penuh dari absensi_summaries.
+    lock=True → shared lock (load bersamaan menunggu sampai rebuild commit)
+    """
+    start, end = _month_range(month)
+    totals = RecapDelta()
+    with main_db.cursor() as cur:
+        cur.execute(f"""
+            SELECT {", ".join(RECAP_COLUMNS)}
+            FROM absensi_summaries
+            WHERE date >= %s AND date < %s
+        """ + ("LOCK IN SHARE MODE" if lock else ""), [start, end])
+        while True:
+            rows = cur.fetchmany(10000)
+            if not rows:
+                break
+            totals.add_rows(rows)
+    return totals
+
+def load_month(main_db, month):
+    with main_db.cursor() as cur:
+        cur.execute(f"""
+            SELECT nik, month, metric, value
+            FROM {RECAP_TABLE}
+            WHERE month = %s
+        """, [month])
+        return {(r["nik"], r["month"], r["metric"]): r["value"] for r in cur.fetchall()}
+
+def rebuild(main_db, month_from, month_to):
+    """Hitung ulang rekap per bulan (DELETE + INSERT satu transaksi per bulan)"""
+    ensure_table(main_db)
+    for month in _iter_months(month_from, month_to):
+        main_db.begin()
+        try:
+            totals = aggregate_month(main_db, month, lock=True)
+            with main_db.cursor() as cur:
+                cur.execute(f"DELETE FROM {RECAP_TABLE} WHERE month = %s", [month])
+                n = totals.apply(cur)
+            main_db.commit()
+        except Exception:
+            main_db.rollback()
+            raise
+        log(f"[RECAP] {month:%Y-%m} rebuilt: {n} value(s)")
+
+def check(main_db, month):
+    """Return jumlah (nik, metric) yang berbeda antara rekap dan scan"""
+    month = month_of(month)
+    expected = {k: v for k, v in aggregate_month(main_db, month).values.items() if v}
+    actual = {k: v for k, v in load_month(main_db, month).items() if v}
+    main_db.commit()
+
+    diffs = [
+        (key, expected.get(key, 0), actual.get(key, 0))
+        for key in sorted(expected.keys() | actual.keys())
+        if expected.get(key, 0) != actual.get(key, 0)
+    ]
+    for (nik, _, metric), exp, act in diffs[:20]:
+        log_warn(f"[RECAP] {month:%Y-%m} {nik} {metric}: recap={act} summaries={exp}")
+
+    log(f"[RECAP] {month:%Y-%m} checked {len(expected)} value(s), mismatch={len(diffs)}")
+    return len(diffs)
+
+# =====================================================
+# CLI
+# =====================================================
+
+def parse_month(s):
+    return month_of(f"{s[:7]}-01")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rekap bulanan absensi per (nik, bulan)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("rebuild", help="hitung ulang rekap dari absensi_summaries")
+    p.add_argument("--from", dest="month_from", required=True, help="YYYY-MM")
+    p.add_argument("--to", dest="month_to", help="YYYY-MM (default = --from)")
+
+    p = sub.add_parser("check", help="bandingkan rekap dengan absensi_summaries")
+    p.add_argument("--month", required=True, help="YYYY-MM")
+
+    p = sub.add_parser("show", help="rekap satu pegawai")
+    p.add_argument("nik")
+    p.add_argument("--month", required=True, help="YYYY-MM")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # konfigurasi DB dari .env yang sama dengan main.py
+    from main import make_router
+
+    router = make_router()
+    code = 0
+    try:
+        main_db = router.writer()
+
+        if args.cmd == "rebuild":
+            rebuild(main_db, parse_month(args.month_from), parse_month(args.month_to or args.month_from))
+
+        elif args.cmd == "check":
+            code = 1 if check(main_db, parse_month(args.month)) else 0
+
+        elif args.cmd == "show":
+            month = parse_month(args.month)
+            with main_db.cursor() as cur:
+                cur.execute(f"""
+                    SELECT metric, value FROM {RECAP_TABLE}
+                    WHERE nik = %s AND month = %s
+                    ORDER BY metric
+                """, [args.nik, month])
+                for r in cur.fetchall():
+                    log(f"[RECAP] {args.nik} {month:%Y-%m} {r['metric']} = {r['value']}")
+
+    except Exception as e:
+        log_error(f"[RECAP] {args.cmd} failed: {e}")
+        code = 1
+    finally:
+        router.close()
+
+    sys.exit(code)
@@ -0,0 +1,328 @@
+# recompute.py
+# =====================================================
+# Recompute on-demand satu pegawai (point query, latency rendah)
+# =====================================================
+#
+#   python recompute.py 1971xxxxxxxx --dates 2026-10-05,2026-10-06
+#   python recompute.py 1971xxxxxxxx --from 2026-10-01 --to 2026-10-07 --dry-run
+#
+# Opsi yang mengubah hasil transform (--engine, --tap-dedupe-seconds)
+# harus sama dengan main.py / recompute_queue.py di deployment yang sama.
+#
+# Berbeda dengan `main.py --nik X` (extract penuh lalu filter):
+# hanya history pegawai itu, device unit-nya dan jadwal yang berlaku
+# yang diambil, satu query per tabel untuk semua tanggal sekaligus.
+# Baca dari primary (perubahan HR harus langsung terlihat).
+
+import argparse
+import sys
+import time
+
+from utils import log, log_error, parse_date, date_range, time_block
+from extract import select_columns, _in_list
+from transform import get_engine, iter_target_niks
+from load import load_rows
+from cache import EtlContext
+
+# =====================================================
+# FETCH (SEMUA TANGGAL SEKALIGUS)
+# =====================================================
+
+def _active_on(row, date, begin="begin_date", end="end_date"):
+    """Filter periode berlaku seperti query extract per tanggal"""
+    b = row.get(begin)
+    e = row.get(end)
+    return (b is None or b <= date) and (e is None or e >= date)
+
+def fetch_pegawai(main_db, aux_db, att_db, nik, dates):
+    """
+    Return dict rows mentah per sumber, untuk semua tanggal.
+    Query memakai kolom ber-index (nik / unit / sub unit) tanpa TRIM.
+    """
+    d_min, d_max = min(dates), max(dates)
+    out = {}
+
+    with main_db.cursor() as cur:
+        cur.execute("""
+            SELECT
+                mp.nik,
+                ph.id_unit,
+                ph.id_sub_unit,
+                ph.lokasi_kerja,
+                ph.begin_date,
+                ph.end_date
+            FROM master_pegawais mp
+            JOIN pegawai_histories ph ON ph.master_pegawai_id = mp.id
+            WHERE mp.nik = %s
+              AND ph.begin_date <= %s
+              AND (ph.end_date IS NULL OR ph.end_date >= %s)
+        """, [nik, d_max, d_min])
+        out["history"] = cur.fetchall()
+
+        cur.execute(f"""
+            SELECT nik, date, jam_masuk, jam_pulang,
+                penalti_tidak_tap_in,
+                penalti_tidak_tap_out
+            FROM jadwal_pegawais
+            WHERE nik = %s AND date IN ({_in_list(dates)})
+        """, [nik, *dates])
+        out["jadwal_pegawai"] = cur.fetchall()
+
+        units = sorted({str(h["id_unit"]) for h in out["history"] if h["id_unit"] is not None})
+        sub_units = sorted({str(h["id_sub_unit"]) for h in out["history"] if h["id_sub_unit"] is not None})
+
+        out["jadwal_sub_unit"] = []
+        if sub_units:
+            cur.execute(f"""
+                SELECT sub_unit_id, hari, jam_masuk, jam_pulang,
+                    penalti_tidak_tap_in,
+                    penalti_tidak_tap_out,
+                    start_date, end_date
+                FROM jadwal_sub_units
+                WHERE sub_unit_id IN ({_in_list(sub_units)})
+                  AND (start_date IS NULL OR start_date <= %s)
+                  AND (end_date IS NULL OR end_date >= %s)
+            """, [*sub_units, d_max, d_min])
+            out["jadwal_sub_unit"] = cur.fetchall()
+
+        out["jadwal_unit"] = []
+        if units:
+            cur.execute(f"""
+                SELECT unit_id, hari, jam_masuk, jam_pulang,
+                    penalti_tidak_tap_in,
+                    penalti_tidak_tap_out,
+                    start_date, end_date
+                FROM jadwal_units
+                WHERE unit_id IN ({_in_list(units)})
+                  AND (start_date IS NULL OR start_date <= %s)
+                  AND (end_date IS NULL OR end_date >= %s)
+            """, [*units, d_max, d_min])
+            out["jadwal_unit"] = cur.fetchall()
+
+        cur.execute("""
+            SELECT hari, jam_masuk, jam_pulang,
+                penalti_tidak_tap_in,
+                penalti_tidak_tap_out,
+                start_date, end_date
+            FROM jadwal_dinas
+            WHERE (start_date IS NULL OR start_date <= %s)
+              AND (end_date IS NULL OR end_date >= %s)
+        """, [d_max, d_min])
+        out["jadwal_dinas"] = cur.fetchall()
+
+    # unit multi (csv) → device per unit tunggal
+    unit_parts = sorted({
+        u.strip()
+        for unit in units
+        for u in unit.split(",")
+        if u.strip()
+    })
+
+    with aux_db.cursor() as cur:
+        out["devices"] = []
+        if unit_parts:
+            cur.execute(f"""
+                SELECT id, unit_id, device_id, `desc`
+                FROM tbl_device
+                WHERE unit_id IN ({_in_list(unit_parts)})
+                   OR {" OR ".join(["FIND_IN_SET(%s, REPLACE(unit_id, ' ', ''))"] * len(unit_parts))}
+            """, [*unit_parts, *unit_parts])
+            out["devices"] = cur.fetchall()
+
+        cur.execute(f"""
+            SELECT
+                {select_columns("tbl_absent")}
+            FROM tbl_absent
+            WHERE nik = %s AND `date` IN ({_in_list(dates)})
+        """, [nik, *dates])
+        out["absent"] = cur.fetchall()
+
+        cur.execute(f"""
+            SELECT
+                {select_columns("tbl_absent_hourly")}
+            FROM tbl_absent_hourly
+            WHERE nik = %s AND `date` IN ({_in_list(dates)})
+        """, [nik, *dates])
+        out["tapping"] = cur.fetchall()
+
+    # `nik = %s` (bukan TRIM) → index (nik, date) terpakai;
+    # collation PAD SPACE tetap cocok dengan spasi di belakang
+    with att_db.cursor() as cur:
+        cur.execute(f"""
+            SELECT
+                {select_columns("DB_ATT_tbl_attendance")}
+            FROM DB_ATT_tbl_attendance
+            WHERE nik = %s
+              AND `date` >= %s
+              AND `date` <= %s
+            ORDER BY `time`
+        """, [nik, f"{d_min} 00:00:00", f"{d_max} 23:59:59"])
+        out["attendance"] = cur.fetchall()
+
+    return out
+
+# =====================================================
+# CONTEXT PER TANGGAL
+# =====================================================
+
+def fill_context(etl, fetched, date):
+    """Isi etl (sudah reset) dari rows hasil fetch_pegawai untuk satu tanggal"""
+    for row in fetched["history"]:
+        if _active_on(row, date):
+            etl.add_pegawai_ctx(row)
+
+    for row in fetched["devices"]:
+        etl.add_device(row)
+
+    for row in fetched["absent"]:
+        if row["date"] == date:
+            etl.add_absent(row)
+
+    for row in fetched["tapping"]:
+        if row["date"] == date:
+            etl.add_tap(row)
+
+    for row in fetched["jadwal_pegawai"]:
+        if row["date"] == date:
+            etl.add_jadwal_pegawai(row)
+
+    for row in fetched["jadwal_sub_unit"]:
+        if _active_on(row, date, "start_date", "end_date"):
+            etl.add_jadwal_sub_unit(row)
+
+    for row in fetched["jadwal_unit"]:
+        if _active_on(row, date, "start_date", "end_date"):
+            etl.add_jadwal_unit(row)
+
+    for row in fetched["jadwal_dinas"]:
+        if _active_on(row, date, "start_date", "end_date"):
+            etl.add_jadwal_dinas(row)
+
+    for row in fetched["attendance"]:
+        if row["tanggal"] != date:
+            continue
+        # row dipakai ulang antar tanggal → salinan sebelum di-encode
+        row = dict(row)
+        row["device_id"] = etl.encode_id(row["device_id"]) if row["device_id"] else None
+        row["nik"] = etl.encode_id(row["nik"])
+        etl.add_attendance(row["nik"], date, row)
+
+# =====================================================
+# RECOMPUTE
+# =====================================================
+
+def recompute_pegawai(
+    main_db,
+    aux_db,
+    att_db,
+    nik,
+    dates,
+    engine="fast",
+    load=True,
+    stats=None,
+    tap_dedupe_seconds=None,
+):
+    """
+    Hitung ulang absensi_summaries satu NIK untuk daftar tanggal.
+    load=True → upsert ke main_db (satu transaksi untuk semua tanggal)
+    Return list row hasil transform
+    """
+    dates = sorted(set(dates))
+    if not dates:
+        return []
+
+    nik = nik.strip()
+    process = get_engine(engine)
+    etl = EtlContext(tap_dedupe_seconds=tap_dedupe_seconds)
+
+    with time_block("recompute_fetch", stats):
+        fetched = fetch_pegawai(main_db, aux_db, att_db, nik, dates)
+
+    rows = []
+    with time_block("recompute_transform", stats):
+        for date in dates:
+            etl.reset()
+            fill_context(etl, fetched, date)
+            # sama dengan main.py --nik: hanya jika ada history / tap
+            rows.extend(process(etl, code, date) for code in iter_target_niks(etl, nik=nik))
+
+    if load and rows:
+        load_rows(main_db, rows, stats=stats, auto_tune=False)
+
+    return rows
+
+# =====================================================
+# CLI
+# =====================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Recompute absensi_summaries satu pegawai"
+    )
+    parser.add_argument("nik")
+    parser.add_argument("--dates", help="daftar tanggal YYYY-MM-DD (csv)")
+    parser.add_argument("--from", dest="date_from")
+    parser.add_argument("--to", dest="date_to")
+    parser.add_argument("--engine", default="fast")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--tap-dedupe-seconds", type=int, default=None,
+                        help="toleransi tap duplikat (lihat main.py), default nonaktif")
+
+    args = parser.parse_args()
+    if not args.dates and not args.date_from:
+        parser.error("--dates or --from is required")
+    if args.tap_dedupe_seconds is not None and args.tap_dedupe_seconds < 0:
+        parser.error("--tap-dedupe-seconds must be >= 0 (omit to disable)")
+    return args
+
+def parse_dates(args):
+    dates = []
+    if args.dates:
+        dates += [parse_date(d.strip()) for d in args.dates.split(",") if d.strip()]
+    if args.date_from:
+        date_from = parse_date(args.date_from)
+        date_to = parse_date(args.date_to) if args.date_to else date_from
+        dates += list(date_range(date_from, date_to))
+    return dates
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # konfigurasi DB dari .env yang sama dengan main.py
+    from main import make_router
+
+    router = make_router()
+    start = time.perf_counter()
+    stats = {}
+
+    try:
+        rows = recompute_pegawai(
+            router.primary("main"),
+            router.primary("aux"),
+            router.primary("att"),
+            args.nik,
+            parse_dates(args),
+            engine=args.engine,
+            load=not args.dry_run,
+            stats=stats,
+            tap_dedupe_seconds=args.tap_dedupe_seconds,
+        )
+    except Exception as e:
+        log_error(f"Recompute failed: {e}")
+        sys.exit(1)
+    finally:
+        router.close()
+
+    for row in rows:
+        log(
+            f"[RECOMPUTE] {row['nik']} {row['date']} "
+            f"in={row['time_in_final']} out={row['time_out_final']} "
+            f"status={row['status_hari_final']} note={row['final_note']}"
+        )
+
+    log(
+        f"[RECOMPUTE] nik={args.nik} rows={len(rows)} "
+        f"total={(time.perf_counter() - start) * 1000:.1f}ms "
+        f"{'(dry-run)' if args.dry_run else ''}"
+    )
+    sys.exit(0)
@@ -0,0 +1,602 @@
+# recompute_queue.py
+# =====================================================
+# Antrian recompute (nik, date) + change detection + worker
+# =====================================================
+#
+#   python recompute_queue.py init                # buat tabel antrian/state
+#   python recompute_queue.py enqueue NIK 2026-10-05 [2026-10-06 ...]
+#   python recompute_queue.py detect              # scan perubahan sumber → antrian
+#   python recompute_queue.py drain               # kosongkan antrian sekali
+#   python recompute_queue.py drain --loop --interval 30   # detect + drain terus
+#   python recompute_queue.py status
+#
+# Antrian disimpan di MAIN DB (primary). Perubahan sumber dideteksi
+# lewat kolom timestamp (CHANGE_SOURCES, default updated_at) dengan
+# watermark per tabel. Row yang DIHAPUS tidak terdeteksi → enqueue manual.
+#
+# Beberapa worker boleh drain bersamaan: pair di-claim dengan token +
+# lease (UPDATE ... LIMIT, seperti lease.py); lease kedaluwarsa (worker
+# mati) → pair di-claim worker lain. Extract selalu dari primary:
+# perubahan dideteksi di primary, replica yang tertinggal akan
+# menghasilkan row lama lalu pair-nya terhapus dari antrian.
+
+import argparse
+import json
+import signal
+import sys
+import time
+import uuid
+from datetime import date as date_cls, timedelta
+
+from utils import log, log_warn, log_error, parse_date, time_block
+from extract import (
+    extract_all,
+    extract_attendance,
+    extract_pegawai_ctx,
+    extract_devices,
+    extract_absent,
+    extract_tapping,
+    extract_jadwal,
+)
+from transform import get_engine
+from load import load_rows
+from cache import EtlContext
+from lease import node_name
+
+# =====================================================
+# TABLES
+# =====================================================
+
+QUEUE_TABLE = "absensi_recompute_queue"
+STATE_TABLE = "absensi_recompute_state"
+
+CREATE_QUEUE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {QUEUE_TABLE} (
+    nik         VARCHAR(32) NOT NULL,
+    date        DATE NOT NULL,
+    reason      VARCHAR(64) NULL,
+    enqueued_at DATETIME(6) NOT NULL,
+    owner       VARCHAR(128) NULL,
+    claim_token CHAR(32) NULL,
+    lease_until DATETIME NULL,
+    PRIMARY KEY (nik, date),
+    KEY idx_date (date),
+    KEY idx_claim_token (claim_token)
+)
+"""
+
+# kolom claim (tabel antrian versi lama ditambah lewat ALTER)
+CLAIM_COLUMNS = {
+    "owner": "VARCHAR(128) NULL",
+    "claim_token": "CHAR(32) NULL",
+    "lease_until": "DATETIME NULL",
+}
+
+# lama claim satu batch; lebih lama → pair bisa diambil worker lain
+QUEUE_LEASE_SECONDS = 900
+
+CREATE_STATE_SQL = f"""
+CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+    source     VARCHAR(64) NOT NULL PRIMARY KEY,
+    watermark  DATETIME(6) NULL,
+    seen       MEDIUMTEXT NULL,
+    updated_at DATETIME(6) NOT NULL
+)
+"""
+
+# kolom state yang ditambah setelah tabel versi pertama
+STATE_COLUMNS = {
+    "seen": "MEDIUMTEXT NULL",
+}
+
+ENQUEUE_SQL = f"""
+INSERT INTO {QUEUE_TABLE} (nik, date, reason, enqueued_at)
+VALUES (%(nik)s, %(date)s, %(reason)s, NOW(6))
+ON DUPLICATE KEY UPDATE
+    reason = VALUES(reason),
+    enqueued_at = VALUES(enqueued_at)
+"""
+
+def init_tables(main_db):
+    with main_db.cursor() as cur:
+        cur.execute(CREATE_QUEUE_SQL)
+        cur.execute(CREATE_STATE_SQL)
+    main_db.commit()
+    ensure_claim_columns(main_db)
+    ensure_state_columns(main_db)
+
+def _add_missing_columns(main_db, table, columns, keys=None):
+    """
+    ALTER TABLE untuk kolom yang belum ada (tabel dibuat versi lama).
+    keys: {kolom: definisi KEY} ditambah bersama kolomnya
+    """
+    keys = keys or {}
+    with main_db.cursor() as cur:
+        cur.execute("""
+            SELECT COLUMN_NAME AS name
+            FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, [table])
+        existing = {r["name"] for r in cur.fetchall()}
+        missing = [c for c in columns if c not in existing]
+        if missing:
+            cur.execute(
+                f"ALTER TABLE {table} "
+                + ", ".join(
+                    [f"ADD COLUMN {c} {columns[c]}" for c in missing]
+                    + [f"ADD {keys[c]}" for c in missing if c in keys]
+                )
+            )
+            log(f"[QUEUE] added column(s) to {table}: {', '.join(missing)}")
+    main_db.commit()
+
+def ensure_claim_columns(main_db):
+    """Tambah kolom claim ke tabel antrian yang dibuat sebelum ada claim"""
+    _add_missing_columns(
+        main_db, QUEUE_TABLE, CLAIM_COLUMNS,
+        keys={"claim_token": "KEY idx_claim_token (claim_token)"},
+    )
+
+def ensure_state_columns(main_db):
+    _add_missing_columns(main_db, STATE_TABLE, STATE_COLUMNS)
+
+def enqueue(main_db, pairs, reason=None):
+    """
+    pairs: iterable (nik, date). Idempotent (PRIMARY KEY nik, date),
+    enqueue ulang memperbarui enqueued_at → tidak ikut terhapus oleh
+    drain yang sedang berjalan.
+    """
+    rows = [
+        {"nik": str(nik).strip(), "date": d, "reason": reason}
+        for nik, d in {(str(n).strip(), d) for n, d in pairs}
+    ]
+    if not rows:
+        return 0
+
+    with main_db.cursor() as cur:
+        for i in range(0, len(rows), 1000):
+            cur.executemany(ENQUEUE_SQL, rows[i:i + 1000])
+    main_db.commit()
+    return len(rows)
+
+def queue_depth(main_db):
+    """Return (jumlah pair, jumlah tanggal, tanggal tertua)"""
+    with main_db.cursor() as cur:
+        cur.execute(f"""
+            SELECT COUNT(*) AS pairs, COUNT(DISTINCT date) AS dates, MIN(date) AS oldest
+            FROM {QUEUE_TABLE}
+        """)
+        row = cur.fetchone()
+    main_db.commit()
+    return row["pairs"], row["dates"], row["oldest"]
+
+# =====================================================
+# CHANGE DETECTION
+# =====================================================
+# source → (logical db, SQL). SQL menerima satu parameter watermark dan
+# mengembalikan nik, date (atau begin_date / end_date untuk history)
+# dan changed_at.
+
+TIMESTAMP_COLUMN = "updated_at"
+
+# baca ulang sebagian sebelum watermark (transaksi commit terlambat).
+# Row di jendela overlap yang sudah di-enqueue dicatat di kolom `seen`
+# → tidak di-enqueue ulang setiap siklus
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+# history: rentang tanggal yang di-enqueue dibatasi ke N hari terakhir
+HISTORY_LOOKBACK_DAYS = 45
+
+CHANGE_SOURCES = {
+    "tbl_absent": ("aux", f"""
+        SELECT TRIM(nik) AS nik, `date`, {TIMESTAMP_COLUMN} AS changed_at
+        FROM tbl_absent
+        WHERE {TIMESTAMP_COLUMN} >= %s
+    """),
+    "tbl_absent_hourly": ("aux", f"""
+        SELECT TRIM(nik) AS nik, `date`, {TIMESTAMP_COLUMN} AS changed_at
+        FROM tbl_absent_hourly
+        WHERE {TIMESTAMP_COLUMN} >= %s
+    """),
+    "jadwal_pegawais": ("main", f"""
+        SELECT TRIM(nik) AS nik, `date`, {TIMESTAMP_COLUMN} AS changed_at
+        FROM jadwal_pegawais
+        WHERE {TIMESTAMP_COLUMN} >= %s
+    """),
+    "pegawai_histories": ("main", f"""
+        SELECT TRIM(mp.nik) AS nik, ph.begin_date, ph.end_date,
+            ph.{TIMESTAMP_COLUMN} AS changed_at
+        FROM pegawai_histories ph
+        JOIN master_pegawais mp ON mp.id = ph.master_pegawai_id
+        WHERE ph.{TIMESTAMP_COLUMN} >= %s
+    """),
+}
+
+def _history_dates(row, today):
+    """Tanggal terdampak perubahan history, dipotong ke lookback"""
+    lo = max(row["begin_date"] or today, today - timedelta(days=HISTORY_LOOKBACK_DAYS))
+    hi = min(row["end_date"] or today, today)
+    d = lo
+    while d <= hi:
+        yield d
+        d += timedelta(days=1)
+
+def _row_key(source, row):
+    """Identitas satu perubahan (row sumber + changed_at) untuk `seen`"""
+    if source == "pegawai_histories":
+        key = (row["nik"], row["begin_date"], row["end_date"], row["changed_at"])
+    else:
+        key = (row["nik"], row["date"], row["changed_at"])
+    return "|".join("" if v is None else str(v) for v in key)
+
+def _load_watermarks(main_db):
+    """Return {source: (watermark, set row key jendela overlap)}"""
+    with main_db.cursor() as cur:
+        cur.execute(f"SELECT source, watermark, seen FROM {STATE_TABLE}")
+        return {
+            r["source"]: (r["watermark"], set(json.loads(r["seen"])) if r["seen"] else set())
+            for r in cur.fetchall()
+        }
+
+def _save_watermark(cur, source, watermark, seen=()):
+    cur.execute(f"""
+        INSERT INTO {STATE_TABLE} (source, watermark, seen, updated_at)
+        VALUES (%s, %s, %s, NOW(6))
+        ON DUPLICATE KEY UPDATE
+            watermark = VALUES(watermark),
+            seen = VALUES(seen),
+            updated_at = VALUES(updated_at)
+    """, [source, watermark, json.dumps(sorted(seen))])
+
+def detect_changes(router, stats=None):
+    """
+    Scan CHANGE_SOURCES sejak watermark → enqueue (nik, date).
+    Source tanpa watermark (run pertama) hanya dicatat MAX(changed_at),
+    tidak meng-enqueue seluruh isi tabel.
+    Row jendela overlap yang sudah tercatat di `seen` dilewati.
+    Return jumlah pair yang di-enqueue.
+    """
+    main_db = router.writer()
+    ensure_state_columns(main_db)
+    watermarks = _load_watermarks(main_db)
+    today = date_cls.today()
+    total = 0
+
+    with time_block("queue_detect", stats):
+        for source, (db_name, sql) in CHANGE_SOURCES.items():
+            src_db = router.primary(db_name)
+            watermark, seen = watermarks.get(source, (None, set()))
+
+            with src_db.cursor() as cur:
+                if watermark is None:
+                    cur.execute(f"SELECT MAX(changed_at) AS w FROM ({sql}) t", ["1970-01-01"])
+                    new_watermark = cur.fetchone()["w"]
+                    # isi jendela overlap awal dianggap sudah diproses
+                    read = []
+                    if new_watermark is not None:
+                        cur.execute(sql, [new_watermark - WATERMARK_OVERLAP])
+                        read = cur.fetchall()
+                    rows = []
+                else:
+                    cur.execute(sql, [watermark - WATERMARK_OVERLAP])
+                    read = cur.fetchall()
+                    new_watermark = max(
+                        [watermark] + [r["changed_at"] for r in read if r["changed_at"]]
+                    )
+                    rows = [r for r in read if _row_key(source, r) not in seen]
+            src_db.commit()
+
+            # seen berikutnya: row yang akan terbaca lagi di overlap siklus depan
+            seen = (
+                {_row_key(source, r) for r in read if r["changed_at"] >= new_watermark - WATERMARK_OVERLAP}
+                if new_watermark is not None else set()
+            )
+
+            if source == "pegawai_histories":
+                pairs = [(r["nik"], d) for r in rows for d in _history_dates(r, today)]
+            else:
+                pairs = [(r["nik"], r["date"]) for r in rows]
+
+            n = enqueue(main_db, pairs, reason=source)
+            total += n
+
+            with main_db.cursor() as cur:
+                _save_watermark(cur, source, new_watermark, seen)
+            main_db.commit()
+
+            if n or watermark is None:
+                log(f"[QUEUE] detect {source}: {len(rows)} changed row(s) → {n} pair(s), watermark={new_watermark}")
+
+    if stats is not None:
+        stats["queue_detected"] = total
+    return total
+
+# =====================================================
+# WORKER
+# =====================================================
+
+# grup tanggal dengan NIK lebih banyak dari ini → extract penuh satu hari
+FULL_EXTRACT_THRESHOLD = 500
+
+def _claim(main_db, limit, lease_seconds=QUEUE_LEASE_SECONDS, owner=None):
+    """
+    Claim batch antrian (belum di-claim / lease kedaluwarsa), tanggal
+    tertua dulu. UPDATE ... LIMIT atomik → dua worker tidak pernah
+    mendapat pair yang sama. Return (token, {date: {nik: enqueued_at}})
+    """
+    token = uuid.uuid4().hex
+    try:
+        with main_db.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {QUEUE_TABLE}
+                SET owner = %s, claim_token = %s,
+                    lease_until = NOW() + INTERVAL %s SECOND
+                WHERE claim_token IS NULL OR lease_until < NOW()
+                ORDER BY date, nik
+                LIMIT %s
+            """, [owner or node_name(), token, lease_seconds, limit])
+            rows = []
+            if cur.rowcount:
+                cur.execute(f"""
+                    SELECT nik, date, enqueued_at
+                    FROM {QUEUE_TABLE}
+                    WHERE claim_token = %s
+                """, [token])
+                rows = cur.fetchall()
+        main_db.commit()
+    except Exception:
+        main_db.rollback()
+        raise
+
+    groups = {}
+    for r in rows:
+        groups.setdefault(r["date"], {})[r["nik"]] = r["enqueued_at"]
+    return token, groups
+
+def _release(main_db, token, date=None):
+    """Lepas claim (pair tetap di antrian untuk worker berikutnya)"""
+    with main_db.cursor() as cur:
+        cur.execute(f"""
+            UPDATE {QUEUE_TABLE}
+            SET owner = NULL, claim_token = NULL, lease_until = NULL
+            WHERE claim_token = %s
+        """ + (" AND date = %s" if date is not None else ""),
+            [token] + ([date] if date is not None else []))
+    main_db.commit()
+
+def _extract_group(etl, router, date, niks, stats):
+    """
+    Extract bersama untuk satu tanggal, hanya NIK antrian jika sedikit.
+    Selalu dari primary (lihat header modul)
+    """
+    main_db, aux_db, att_db = (router.primary(name) for name in ("main", "aux", "att"))
+    # akhiri transaksi lama → snapshot REPEATABLE READ baru
+    for conn in (main_db, aux_db, att_db):
+        conn.commit()
+
+    if len(niks) > FULL_EXTRACT_THRESHOLD:
+        extract_all(etl, main_db, aux_db, att_db, date, stats=stats)
+        return
+
+    extract_pegawai_ctx(etl, main_db, date, stats=stats, niks=niks)
+    extract_devices(etl, aux_db, stats)
+    extract_absent(etl, aux_db, date, stats)
+    extract_tapping(etl, aux_db, date, stats)
+    extract_jadwal(etl, main_db, date, stats)
+    extract_attendance(etl, att_db, date, stats=stats, niks=niks)
+
+def _process_group(etl, router, process, date, niks, stats):
+    """Extract + transform NIK antrian satu tanggal. Return rows"""
+    etl.reset()
+    _extract_group(etl, router, date, niks, stats)
+
+    # sama dengan main.py --nik: hanya NIK dengan history / tap
+    rows = []
+    for nik in niks:
+        code = etl.find_id(nik)
+        if code is None:
+            continue
+        if code in etl.pegawai_ctx or etl.get_attendance(code, date):
+            rows.append(process(etl, code, date))
+    return rows
+
+def _ack(main_db, token, date, claimed):
+    """
+    Hapus pair yang sudah diproses dan masih milik claim ini (kecuali
+    di-enqueue ulang sejak claim → claim dilepas, diproses lagi)
+    """
+    with main_db.cursor() as cur:
+        cur.executemany(f"""
+            DELETE FROM {QUEUE_TABLE}
+            WHERE nik = %s AND date = %s AND enqueued_at <= %s AND claim_token = %s
+        """, [(nik, date, at, token) for nik, at in claimed.items()])
+    main_db.commit()
+    _release(main_db, token, date)
+
+def drain_queue(
+    router,
+    etl,
+    batch_size=2000,
+    engine="fast",
+    load_batch_size=500,
+    dry_run=False,
+    stats=None,
+    lease_seconds=QUEUE_LEASE_SECONDS,
+):
+    """
+    Proses antrian sampai kosong (satu kali jalan).
+    Per batch: claim → kelompokkan per tanggal → satu extract per tanggal
+    → transform NIK antrian → load → ack.
+    Return jumlah pair yang diproses.
+    """
+    process = get_engine(engine)
+    main_db = router.writer()
+    ensure_claim_columns(main_db)
+    owner = node_name()
+    done = 0
+    start = time.perf_counter()
+
+    while True:
+        token, groups = _claim(main_db, batch_size, lease_seconds, owner)
+        if not groups:
+            break
+
+        try:
+            for date, claimed in sorted(groups.items()):
+                t0 = time.perf_counter()
+                rows = _process_group(etl, router, process, date, sorted(claimed), stats)
+
+                if dry_run:
+                    log(f"[QUEUE] dry-run {date}: {len(rows)} row(s), queue untouched")
+                else:
+                    load_rows(main_db, rows, batch_size=load_batch_size, stats=stats)
+                    _ack(main_db, token, date, claimed)
+
+                done += len(claimed)
+                elapsed = time.perf_counter() - t0
+                log(
+                    f"[QUEUE] {date} pairs={len(claimed)} rows={len(rows)} "
+                    f"{elapsed * 1000:.0f}ms ({len(claimed) / elapsed:.0f} pairs/s)"
+                )
+        finally:
+            # sisa claim (gagal / dry-run) dilepas → worker lain / siklus berikutnya.
+            # Gagal lepas → lease kedaluwarsa sendiri, error asli tetap naik
+            try:
+                _release(main_db, token)
+            except Exception as e:
+                log_warn(f"[QUEUE] release claim {token} failed (lease expires): {e}")
+
+        if dry_run:
+            break
+
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed > 0 else 0.0
+    pairs, dates, oldest = queue_depth(main_db)
+
+    if stats is not None:
+        stats["queue_drained"] = done
+        stats["queue_drain_rate"] = round(rate, 1)
+        stats["queue_depth"] = pairs
+
+    log(
+        f"[QUEUE] drained {done} pair(s) in {elapsed:.1f}s ({rate:.0f} pairs/s) | "
+        f"depth={pairs} dates={dates} oldest={oldest}"
+    )
+    return done
+
+def run_worker(router, etl, args):
+    """Loop detect + drain setiap args.interval detik (SIGTERM → berhenti)"""
+    stop = {"flag": False}
+
+    def _stop(signum, frame):
+        log(f"Signal {signum} received, stopping queue worker")
+        stop["flag"] = True
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    while not stop["flag"]:
+        cycle_start = time.monotonic()
+        try:
+            router.refresh()
+            if not args.no_detect:
+                detect_changes(router)
+            drain_queue(
+                router,
+                etl,
+                batch_size=args.batch,
+                engine=args.engine,
+                dry_run=args.dry_run,
+                lease_seconds=args.lease_seconds,
+            )
+        except Exception as e:
+            log_error(f"Queue worker cycle failed: {e}")
+
+        deadline = cycle_start + args.interval
+        while not stop["flag"] and time.monotonic() < deadline:
+            time.sleep(max(0.0, min(1.0, deadline - time.monotonic())))
+
+# =====================================================
+# CLI
+# =====================================================
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Antrian recompute absensi (nik, date)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    sub.add_parser("init", help="buat tabel antrian & state")
+    sub.add_parser("status", help="kedalaman antrian")
+    sub.add_parser("detect", help="scan perubahan tabel sumber → antrian")
+
+    p = sub.add_parser("enqueue", help="tambah pair manual")
+    p.add_argument("nik")
+    p.add_argument("dates", nargs="+")
+
+    p = sub.add_parser("drain", help="proses antrian")
+    p.add_argument("--batch", type=int, default=2000, help="pair per claim")
+    p.add_argument("--engine", default="fast")
+    p.add_argument("--dry-run", action="store_true")
+    p.add_argument("--loop", action="store_true", help="detect + drain berulang")
+    p.add_argument("--interval", type=int, default=30)
+    p.add_argument("--lease-seconds", type=int, default=QUEUE_LEASE_SECONDS,
+                   help="lama claim satu batch sebelum boleh diambil worker lain")
+    p.add_argument("--no-detect", action="store_true",
+                   help="--loop tanpa change detection (antrian diisi proses lain)")
+    p.add_argument("--tap-dedupe-seconds", type=int, default=None,
+                   help="toleransi tap duplikat (lihat main.py), default nonaktif")
+
+    args = parser.parse_args()
+    if getattr(args, "tap_dedupe_seconds", None) is not None and args.tap_dedupe_seconds < 0:
+        parser.error("--tap-dedupe-seconds must be >= 0 (omit to disable)")
+    if getattr(args, "lease_seconds", 1) <= 0:
+        parser.error("--lease-seconds must be > 0")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+
+    # konfigurasi DB dari .env yang sama dengan main.py
+    from main import make_router
+
+    router = make_router()
+    try:
+        main_db = router.writer()
+
+        if args.cmd == "init":
+            init_tables(main_db)
+            log(f"[QUEUE] tables ready: {QUEUE_TABLE}, {STATE_TABLE}")
+
+        elif args.cmd == "enqueue":
+            n = enqueue(main_db, [(args.nik, parse_date(d)) for d in args.dates], reason="manual")
+            log(f"[QUEUE] enqueued {n} pair(s)")
+
+        elif args.cmd == "detect":
+            detect_changes(router)
+
+        elif args.cmd == "status":
+            pairs, dates, oldest = queue_depth(main_db)
+            log(f"[QUEUE] depth={pairs} dates={dates} oldest={oldest}")
+
+        elif args.cmd == "drain":
+            etl = EtlContext(
+                tap_dedupe_seconds=args.tap_dedupe_seconds
+            )
+            if args.loop:
+                run_worker(router, etl, args)
+            else:
+                drain_queue(
+                    router,
+                    etl,
+                    batch_size=args.batch,
+                    engine=args.engine,
+                    dry_run=args.dry_run,
+                    lease_seconds=args.lease_seconds,
+                )
+
+    except Exception as e:
+        log_error(f"[QUEUE] {args.cmd} failed: {e}")
+        sys.exit(1)
+    finally:
+        router.close()
+
+    sys.exit(0)
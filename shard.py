@@ -0,0 +1,257 @@
+# shard.py
+# =====================================================
+# Unit-sharded extract + transform untuk satu tanggal
+# =====================================================
+#
+#   python main.py --from 2026-10-01 --shards 4
+#   python main.py --from 2026-10-01 --shards 8 --shard-size 1500
+#
+# Plan: pegawai aktif (pegawai_histories) dikelompokkan per id_unit;
+# unit lebih besar dari shard_size dipecah per potongan NIK. NIK yang
+# punya tap tapi tanpa history aktif masuk shard "orphan" (run penuh
+# juga menghasilkan row untuk mereka). Shard dibagi ke worker
+# berdasarkan jumlah pegawai (terbesar dulu → worker paling ringan).
+#
+# Setiap worker: koneksi + EtlContext sendiri, extract hanya pegawai,
+# device, jadwal dan tap milik shard-nya, lalu transform. Load tetap
+# sekali di main.py (lihat run_etl) → hasil identik dengan run penuh.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import log, time_block, normalize_id
+from extract import (
+    extract_pegawai_ctx,
+    extract_devices,
+    extract_absent,
+    extract_tapping,
+    extract_jadwal,
+    extract_attendance,
+)
+from transform import transform_all
+from cache import EtlContext
+
+# pegawai per shard (unit lebih besar → dipecah)
+SHARD_SIZE = 2000
+
+ORPHAN = "orphan"
+
+# =====================================================
+# PLAN
+# =====================================================
+
+def active_histories(main_db, date):
+    """History aktif (nik, unit, sub unit) untuk tanggal"""
+    with main_db.cursor() as cur:
+        cur.execute("""
+            SELECT
+                mp.nik,
+                ph.id_unit,
+                ph.id_sub_unit
+            FROM pegawai_histories ph
+            JOIN master_pegawais mp ON mp.id = ph.master_pegawai_id
+            WHERE ph.begin_date <= %s
+              AND (ph.end_date IS NULL OR ph.end_date >= %s)
+        """, [date, date])
+        return cur.fetchall()
+
+def tapped_niks(att_db, date):
+    """NIK yang punya tap pada tanggal"""
+    with att_db.cursor() as cur:
+        cur.execute("""
+            SELECT DISTINCT TRIM(nik) AS nik
+            FROM DB_ATT_tbl_attendance
+            WHERE `date` >= %s
+            AND `date` < %s
+        """, [f"{date} 00:00:00", f"{date} 23:59:59"])
+        return {r["nik"] for r in cur.fetchall() if r["nik"]}
+
+def _new_shard(name, niks, histories):
+    """
+    niks: NIK shard; histories: semua history NIK tersebut
+    (pegawai multi-history → unit / sub unit / device semua history ikut,
+    cache memilih history pertama seperti run penuh)
+    """
+    units = sorted({normalize_id(h["id_unit"]) for h in histories if h["id_unit"] is not None})
+    sub_units = sorted({normalize_id(h["id_sub_unit"]) for h in histories if h["id_sub_unit"] is not None})
+    return {
+        "name": name,
+        "niks": niks,
+        "units": units,
+        "sub_units": sub_units,
+        # unit multi (csv) → device per unit tunggal
+        "device_units": sorted({u.strip() for unit in units for u in unit.split(",") if u.strip()}),
+        "size": len(niks),
+    }
+
+def _group_histories(histories):
+    """
+    Return (by_nik {nik: [history]}, by_unit {unit: [nik]});
+    unit pemilik = history pertama (sama dengan add_pegawai_ctx)
+    """
+    by_nik = {}
+    for h in histories:
+        nik = normalize_id(h["nik"])
+        if nik:
+            by_nik.setdefault(nik, []).append(h)
+
+    by_unit = {}
+    for nik, hs in by_nik.items():
+        by_unit.setdefault(normalize_id(hs[0]["id_unit"]), []).append(nik)
+
+    return by_nik, by_unit
+
+def plan_shards(histories, tapped, shard_size=SHARD_SIZE):
+    """
+    histories: rows active_histories; tapped: set NIK bertap
+    Return list shard dict (lihat _new_shard)
+    """
+    by_nik, by_unit = _group_histories(histories)
+
+    shards = []
+    for unit in sorted(by_unit, key=lambda u: (u is None, u or "")):
+        niks = sorted(by_unit[unit])
+        parts = (len(niks) + shard_size - 1) // shard_size
+        for i in range(parts):
+            chunk = niks[i * shard_size:(i + 1) * shard_size]
+            name = f"unit={unit}" + (f"#{i + 1}/{parts}" if parts > 1 else "")
+            shards.append(_new_shard(name, chunk, [h for nik in chunk for h in by_nik[nik]]))
+
+    orphans = sorted(tapped - by_nik.keys())
+    for i in range(0, len(orphans), shard_size):
+        shards.append(_new_shard(ORPHAN, orphans[i:i + shard_size], []))
+
+    return shards
+
+def unit_shard(histories, tapped, unit_id):
+    """
+    Shard satu work item distributed (date, unit), lihat lease.py.
+    unit_id ORPHAN → NIK bertap tanpa history aktif + NIK yang history
+    pemiliknya tanpa unit (tidak ditemukan discover_units).
+    Pembagian NIK sama dengan plan_shards → setiap NIK tepat satu item.
+    Return None jika item tidak punya pegawai
+    """
+    by_nik, by_unit = _group_histories(histories)
+
+    if unit_id != ORPHAN:
+        unit = normalize_id(unit_id)
+        niks = sorted(by_unit.get(unit, []))
+        name = f"unit={unit}"
+    else:
+        # NIK tanpa history cukup ikut filter NIK (extract_pegawai_ctx kosong)
+        no_unit = [nik for unit, niks in by_unit.items() if not unit for nik in niks]
+        niks = sorted(no_unit + sorted(tapped - by_nik.keys()))
+        name = f"{ORPHAN}+unit=None" if no_unit else ORPHAN
+
+    if not niks:
+        return None
+    return _new_shard(name, niks, [h for nik in niks for h in by_nik.get(nik, [])])
+
+def assign_shards(shards, workers):
+    """
+    Longest-processing-time first: shard terbesar ke worker dengan
+    total pegawai paling kecil. Return list (per worker) list shard
+    """
+    bins = [[] for _ in range(min(workers, len(shards)) or 1)]
+    loads = [0] * len(bins)
+
+    for shard in sorted(shards, key=lambda s: -s["size"]):
+        i = loads.index(min(loads))
+        bins[i].append(shard)
+        loads[i] += shard["size"]
+
+    return bins
+
+# =====================================================
+# EXTRACT + TRANSFORM PER SHARD
+# =====================================================
+
+def extract_shard(etl, main_db, aux_db, att_db, date, shard, stats=None):
+    """Extract hanya data milik shard ke etl (sudah reset)"""
+    niks = shard["niks"]
+
+    if shard["name"] != ORPHAN:
+        extract_pegawai_ctx(etl, main_db, date, stats=stats, niks=niks)
+    if shard["device_units"]:
+        extract_devices(etl, aux_db, stats, units=shard["device_units"])
+    extract_absent(etl, aux_db, date, stats, niks=niks)
+    extract_tapping(etl, aux_db, date, stats, niks=niks)
+    extract_jadwal(
+        etl, main_db, date, stats,
+        niks=niks, units=shard["units"], sub_units=shard["sub_units"],
+    )
+    extract_attendance(etl, att_db, date, stats=stats, niks=niks)
+
+def _run_worker(router, date, shards, engine, tap_dedupe_seconds):
+    """Satu worker: koneksi + context sendiri, shard berurutan"""
+    conns = {
+        name: router.reader_factory(name, date)()
+        for name in ("main", "aux", "att")
+    }
+    etl = EtlContext(tap_dedupe_seconds=tap_dedupe_seconds)
+    rows = []
+
+    try:
+        for shard in shards:
+            start = time.perf_counter()
+            etl.reset()
+            extract_shard(etl, conns["main"], conns["aux"], conns["att"], date, shard)
+            out = transform_all(etl, date, engine=engine)
+            rows.extend(out)
+            log(
+                f"[SHARD] {date} {shard['name']} pegawai={shard['size']} "
+                f"rows={len(out)} {(time.perf_counter() - start) * 1000:.0f}ms"
+            )
+    finally:
+        for conn in conns.values():
+            conn.close()
+
+    return rows
+
+def run_unit(router, etl, date, unit_id, engine=None, stats=None):
+    """
+    Extract + transform satu work item distributed (date, unit): filter
+    unit seperti shard, bukan extract satu kota. Return list row siap load
+    """
+    main_db, aux_db, att_db = router.readers(date)
+
+    with time_block("shard_plan", stats):
+        # tap hanya dibutuhkan untuk item orphan
+        tapped = tapped_niks(att_db, date) if unit_id == ORPHAN else set()
+        shard = unit_shard(active_histories(main_db, date), tapped, unit_id)
+
+    if shard is None:
+        log(f"[SHARD] {date} unit={unit_id}: no pegawai, nothing to do")
+        return []
+
+    with time_block("extract_total", stats):
+        extract_shard(etl, main_db, aux_db, att_db, date, shard, stats)
+
+    rows = transform_all(etl, date, stats=stats, engine=engine)
+    log(f"[SHARD] {date} {shard['name']} pegawai={shard['size']} rows={len(rows)}")
+    return rows
+
+def run_shards(router, date, workers, shard_size=SHARD_SIZE, engine=None, tap_dedupe_seconds=None, stats=None):
+    """
+    Extract + transform satu tanggal per shard unit secara paralel.
+    Return list row siap load (satu row per NIK, seperti transform_all)
+    """
+    main_db, _, att_db = router.readers(date)
+
+    with time_block("shard_plan", stats):
+        shards = plan_shards(active_histories(main_db, date), tapped_niks(att_db, date), shard_size)
+        bins = assign_shards(shards, workers)
+
+    log(
+        f"[SHARD] {date} {len(shards)} shard(s) on {len(bins)} worker(s), "
+        f"pegawai per worker: {[sum(s['size'] for s in b) for b in bins]}"
+    )
+
+    with time_block("shard_total", stats):
+        with ThreadPoolExecutor(max_workers=len(bins)) as pool:
+            results = list(pool.map(
+                lambda b: _run_worker(router, date, b, engine, tap_dedupe_seconds),
+                bins,
+            ))
+
+    return [row for rows in results for row in rows]
@@ -0,0 +1,240 @@
+# spill.py
+# =====================================================
+# Memory budget + spill ke disk (--memory-limit)
+# =====================================================
+#
+#   python main.py --from 2026-01-01 --to 2026-12-31 --memory-limit 1024
+#
+# Budget dihitung kira-kira (sys.getsizeof, di-sample) untuk tap di
+# etl.att_map dan row hasil transform yang menunggu load.
+#
+# - Attendance: saat budget terlampaui, tap yang sudah lengkap (query
+#   urut nik, time → spill hanya di batas key baru) dipindah ke file
+#   partisi per NIK (nik_code % SPILL_PARTITIONS). Transform lalu
+#   memuat satu partisi per kali (lihat EtlContext.iter_attendance_partitions).
+# - Row output: RowSpool menulis row ke segmen di disk saat budget
+#   terlampaui; load membaca per segmen (lihat load_rows).
+#
+# Format segmen: pickle per blok, kolom sebagai list (columnar) →
+# key dict tidak diulang per row. File dihapus setelah dipakai.
+
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+
+from utils import log
+
+# partisi NIK attendance yang di-spill
+SPILL_PARTITIONS = 16
+
+# row output minimal per segmen (hindari segmen kecil saat memori
+# sudah terisi attendance)
+MIN_SPILL_ROWS = 1000
+
+# estimasi ukuran row di-update setiap N row
+SAMPLE_EVERY = 256
+
+# =====================================================
+# BUDGET
+# =====================================================
+
+class MemoryBudget:
+    """Penghitung byte (perkiraan) bersama untuk cache + row output"""
+
+    def __init__(self, limit_bytes, spill_dir=None):
+        self.limit = limit_bytes
+        self.spill_dir = spill_dir
+        self.used = 0
+        self.peak = 0
+        self.spilled_bytes = 0
+
+    def add(self, n):
+        self.used += n
+        if self.used > self.peak:
+            self.peak = self.used
+
+    def release(self, n, spilled=False):
+        self.used = max(0, self.used - n)
+        if spilled:
+            self.spilled_bytes += n
+
+    def over(self):
+        return self.used > self.limit
+
+    def mkdtemp(self):
+        return tempfile.mkdtemp(prefix="absensi-spill-", dir=self.spill_dir)
+
+def approx_size(row):
+    """Perkiraan byte satu row dict (dict + nilai, tanpa objek bersama)"""
+    return sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+
+class SizeSampler:
+    """Rata-rata approx_size, dihitung ulang setiap SAMPLE_EVERY row"""
+
+    def __init__(self):
+        self.n = 0
+        self.avg = 0
+
+    def __call__(self, row):
+        if self.n % SAMPLE_EVERY == 0:
+            size = approx_size(row)
+            samples = self.n // SAMPLE_EVERY
+            self.avg = (self.avg * samples + size) // (samples + 1)
+        self.n += 1
+        return self.avg
+
+# =====================================================
+# COLUMNAR SEGMENT
+# =====================================================
+
+def write_segment(f, rows, keys=None):
+    """Tulis satu blok rows (list dict) secara columnar"""
+    columns = list(rows[0].keys())
+    for row in rows:
+        if len(row) != len(columns):
+            columns += [c for c in row if c not in columns]
+
+    pickle.dump({
+        "columns": columns,
+        "data": [[row.get(c) for row in rows] for c in columns],
+        "keys": keys,
+    }, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def read_segments(path):
+    """Yield (keys, rows) per blok dari file segmen"""
+    if not os.path.exists(path):
+        return
+
+    with open(path, "rb") as f:
+        while True:
+            try:
+                block = pickle.load(f)
+            except EOFError:
+                return
+            columns = block["columns"]
+            rows = [dict(zip(columns, values)) for values in zip(*block["data"])]
+            yield block["keys"], rows
+
+# =====================================================
+# ATTENDANCE SPILL
+# =====================================================
+
+class AttendanceSpill:
+    """File partisi tap attendance per NIK code"""
+
+    def __init__(self, budget, partitions=SPILL_PARTITIONS):
+        self.dir = budget.mkdtemp()
+        self.partitions = partitions
+        self.rows = 0
+        self.spills = 0
+
+    def partition(self, nik):
+        return nik % self.partitions
+
+    def _path(self, part):
+        return os.path.join(self.dir, f"att-{part:02d}.bin")
+
+    def write(self, att_map):
+        """Append semua key att_map ke file partisinya"""
+        parts = {}
+        for key, rows in att_map.items():
+            keys, out = parts.setdefault(self.partition(key[0]), ([], []))
+            keys.extend([key] * len(rows))
+            out.extend(rows)
+
+        for part, (keys, rows) in parts.items():
+            with open(self._path(part), "ab") as f:
+                write_segment(f, rows, keys)
+            self.rows += len(rows)
+
+        self.spills += 1
+
+    def read(self, part):
+        """Yield (key, row) partisi, urutan sama dengan saat ditulis"""
+        for keys, rows in read_segments(self._path(part)):
+            yield from zip(keys, rows)
+
+    def close(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+# =====================================================
+# ROW OUTPUT SPOOL
+# =====================================================
+
+class RowSpool:
+    """
+    Pengganti list row output transform: row di-spill ke disk saat
+    budget terlampaui. len() / iterasi / chunks() (per segmen, untuk load)
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.buffer = []
+        self.buffer_bytes = 0
+        self.count = 0
+        self.segments = 0
+        self.path = None
+        self._size = SizeSampler()
+
+    def append(self, row):
+        self.buffer.append(row)
+        self.count += 1
+
+        n = self._size(row)
+        self.buffer_bytes += n
+        self.budget.add(n)
+
+        if self.budget.over() and len(self.buffer) >= MIN_SPILL_ROWS:
+            self.flush()
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def flush(self):
+        """Tulis buffer ke disk sebagai satu segmen"""
+        if not self.buffer:
+            return
+        if self.path is None:
+            self.path = os.path.join(self.budget.mkdtemp(), "rows.bin")
+
+        with open(self.path, "ab") as f:
+            write_segment(f, self.buffer)
+
+        self.budget.release(self.buffer_bytes, spilled=True)
+        self.segments += 1
+        self.buffer = []
+        self.buffer_bytes = 0
+
+    def chunks(self):
+        """Yield list row per segmen (dibaca lazily), lalu buffer"""
+        if self.path is not None:
+            for _, rows in read_segments(self.path):
+                yield rows
+        if self.buffer:
+            yield self.buffer
+
+    def __iter__(self):
+        for rows in self.chunks():
+            yield from rows
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.budget.release(self.buffer_bytes)
+        self.buffer = []
+        self.buffer_bytes = 0
+        if self.path is not None:
+            shutil.rmtree(os.path.dirname(self.path), ignore_errors=True)
+            self.path = None
+
+    def log_summary(self):
+        if self.segments:
+            log(
+                f"[SPILL] rows: {self.count} ({self.segments} segment(s) on disk) | "
+                f"budget peak={self.budget.peak / 2**20:.0f}MB "
+                f"limit={self.budget.limit / 2**20:.0f}MB"
+            )
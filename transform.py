@@ -3,11 +3,12 @@
 # Transform layer: pure in-memory business logic
 # =====================================================
 
-from utils import pick
-import cache
-from utils import (
-    normalize_id,
-)
+from bisect import bisect_right
+
+from utils import pick, time_block, clock_minutes
+from cache import is_device_valid
+from spill import RowSpool
+import progress
 from datetime import datetime, timedelta, time
 
 def classify_taps(rows, batas_in, batas_out):
@@ -71,6 +72,36 @@ def classify_taps(rows, batas_in, batas_out):
     return raw_in, raw_out
 
 
+# batas jarak tap pulang dari jadwal pulang (menit)
+OUT_WINDOW = 6 * 60
+
+def classify_taps_sorted(rows, mins, batas_in, batas_out):
+    """
+    Sama dengan classify_taps, untuk tap yang sudah urut jam.
+    rows : list tap (urut)
+    mins : menit tiap tap, sejajar rows (etl.att_min)
+    IN  = rows[0]
+    OUT = tap terakhir dalam ±OUT_WINDOW dari jam pulang (bisect),
+          fallback tap terakhir
+    """
+    if not rows:
+        return None, None
+
+    raw_out = None
+
+    if batas_out:
+        batas = clock_minutes(batas_out)
+        i = bisect_right(mins, batas + OUT_WINDOW) - 1
+        # menit -1 = tap tanpa jam, tidak pernah valid
+        if i >= 0 and mins[i] >= batas - OUT_WINDOW and mins[i] >= 0:
+            raw_out = rows[i]
+
+    if raw_out is None:
+        raw_out = rows[-1]
+
+    return rows[0], raw_out
+
+
 def build_attributes(
     *,
     has_daily=False,
@@ -383,35 +414,245 @@ def build_anomaly(state):
     return "|".join(flags) if flags else None
 
 
+# =====================================================
+# RULE EVALUATION (REFERENCE)
+# =====================================================
+def eval_rules_reference(
+    *,
+    late_minutes,
+    early_minutes,
+    **state_inputs,
+):
+    """
+    Evaluasi langsung lewat fungsi rule.
+    Return (attribute_in, attribute_out, status_masuk, status_pulang, anomaly_flags)
+    """
+    state = build_state(**state_inputs)
+
+    return (
+        eval_rules(state, late_minutes, early_minutes, "in"),
+        eval_rules(state, late_minutes, early_minutes, "out"),
+        resolve_status_final(
+            state, state_inputs["time_in_final"], state_inputs["valid_device_in"]
+        ),
+        resolve_status_final(
+            state, state_inputs["time_out_final"], state_inputs["valid_device_out"]
+        ),
+        build_anomaly(state),
+    )
+
+
+# =====================================================
+# RULE DECISION TABLE
+# =====================================================
+# State di-encode sebagai bitmask, hasil eval_rules /
+# resolve_status_final / build_anomaly untuk setiap mask
+# dihitung sekali saat import.
+
+S_TAP_IN = 1 << 0
+S_TAP_OUT = 1 << 1
+S_VALID_IN = 1 << 2
+S_VALID_OUT = 1 << 3
+S_ADMIN_IN = 1 << 4
+S_ADMIN_OUT = 1 << 5
+S_DAILY = 1 << 6
+S_ACTIVE = 1 << 7
+S_TIME_IN = 1 << 8      # bool(time_in_final), sama dengan resolve_status_final
+S_TIME_OUT = 1 << 9
+S_SCHEDULE = 1 << 10
+S_LATE = 1 << 11        # late_minutes > 0
+S_EARLY = 1 << 12       # early_minutes > 0
+
+STATE_BITS = 13
+
+def encode_state(
+    *,
+    raw_in,
+    raw_out,
+    valid_device_in,
+    valid_device_out,
+    tap_in,
+    tap_out,
+    daily,
+    pegawai_active,
+    jadwal_masuk,
+    jadwal_pulang,
+    time_in_final,
+    time_out_final,
+    late_minutes,
+    early_minutes,
+):
+    return (
+        (S_TAP_IN if raw_in is not None else 0) |
+        (S_TAP_OUT if raw_out is not None else 0) |
+        (S_VALID_IN if valid_device_in is True else 0) |
+        (S_VALID_OUT if valid_device_out is True else 0) |
+        (S_ADMIN_IN if tap_in is not None else 0) |
+        (S_ADMIN_OUT if tap_out is not None else 0) |
+        (S_DAILY if daily is not None else 0) |
+        (S_ACTIVE if pegawai_active else 0) |
+        (S_TIME_IN if time_in_final else 0) |
+        (S_TIME_OUT if time_out_final else 0) |
+        (S_SCHEDULE if jadwal_masuk or jadwal_pulang else 0) |
+        (S_LATE if late_minutes > 0 else 0) |
+        (S_EARLY if early_minutes > 0 else 0)
+    )
+
+def _valid_from_mask(mask, admin_bit, tap_bit, valid_bit):
+    """
+    valid_device tri-state seperti resolve_device:
+    ADMIN → True, tanpa tap → None, selain itu hasil cek device
+    """
+    if mask & admin_bit:
+        return True
+    if not mask & tap_bit:
+        return None
+    return bool(mask & valid_bit)
+
+def state_from_mask(mask):
+    """Bitmask → state dict (format build_state)"""
+    return {
+        "has_tap_in": bool(mask & S_TAP_IN),
+        "has_tap_out": bool(mask & S_TAP_OUT),
+        "valid_device_in": bool(mask & S_VALID_IN),
+        "valid_device_out": bool(mask & S_VALID_OUT),
+        "admin_in": bool(mask & S_ADMIN_IN),
+        "admin_out": bool(mask & S_ADMIN_OUT),
+        "has_daily": bool(mask & S_DAILY),
+        "pegawai_active": bool(mask & S_ACTIVE),
+        "has_time_in": bool(mask & S_TIME_IN),
+        "has_time_out": bool(mask & S_TIME_OUT),
+        "has_schedule": bool(mask & S_SCHEDULE),
+    }
+
+def _build_rule_table():
+    table = []
+    for mask in range(1 << STATE_BITS):
+        state = state_from_mask(mask)
+        late = 1 if mask & S_LATE else 0
+        early = 1 if mask & S_EARLY else 0
+
+        table.append((
+            eval_rules(state, late, early, "in"),
+            eval_rules(state, late, early, "out"),
+            resolve_status_final(
+                state,
+                bool(mask & S_TIME_IN),
+                _valid_from_mask(mask, S_ADMIN_IN, S_TAP_IN, S_VALID_IN),
+            ),
+            resolve_status_final(
+                state,
+                bool(mask & S_TIME_OUT),
+                _valid_from_mask(mask, S_ADMIN_OUT, S_TAP_OUT, S_VALID_OUT),
+            ),
+            build_anomaly(state),
+        ))
+    return tuple(table)
+
+RULE_TABLE = _build_rule_table()
+
+def eval_rules_table(**inputs):
+    """
+    Sama dengan eval_rules_reference, lewat RULE_TABLE.
+    Return (attribute_in, attribute_out, status_masuk, status_pulang, anomaly_flags)
+    """
+    return RULE_TABLE[encode_state(**inputs)]
+
+def check_rule_tables():
+    """
+    Cek exhaustive: untuk setiap kombinasi input yang mungkin
+    (valid_device mengikuti resolve_device, time termasuk 00:00 falsy)
+    RULE_TABLE harus sama dengan evaluasi fungsi rule.
+    Return list mismatch (kosong = OK).
+    """
+    from itertools import product
+
+    raw = {"time": timedelta(hours=8)}
+    tap = {"hour": "in"}
+    times = (None, timedelta(0), timedelta(hours=8))
+
+    def valid_options(raw_row, tap_row):
+        if tap_row is not None:
+            return (True,)
+        if raw_row is None:
+            return (None,)
+        return (True, False)
+
+    mismatches = []
+    for (
+        raw_in, raw_out, tap_in, tap_out, daily, active,
+        jadwal, time_in, time_out, late, early,
+    ) in product(
+        (None, raw), (None, raw), (None, tap), (None, tap),
+        (None, {"status": "SAKIT"}), (False, True),
+        ((None, None), (timedelta(hours=8), None), (None, timedelta(hours=16))),
+        times, times, (0, 5), (0, 5),
+    ):
+        for valid_in, valid_out in product(
+            valid_options(raw_in, tap_in), valid_options(raw_out, tap_out)
+        ):
+            inputs = dict(
+                raw_in=raw_in,
+                raw_out=raw_out,
+                valid_device_in=valid_in,
+                valid_device_out=valid_out,
+                tap_in=tap_in,
+                tap_out=tap_out,
+                daily=daily,
+                pegawai_active=active,
+                jadwal_masuk=jadwal[0],
+                jadwal_pulang=jadwal[1],
+                time_in_final=time_in,
+                time_out_final=time_out,
+                late_minutes=late,
+                early_minutes=early,
+            )
+            expected = eval_rules_reference(**inputs)
+            actual = eval_rules_table(**inputs)
+            if expected != actual:
+                mismatches.append((inputs, expected, actual))
+
+    return mismatches
+
+
 # =====================================================
 # MAIN TRANSFORM
 # =====================================================
 
-def process_pegawai_fast(nik, date):
+def process_pegawai_fast(etl, nik, date, reference=False):
     """
     Build one absensi_summaries row (NO DB ACCESS)
+    nik: int code (etl.encode_id), di-decode saat build row
+    reference: pakai classify_taps + fungsi rule langsung
+               (jalur lama, untuk --compare / golden)
     Return dict ready for insert
     """
+    rules = eval_rules_reference if reference else eval_rules_table
 
     # =================================================
     # CONTEXT
     # =================================================
-    ctx = cache.get_pegawai_ctx(nik)
+    ctx = etl.get_pegawai_ctx(nik)
     pegawai_active = bool(ctx)
 
-    unit_id = normalize_id(ctx.get("unit_id")) if ctx else None
-    sub_unit_id = normalize_id(ctx.get("sub_unit_id")) if ctx else None
-    hist_lokasi = ctx.get("lokasi_kerja") if ctx else None
+    unit_id = ctx["unit_id"] if ctx else None
+    sub_unit_id = ctx["sub_unit_id"] if ctx else None
+    unit_codes = ctx["unit_codes"] if ctx else ()
+    hist_lokasi = ctx["lokasi_kerja"] if ctx else ()
 
-    lokasi_kerja = cache.build_lokasi_kerja(unit_id, hist_lokasi)
+    allowed_devices, lokasi_kerja = etl.build_lokasi_kerja(unit_codes, hist_lokasi)
 
     # =================================================
     # RAW ATTENDANCE (LIST SEMUA TAP)
     # =================================================
-    rows = cache.get_attendance(nik, date) or []
+    rows = etl.get_attendance(nik, date)
+    mins = etl.get_attendance_minutes(nik, date)
 
     # SAFETY FILTER — cegah tap pegawai lain
-    rows = [r for r in rows if str(r.get("nik")).strip() == str(nik)]
+    if any(r.get("nik") != nik for r in rows):
+        keep = [i for i, r in enumerate(rows) if r.get("nik") == nik]
+        rows = [rows[i] for i in keep]
+        mins = [mins[i] for i in keep]
     
     # # SAFETY FILTER — pastikan hanya tap milik pegawai ini
     # rows = [r for r in rows if str(r.get("nik")).strip() == str(nik)]
@@ -419,9 +660,9 @@ def process_pegawai_fast(nik, date):
     # =================================================
     # ABSENT & TAPPING OVERRIDE
     # =================================================
-    daily = cache.get_absent(nik, date)
-    tap_in = cache.get_tap(nik, date, "in")
-    tap_out = cache.get_tap(nik, date, "out")
+    daily = etl.get_absent(nik, date)
+    tap_in = etl.get_tap(nik, date, "in")
+    tap_out = etl.get_tap(nik, date, "out")
 
     # =================================================
     # NOTES
@@ -435,18 +676,26 @@ def process_pegawai_fast(nik, date):
     # =================================================
     # JADWAL (HARUS SEBELUM CLASSIFY)
     # =================================================
-    jadwal_masuk, jadwal_pulang, penalti_in, penalti_out, sumber_jadwal = cache.resolve_jadwal_from_cache(
+    jadwal_masuk, jadwal_pulang, penalti_in, penalti_out, sumber_jadwal = etl.resolve_jadwal_from_cache(
         nik, date, unit_id, sub_unit_id
     )
 
     # =================================================
     # CLASSIFY TAP BERDASARKAN JADWAL
     # =================================================
-    raw_in, raw_out = classify_taps(
-        att_rows,
-        jadwal_masuk,
-        jadwal_pulang
-    )
+    if reference:
+        raw_in, raw_out = classify_taps(
+            rows,
+            jadwal_masuk,
+            jadwal_pulang
+        )
+    else:
+        raw_in, raw_out = classify_taps_sorted(
+            rows,
+            mins,
+            jadwal_masuk,
+            jadwal_pulang
+        )
 
     # =================================================
     # TIME FINAL (SETELAH CLASSIFY)
@@ -464,49 +713,20 @@ def process_pegawai_fast(nik, date):
         if not raw:
             return None, None, None
 
-        device_id = str(raw.get("device_id")).strip() if raw.get("device_id") else None
+        device_id = raw.get("device_id")
 
-        if device_id is not None and not isinstance(device_id, str):
+        if device_id is not None and not isinstance(device_id, int):
             raise ValueError(
                 f"Invalid device_id type: {type(device_id)} | value={device_id}"
             )
 
-        desc = cache.get_device_desc(unit_id, device_id)
-        valid = cache.is_device_valid(device_id, lokasi_kerja)
-        return desc, valid, device_id
+        desc = etl.get_device_desc(unit_id, device_id)
+        valid = is_device_valid(device_id, allowed_devices)
+        return desc, valid, etl.decode_id(device_id)
 
     device_desc_in, valid_device_in, device_id_in = resolve_device(raw_in, time_in_source)
     device_desc_out, valid_device_out, device_id_out = resolve_device(raw_out, time_out_source)
         
-    state = build_state(
-        raw_in=raw_in,
-        raw_out=raw_out,
-        valid_device_in=valid_device_in,
-        valid_device_out=valid_device_out,
-        tap_in=tap_in,
-        tap_out=tap_out,
-        daily=daily,
-        pegawai_active=pegawai_active,
-        jadwal_masuk=jadwal_masuk,
-        jadwal_pulang=jadwal_pulang,
-        time_in_final=time_in_final,
-        time_out_final=time_out_final,
-    )
-
-
-    # =================================================
-    # STATUS
-    # =================================================
-    status_masuk = resolve_status_final(state, time_in_final, valid_device_in)
-    status_pulang = resolve_status_final(state, time_out_final, valid_device_out)
-
-    status_hari = (
-        daily["status"] if daily else
-        "ALPA" if not pegawai_active else
-        "HADIR" if status_masuk == "HADIR" and status_pulang == "HADIR" else
-        "ALPA"
-    )
-
     # =================================================
     # PENALTI CALCULATION
     # =================================================
@@ -537,11 +757,37 @@ def process_pegawai_fast(nik, date):
         early_minutes = penalti_out
 
     # =================================================
-    # ATTRIBUTES
+    # STATUS, ATTRIBUTES & ANOMALY (RULE ENGINE)
     # =================================================
-    attribute_in = eval_rules(state, late_minutes, early_minutes, "in")
-    attribute_out = eval_rules(state, late_minutes, early_minutes, "out")
+    (
+        attribute_in,
+        attribute_out,
+        status_masuk,
+        status_pulang,
+        anomaly_flags,
+    ) = rules(
+        raw_in=raw_in,
+        raw_out=raw_out,
+        valid_device_in=valid_device_in,
+        valid_device_out=valid_device_out,
+        tap_in=tap_in,
+        tap_out=tap_out,
+        daily=daily,
+        pegawai_active=pegawai_active,
+        jadwal_masuk=jadwal_masuk,
+        jadwal_pulang=jadwal_pulang,
+        time_in_final=time_in_final,
+        time_out_final=time_out_final,
+        late_minutes=late_minutes,
+        early_minutes=early_minutes,
+    )
 
+    status_hari = (
+        daily["status"] if daily else
+        "ALPA" if not pegawai_active else
+        "HADIR" if status_masuk == "HADIR" and status_pulang == "HADIR" else
+        "ALPA"
+    )
 
     # =================================================
     # FINAL NOTE
@@ -557,8 +803,6 @@ def process_pegawai_fast(nik, date):
     filename_in = raw_in.get("filename") if time_in_source == "MESIN" else None
     filename_out = raw_out.get("filename") if time_out_source == "MESIN" else None
 
-    anomaly_flags = build_anomaly(state)
-
     def db_bool(val):
         return 1 if val else 0
 
@@ -566,7 +810,7 @@ def process_pegawai_fast(nik, date):
     # BUILD FINAL ROW
     # =================================================
     return {
-        "nik": nik,
+        "nik": etl.decode_id(nik),
         "date": date,
 
         "time_in": pick(raw_in, "time"),
@@ -617,3 +861,96 @@ def process_pegawai_fast(nik, date):
         "anomaly_flags": anomaly_flags,
 
     }
+
+
+# =====================================================
+# ENGINE REGISTRY
+# =====================================================
+# Naikkan TRANSFORM_VERSION saat logika process_pegawai_fast berubah
+# (di luar RULE_TABLE) → fingerprint semua tanggal dianggap berubah.
+
+TRANSFORM_VERSION = 1
+
+# Engine = fungsi (etl, nik_code, date) → row dict.
+# Dipakai transform_all dan mode --compare.
+
+def process_pegawai_reference(etl, nik, date):
+    """process_pegawai_fast lewat jalur lama (classify_taps + fungsi rule)"""
+    return process_pegawai_fast(etl, nik, date, reference=True)
+
+ENGINES = {
+    "fast": process_pegawai_fast,
+    "reference": process_pegawai_reference,
+}
+
+def get_engine(name):
+    """
+    Resolve engine dari nama terdaftar (ENGINES)
+    atau "module:function" untuk engine eksperimen.
+    """
+    if name in ENGINES:
+        return ENGINES[name]
+
+    if ":" in name:
+        import importlib
+        mod_name, func_name = name.split(":", 1)
+        return getattr(importlib.import_module(mod_name), func_name)
+
+    raise ValueError(
+        f"Unknown transform engine: {name} (known: {', '.join(sorted(ENGINES))})"
+    )
+
+
+# =====================================================
+# TRANSFORM ALL (SEMUA PEGAWAI DI CACHE)
+# =====================================================
+
+def iter_target_niks(etl, unit_id=None, nik=None):
+    """
+    NIK code yang di-transform: etl.pegawai_ctx ∪ etl.att_map,
+    dengan filter unit / nik opsional.
+    """
+    # filter argumen dalam bentuk code (lihat etl.encode_id)
+    unit_code = etl.find_id(unit_id) if unit_id else None
+    nik_code = etl.find_id(nik) if nik else None
+
+    for code in etl.pegawai_ctx.keys() | {
+        k[0] for k in etl.att_map.keys()
+    }:
+        ctx = etl.get_pegawai_ctx(code)
+        if unit_id and (
+            not ctx or unit_code is None or ctx["unit_id"] != unit_code
+        ):
+            continue
+
+        # FILTER NIK ARGUMENT
+        if nik and code != nik_code:
+            continue
+
+        yield code
+
+def transform_all(etl, date, unit_id=None, nik=None, stats=None, engine=None):
+    """
+    Jalankan engine (default process_pegawai_fast) untuk semua
+    NIK target. Return list row siap load
+    (spill.RowSpool jika etl punya budget memori).
+    """
+    process = engine or process_pegawai_fast
+
+    # budget memori → row di-spool ke disk (lihat spill.py)
+    rows = RowSpool(etl.budget) if etl.budget is not None else []
+
+    with time_block("transform_total", stats):
+        if etl.att_spill is None:
+            rows.extend(process(etl, code, date) for code in iter_target_niks(etl, unit_id, nik))
+        else:
+            # tap di-spill per partisi NIK: satu partisi di memori per kali
+            for part in etl.iter_attendance_partitions():
+                rows.extend(
+                    process(etl, code, date)
+                    for code in iter_target_niks(etl, unit_id, nik)
+                    if etl.att_spill.partition(code) == part
+                )
+
+    progress.count("transformed", len(rows))
+    return rows
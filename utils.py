@@ -25,6 +25,10 @@ def log_error(msg: str):
 # TIMING / PROFILING
 # =====================================================
 
+# hook(label, elapsed_ms) dipanggil saat stage mulai (elapsed_ms None)
+# dan selesai, termasuk saat error (lihat progress.py)
+STAGE_HOOKS = []
+
 @contextmanager
 def time_block(label: str, stats: dict | None = None):
     """
@@ -33,8 +37,14 @@ def time_block(label: str, stats: dict | None = None):
             ...
     """
     start = time.perf_counter()
-    yield
-    elapsed = (time.perf_counter() - start) * 1000  # ms
+    for hook in STAGE_HOOKS:
+        hook(label, None)
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000  # ms
+        for hook in STAGE_HOOKS:
+            hook(label, elapsed)
     if stats is not None:
         stats[f"{label}_ms"] = round(elapsed, 2)
     log(f"[TIMER] {label} = {elapsed:.2f} ms")
@@ -54,6 +64,54 @@ def date_range(start, end):
         yield cur
         cur += timedelta(days=1)
 
+def clock_minutes(t):
+    """
+    time / timedelta (MySQL TIME) / "HH:MM[:SS]" → menit sejak 00:00.
+    Detik diabaikan, None jika format tidak dikenal.
+    """
+    # MySQL TIME → timedelta (jalur paling sering)
+    if type(t) is timedelta:
+        return t.seconds // 60
+
+    if t is None:
+        return None
+
+    # datetime.time / datetime
+    if hasattr(t, "hour"):
+        return t.hour * 60 + t.minute
+
+    # timedelta
+    if hasattr(t, "seconds"):
+        sec = t.seconds
+        return (sec // 3600) * 60 + ((sec % 3600) // 60)
+
+    # string "HH:MM:SS"
+    if isinstance(t, str):
+        h, m, *_ = t.split(":")
+        return int(h) * 60 + int(m)
+
+    return None
+
+def clock_seconds(t):
+    """time / timedelta / "HH:MM[:SS]" → detik sejak 00:00 (None jika tidak dikenal)"""
+    if type(t) is timedelta:
+        return t.seconds
+
+    if t is None:
+        return None
+
+    if hasattr(t, "hour"):
+        return t.hour * 3600 + t.minute * 60 + t.second
+
+    if hasattr(t, "seconds"):
+        return t.seconds
+
+    if isinstance(t, str):
+        h, m, *rest = t.split(":")
+        return int(h) * 3600 + int(m) * 60 + (int(float(rest[0])) if rest else 0)
+
+    return None
+
 def hari_str(date):
     """Python weekday → nama hari (db tolerant)"""
     return [